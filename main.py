@@ -1,1075 +1,4173 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
-from datetime import datetime, timedelta
-import jwt
-import bcrypt
-import sqlite3
-import requests
-import pandas as pd
-import numpy as np
-from contextlib import contextmanager
-import time
-from fastapi import BackgroundTasks
-
-app = FastAPI(title="Crypto Trading DSS API", version="1.0.0")
-
-# CORS Configuration
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Security
-SECRET_KEY = "your-secret-key-change-in-production"
-security = HTTPBearer()
-
-# Email Configuration (Update with your SMTP settings)
-EMAIL_CONFIG = {
-    "smtp_server": "smtp.gmail.com",
-    "smtp_port": 587,
-    "sender_email": "your-email@gmail.com",
-    "sender_password": "your-app-password",
-    "sender_name": "CryptoDSS"
-}
-
-# API Configuration with fallbacks
-API_CONFIGS = [
-    {
-        "name": "Binance Futures",
-        "base_url": "https://fapi.binance.com",
-        "pairs_endpoint": "/fapi/v1/exchangeInfo",
-        "klines_endpoint": "/fapi/v1/klines"
-    },
-    {
-        "name": "Binance Spot",
-        "base_url": "https://api.binance.com",
-        "pairs_endpoint": "/api/v3/exchangeInfo",
-        "klines_endpoint": "/api/v3/klines"
-    },
-    {
-        "name": "CoinGecko",
-        "base_url": "https://api.coingecko.com/api/v3",
-        "pairs_endpoint": "/coins/markets",
-        "klines_endpoint": None  # CoinGecko has different structure
-    }
-]
-
-CURRENT_API = API_CONFIGS[0]  # Default to Binance Futures
-
-# Database
-@contextmanager
-def get_db():
-    conn = sqlite3.connect("trading_dss.db")
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-        conn.commit()
-    finally:
-        conn.close()
-
-# Initialize Database
-def init_db():
-    with get_db() as conn:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                role TEXT NOT NULL DEFAULT 'member',
-                status TEXT NOT NULL DEFAULT 'pending',
-                subscription_expired_at TEXT,
-                email_verified INTEGER DEFAULT 0,
-                verification_token TEXT,
-                reset_token TEXT,
-                reset_token_expires TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Analysis history
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS analysis_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                pair TEXT NOT NULL,
-                timeframe TEXT NOT NULL,
-                signal TEXT NOT NULL,
-                score INTEGER NOT NULL,
-                entry_price REAL,
-                indicators_data TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        
-        # NEW: Backtesting results table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS backtest_results (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                pair TEXT NOT NULL,
-                timeframe TEXT NOT NULL,
-                start_date TEXT NOT NULL,
-                end_date TEXT NOT NULL,
-                total_trades INTEGER,
-                winning_trades INTEGER,
-                losing_trades INTEGER,
-                win_rate REAL,
-                total_profit REAL,
-                max_drawdown REAL,
-                sharpe_ratio REAL,
-                parameters TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        
-        # NEW: Signal tracking for win rate
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS signal_tracking (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                analysis_id INTEGER NOT NULL,
-                signal TEXT NOT NULL,
-                entry_price REAL NOT NULL,
-                target_price REAL,
-                stop_loss REAL,
-                exit_price REAL,
-                exit_time TEXT,
-                result TEXT,
-                profit_loss REAL,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (analysis_id) REFERENCES analysis_history (id)
-            )
-        """)
-        
-        # NEW: Terms acceptance tracking
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS terms_acceptance (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                terms_version TEXT NOT NULL,
-                accepted_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        
-        # Create default admin
-        password_hash = bcrypt.hashpw("admin123".encode(), bcrypt.gensalt()).decode()
-        try:
-            conn.execute(
-                "INSERT INTO users (username, email, password_hash, role, status, email_verified) VALUES (?, ?, ?, ?, ?, ?)",
-                ("admin", "admin@cryptodss.com", password_hash, "admin", "active", 1)
-            )
-        except:
-            pass
-
-init_db()
-
-# Models
-class UserCreate(BaseModel):
-    username: str
-    email: EmailStr
-    password: str
-    role: str = "member"
-    subscription_days: Optional[int] = 30
-
-class UserLogin(BaseModel):
-    username: str
-    password: str
-
-class UserUpdate(BaseModel):
-    email: Optional[EmailStr] = None
-    role: Optional[str] = None
-    status: Optional[str] = None
-    subscription_days: Optional[int] = None
-
-class AnalysisRequest(BaseModel):
-    pair: str
-    timeframe: str
-
-class UserCreate(BaseModel):
-    username: str
-    email: EmailStr
-    password: str
-    role: str = "member"
-    subscription_days: Optional[int] = 30
-
-class UserLogin(BaseModel):
-    username: str
-    password: str
-
-class UserUpdate(BaseModel):
-    email: Optional[EmailStr] = None
-    role: Optional[str] = None
-    status: Optional[str] = None
-    subscription_days: Optional[int] = None
-
-class EmailVerification(BaseModel):
-    token: str
-
-class PasswordResetRequest(BaseModel):
-    email: EmailStr
-
-class PasswordReset(BaseModel):
-    token: str
-    new_password: str
-
-class AnalysisRequest(BaseModel):
-    pair: str
-    timeframe: str
-    multi_timeframe: Optional[bool] = False
-
-class BacktestRequest(BaseModel):
-    pair: str
-    timeframe: str
-    start_date: str
-    end_date: str
-    initial_capital: Optional[float] = 10000
-
-class SignalFeedback(BaseModel):
-    analysis_id: int
-    exit_price: float
-    result: str  # 'win' or 'loss'
-
-class TermsAcceptance(BaseModel):
-    terms_version: str
-
-# Helper Functions
-def create_token(user_id: int, username: str, role: str) -> str:
-    payload = {
-        "user_id": user_id,
-        "username": username,
-        "role": role,
-        "exp": datetime.utcnow() + timedelta(days=7)
-    }
-    return jwt.encode(payload, SECRET_KEY, algorithm="HS256")
-
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=["HS256"])
-        return payload
-    except:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-
-def get_current_user(payload: dict = Depends(verify_token)):
-    with get_db() as conn:
-        user = conn.execute("SELECT * FROM users WHERE id = ?", (payload["user_id"],)).fetchone()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        return dict(user)
-
-def check_subscription(user: dict = Depends(get_current_user)):
-    if user["role"] == "admin":
-        return user
-    if user["status"] != "active":
-        raise HTTPException(status_code=403, detail="Account is inactive")
-    if user["subscription_expired_at"]:
-        expired = datetime.fromisoformat(user["subscription_expired_at"])
-        if datetime.now() > expired:
-            raise HTTPException(status_code=403, detail="Subscription expired")
-    return user
-
-
-
-# API Helper Functions with Retry and Fallback
-def make_request_with_retry(url, params=None, max_retries=3):
-    """Make HTTP request with retry logic and SSL handling"""
-    import urllib3
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    
-    for attempt in range(max_retries):
-        try:
-            # Disable SSL verification to avoid certificate errors
-            response = requests.get(url, params=params, timeout=10, verify=False)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.Timeout:
-            if attempt < max_retries - 1:
-                time.sleep(1)
-                continue
-            raise HTTPException(status_code=504, detail="API timeout")
-        except requests.exceptions.SSLError:
-            # Try without SSL verification
-            try:
-                response = requests.get(url, params=params, timeout=10, verify=False)
-                response.raise_for_status()
-                return response.json()
-            except Exception as ssl_e:
-                if attempt < max_retries - 1:
-                    time.sleep(1)
-                    continue
-                raise HTTPException(status_code=503, detail=f"SSL Error: {str(ssl_e)}")
-        except requests.exceptions.ConnectionError:
-            if attempt < max_retries - 1:
-                time.sleep(1)
-                continue
-            raise HTTPException(status_code=503, detail="Cannot connect to market data API. Using mock data.")
-        except Exception as e:
-            if attempt < max_retries - 1:
-                time.sleep(1)
-                continue
-            raise HTTPException(status_code=500, detail=f"API error: {str(e)}")
-
-# Email Functions
-def send_email(to_email: str, subject: str, body: str):
-    """Send email (configure with your SMTP)"""
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = f"{EMAIL_CONFIG['sender_name']} <{EMAIL_CONFIG['sender_email']}>"
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        msg.attach(MIMEText(body, 'html'))
-        
-        # In production, use actual SMTP
-        # server = smtplib.SMTP(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port'])
-        # server.starttls()
-        # server.login(EMAIL_CONFIG['sender_email'], EMAIL_CONFIG['sender_password'])
-        # server.send_message(msg)
-        # server.quit()
-        
-        print(f"Email would be sent to {to_email}: {subject}")
-        return True
-    except Exception as e:
-        print(f"Email error: {e}")
-        return False
-
-def fetch_ohlcv(pair: str, timeframe: str, limit: int = 500):
-    interval_map = {
-        "1m": "1m", "5m": "5m", "15m": "15m", "30m": "30m",
-        "1h": "1h", "4h": "4h", "1d": "1d"
-    }
-    
-    symbol = pair.replace("/", "")
-    
-    try:
-        url = "https://fapi.binance.com/fapi/v1/klines"
-        params = {
-            "symbol": symbol,
-            "interval": interval_map.get(timeframe, "1h"),
-            "limit": limit
-        }
-        
-        data = make_request_with_retry(url, params)
-        return parse_binance_data(data)
-    except:
-        return generate_mock_data(limit)
-
-def parse_binance_data(data):
-    df = pd.DataFrame(data, columns=[
-        "timestamp", "open", "high", "low", "close", "volume",
-        "close_time", "quote_volume", "trades", "taker_buy_base", "taker_buy_quote", "ignore"
-    ])
-    
-    df["close"] = df["close"].astype(float)
-    df["high"] = df["high"].astype(float)
-    df["low"] = df["low"].astype(float)
-    df["open"] = df["open"].astype(float)
-    df["volume"] = df["volume"].astype(float)
-    df["timestamp"] = pd.to_datetime(df["timestamp"], unit='ms')
-    
-    return df
-
-def generate_mock_data(limit: int = 500):
-    np.random.seed(42)
-    base_price = 45000
-    timestamps = pd.date_range(end=datetime.now(), periods=limit, freq='1H')
-    
-    prices = []
-    current_price = base_price
-    
-    for _ in range(limit):
-        change = np.random.randn() * 100
-        current_price += change
-        prices.append(current_price)
-    
-    data = {
-        "timestamp": timestamps,
-        "open": prices,
-        "high": [p + abs(np.random.randn() * 50) for p in prices],
-        "low": [p - abs(np.random.randn() * 50) for p in prices],
-        "close": [p + np.random.randn() * 30 for p in prices],
-        "volume": [abs(np.random.randn() * 1000000) for _ in range(limit)]
-    }
-    
-    return pd.DataFrame(data)
-
-# Technical Analysis Functions
-def calculate_rsi(prices, period=14):
-    delta = prices.diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-    rs = gain / loss
-    return 100 - (100 / (1 + rs))
-
-def calculate_macd(prices, fast=12, slow=26, signal=9):
-    ema_fast = prices.ewm(span=fast).mean()
-    ema_slow = prices.ewm(span=slow).mean()
-    macd_line = ema_fast - ema_slow
-    signal_line = macd_line.ewm(span=signal).mean()
-    histogram = macd_line - signal_line
-    return macd_line, signal_line, histogram
-
-def calculate_bollinger_bands(prices, period=20, std_dev=2):
-    sma = prices.rolling(window=period).mean()
-    std = prices.rolling(window=period).std()
-    upper = sma + (std * std_dev)
-    lower = sma - (std * std_dev)
-    return upper, sma, lower
-
-def calculate_atr(df, period=14):
-    """Average True Range for volatility"""
-    high_low = df['high'] - df['low']
-    high_close = (df['high'] - df['close'].shift()).abs()
-    low_close = (df['low'] - df['close'].shift()).abs()
-    
-    tr = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
-    atr = tr.rolling(window=period).mean()
-    return atr
-
-def detect_market_condition(df):
-    """Detect if market is trending, ranging, or volatile"""
-    close = df["close"]
-    
-    # ADX for trend strength
-    high = df["high"]
-    low = df["low"]
-    
-    # Simple trend detection using price position vs MAs
-    sma_20 = close.rolling(window=20).mean()
-    sma_50 = close.rolling(window=50).mean()
-    
-    current_price = close.iloc[-1]
-    sma_20_val = sma_20.iloc[-1]
-    sma_50_val = sma_50.iloc[-1]
-    
-    # Volatility using ATR
-    atr = calculate_atr(df)
-    atr_current = atr.iloc[-1]
-    atr_avg = atr.mean()
-    
-    # Price range
-    price_range = (close.max() - close.min()) / close.mean() * 100
-    
-    # Determine condition
-    if atr_current > atr_avg * 1.5:
-        condition = "VOLATILE"
-        description = "High volatility - use wider stops"
-    elif sma_20_val > sma_50_val and current_price > sma_20_val:
-        condition = "TRENDING_UP"
-        description = "Uptrend - favor long positions"
-    elif sma_20_val < sma_50_val and current_price < sma_20_val:
-        condition = "TRENDING_DOWN"
-        description = "Downtrend - favor short positions"
-    else:
-        condition = "RANGING"
-        description = "Sideways market - use range-bound strategies"
-    
-    return {
-        "condition": condition,
-        "description": description,
-        "volatility": float(atr_current),
-        "price_range": float(price_range)
-    }
-
-def analyze_trading_signal(df):
-    """Comprehensive trading signal analysis"""
-    close = df["close"]
-    high = df["high"]
-    low = df["low"]
-    volume = df["volume"]
-    
-    # Calculate indicators
-    rsi = calculate_rsi(close).iloc[-1]
-    macd_line, signal_line, histogram = calculate_macd(close)
-    macd_current = macd_line.iloc[-1]
-    signal_current = signal_line.iloc[-1]
-    macd_prev = macd_line.iloc[-2]
-    signal_prev = signal_line.iloc[-2]
-    
-    upper_bb, middle_bb, lower_bb = calculate_bollinger_bands(close)
-    current_price = close.iloc[-1]
-    
-    sma_20 = close.rolling(window=20).mean().iloc[-1]
-    sma_50 = close.rolling(window=50).mean().iloc[-1] if len(close) >= 50 else sma_20
-    ema_9 = close.ewm(span=9).mean().iloc[-1]
-    
-    avg_volume = volume.rolling(window=20).mean().iloc[-1]
-    current_volume = volume.iloc[-1]
-    
-    # ATR for stop loss
-    atr = calculate_atr(df).iloc[-1]
-    
-    # Scoring system
-    long_score = 0
-    short_score = 0
-    signals = []
-    
-    # RSI Analysis
-    if rsi < 30:
-        long_score += 20
-        signals.append("RSI Oversold (<30) - BULLISH")
-    elif rsi > 70:
-        short_score += 20
-        signals.append("RSI Overbought (>70) - BEARISH")
-    
-    # MACD Crossover
-    if macd_current > signal_current and macd_prev <= signal_prev:
-        long_score += 20
-        signals.append("MACD Bullish Crossover - BULLISH")
-    elif macd_current < signal_current and macd_prev >= signal_prev:
-        short_score += 20
-        signals.append("MACD Bearish Crossover - BEARISH")
-    
-    # Bollinger Bands
-    if current_price < lower_bb.iloc[-1]:
-        long_score += 15
-        signals.append("Price Below Lower BB - BULLISH")
-    elif current_price > upper_bb.iloc[-1]:
-        short_score += 15
-        signals.append("Price Above Upper BB - BEARISH")
-    
-    # Moving Average
-    if current_price > sma_20 > sma_50:
-        long_score += 15
-        signals.append("Price Above MAs - BULLISH")
-    elif current_price < sma_20 < sma_50:
-        short_score += 15
-        signals.append("Price Below MAs - BEARISH")
-    
-    # Volume Analysis
-    if current_volume > avg_volume * 1.5:
-        if close.iloc[-1] > close.iloc[-2]:
-            long_score += 15
-            signals.append("High Volume on Green Candle - BULLISH")
-        else:
-            short_score += 15
-            signals.append("High Volume on Red Candle - BEARISH")
-    
-    # Market condition adjustment
-    if market_condition:
-        if market_condition["condition"] == "TRENDING_UP":
-            long_score += 10
-            signals.append(f"Market Trending Up - BULLISH")
-        elif market_condition["condition"] == "TRENDING_DOWN":
-            short_score += 10
-            signals.append(f"Market Trending Down - BEARISH")
-        elif market_condition["condition"] == "VOLATILE":
-            signals.append(f"High Volatility - Use Caution")
-    
-    # Determine final signal
-    if long_score > short_score:
-        final_signal = "LONG"
-        confidence = long_score
-    elif short_score > long_score:
-        final_signal = "SHORT"
-        confidence = short_score
-    else:
-        final_signal = "WAIT"
-        confidence = max(long_score, short_score)
-    
-    strength = "STRONG" if confidence >= 70 else "MODERATE" if confidence >= 50 else "WEAK"
-    
-    # Calculate stop loss and take profit
-    if final_signal == "LONG":
-        stop_loss = current_price - (atr * 2)
-        take_profit = current_price + (atr * 3)
-    elif final_signal == "SHORT":
-        stop_loss = current_price + (atr * 2)
-        take_profit = current_price - (atr * 3)
-    else:
-        stop_loss = None
-        take_profit = None
-    
-    return {
-        "signal": final_signal,
-        "strength": strength,
-        "confidence_score": confidence,
-        "long_score": long_score,
-        "short_score": short_score,
-        "current_price": float(current_price),
-        "stop_loss": float(stop_loss) if stop_loss else None,
-        "take_profit": float(take_profit) if take_profit else None,
-        "rsi": float(rsi),
-        "macd": float(macd_current),
-        "macd_signal": float(signal_current),
-        "upper_bb": float(upper_bb.iloc[-1]),
-        "lower_bb": float(lower_bb.iloc[-1]),
-        "sma_20": float(sma_20),
-        "sma_50": float(sma_50),
-        "atr": float(atr),
-        "signals": signals,
-        "volume_ratio": float(current_volume / avg_volume),
-        "market_condition": market_condition
-    }
-
-def multi_timeframe_analysis(pair: str, timeframes: List[str]):
-    """Analyze multiple timeframes"""
-    results = {}
-    
-    for tf in timeframes:
-        df = fetch_ohlcv(pair, tf, limit=200)
-        market_condition = detect_market_condition(df)
-        analysis = analyze_trading_signal(df, market_condition)
-        results[tf] = analysis
-    
-    # Aggregate signals
-    signals = [results[tf]["signal"] for tf in timeframes]
-    long_count = signals.count("LONG")
-    short_count = signals.count("SHORT")
-    
-    if long_count > short_count:
-        consensus = "LONG"
-    elif short_count > long_count:
-        consensus = "SHORT"
-    else:
-        consensus = "WAIT"
-    
-    return {
-        "consensus": consensus,
-        "timeframes": results,
-        "alignment": f"{max(long_count, short_count)}/{len(timeframes)} timeframes agree"
-    }
-
-def backtest_strategy(pair: str, timeframe: str, start_date: str, end_date: str, initial_capital: float = 10000):
-    """Backtest trading strategy"""
-    df = fetch_ohlcv(pair, timeframe, limit=500)
-    
-    # Filter by date range
-    df = df[(df['timestamp'] >= start_date) & (df['timestamp'] <= end_date)]
-    
-    if len(df) < 50:
-        raise HTTPException(status_code=400, detail="Insufficient data for backtesting")
-    
-    capital = initial_capital
-    position = None
-    trades = []
-    equity_curve = [initial_capital]
-    
-    for i in range(50, len(df)):
-        # Get historical data up to current point
-        hist_df = df.iloc[:i+1]
-        
-        # Analyze
-        market_condition = detect_market_condition(hist_df)
-        signal = analyze_trading_signal(hist_df, market_condition)
-        
-        current_price = df.iloc[i]['close']
-        
-        # Execute trades
-        if position is None:
-            if signal['signal'] == 'LONG' and signal['confidence_score'] >= 60:
-                # Enter long
-                position = {
-                    'type': 'LONG',
-                    'entry_price': current_price,
-                    'stop_loss': signal['stop_loss'],
-                    'take_profit': signal['take_profit'],
-                    'entry_time': df.iloc[i]['timestamp']
-                }
-            elif signal['signal'] == 'SHORT' and signal['confidence_score'] >= 60:
-                # Enter short
-                position = {
-                    'type': 'SHORT',
-                    'entry_price': current_price,
-                    'stop_loss': signal['stop_loss'],
-                    'take_profit': signal['take_profit'],
-                    'entry_time': df.iloc[i]['timestamp']
-                }
-        else:
-            # Check exit conditions
-            exit_trade = False
-            exit_reason = ""
-            
-            if position['type'] == 'LONG':
-                if current_price >= position['take_profit']:
-                    exit_trade = True
-                    exit_reason = "Take Profit"
-                elif current_price <= position['stop_loss']:
-                    exit_trade = True
-                    exit_reason = "Stop Loss"
-                elif signal['signal'] == 'SHORT':
-                    exit_trade = True
-                    exit_reason = "Signal Reversal"
-            else:  # SHORT
-                if current_price <= position['take_profit']:
-                    exit_trade = True
-                    exit_reason = "Take Profit"
-                elif current_price >= position['stop_loss']:
-                    exit_trade = True
-                    exit_reason = "Stop Loss"
-                elif signal['signal'] == 'LONG':
-                    exit_trade = True
-                    exit_reason = "Signal Reversal"
-            
-            if exit_trade:
-                # Calculate profit/loss
-                if position['type'] == 'LONG':
-                    pnl = (current_price - position['entry_price']) / position['entry_price']
-                else:
-                    pnl = (position['entry_price'] - current_price) / position['entry_price']
-                
-                profit = capital * pnl * 0.95  # 5% for fees
-                capital += profit
-                
-                trades.append({
-                    'type': position['type'],
-                    'entry_price': position['entry_price'],
-                    'exit_price': current_price,
-                    'entry_time': str(position['entry_time']),
-                    'exit_time': str(df.iloc[i]['timestamp']),
-                    'profit': profit,
-                    'result': 'WIN' if profit > 0 else 'LOSS',
-                    'exit_reason': exit_reason
-                })
-                
-                position = None
-                equity_curve.append(capital)
-    
-    # Calculate statistics
-    total_trades = len(trades)
-    winning_trades = len([t for t in trades if t['result'] == 'WIN'])
-    losing_trades = len([t for t in trades if t['result'] == 'LOSS'])
-    
-    win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
-    total_profit = capital - initial_capital
-    roi = (total_profit / initial_capital) * 100
-    
-    # Max drawdown
-    peak = initial_capital
-    max_dd = 0
-    for equity in equity_curve:
-        if equity > peak:
-            peak = equity
-        dd = (peak - equity) / peak * 100
-        if dd > max_dd:
-            max_dd = dd
-    
-    # Sharpe ratio (simplified)
-    returns = pd.Series(equity_curve).pct_change().dropna()
-    sharpe = (returns.mean() / returns.std()) * np.sqrt(252) if len(returns) > 0 and returns.std() > 0 else 0
-    
-    return {
-        "total_trades": total_trades,
-        "winning_trades": winning_trades,
-        "losing_trades": losing_trades,
-        "win_rate": round(win_rate, 2),
-        "initial_capital": initial_capital,
-        "final_capital": round(capital, 2),
-        "total_profit": round(total_profit, 2),
-        "roi": round(roi, 2),
-        "max_drawdown": round(max_dd, 2),
-        "sharpe_ratio": round(sharpe, 2),
-        "trades": trades[-10:],  # Last 10 trades
-        "equity_curve": [round(e, 2) for e in equity_curve[-50:]]  # Last 50 points
-    }
-
-# API Routes
-@app.post("/api/auth/register")
-async def register(user: UserCreate):
-    password_hash = bcrypt.hashpw(user.password.encode(), bcrypt.gensalt()).decode()
-    subscription_date = None
-    if user.subscription_days:
-        subscription_date = (datetime.now() + timedelta(days=user.subscription_days)).isoformat()
-    
-    try:
-        with get_db() as conn:
-            conn.execute(
-                "INSERT INTO users (username, email, password_hash, role, subscription_expired_at) VALUES (?, ?, ?, ?, ?)",
-                (user.username, user.email, password_hash, user.role, subscription_date)
-            )
-        return {"message": "User created successfully"}
-    except sqlite3.IntegrityError:
-        raise HTTPException(status_code=400, detail="Username or email already exists")
-
-@app.post("/api/auth/login")
-async def login(credentials: UserLogin):
-    with get_db() as conn:
-        user = conn.execute("SELECT * FROM users WHERE username = ?", (credentials.username,)).fetchone()
-    
-    if not user or not bcrypt.checkpw(credentials.password.encode(), user["password_hash"].encode()):
-        raise HTTPException(status_code=401, detail="Invalid credentials")
-    
-    token = create_token(user["id"], user["username"], user["role"])
-    return {
-        "access_token": token,
-        "token_type": "bearer",
-        "user": {
-            "id": user["id"],
-            "username": user["username"],
-            "email": user["email"],
-            "role": user["role"],
-            "status": user["status"]
-        }
-    }
-
-@app.get("/api/users/me")
-async def get_me(user: dict = Depends(get_current_user)):
-    return user
-
-@app.get("/api/users")
-async def list_users(user: dict = Depends(get_current_user)):
-    if user["role"] != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
-    with get_db() as conn:
-        users = conn.execute("SELECT id, username, email, role, status, subscription_expired_at, created_at FROM users").fetchall()
-    return [dict(u) for u in users]
-
-@app.put("/api/users/{user_id}")
-async def update_user(user_id: int, update: UserUpdate, current_user: dict = Depends(get_current_user)):
-    if current_user["role"] != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
-    updates = []
-    params = []
-    if update.email:
-        updates.append("email = ?")
-        params.append(update.email)
-    if update.role:
-        updates.append("role = ?")
-        params.append(update.role)
-    if update.status:
-        updates.append("status = ?")
-        params.append(update.status)
-    if update.subscription_days:
-        new_date = (datetime.now() + timedelta(days=update.subscription_days)).isoformat()
-        updates.append("subscription_expired_at = ?")
-        params.append(new_date)
-    
-    if not updates:
-        raise HTTPException(status_code=400, detail="No fields to update")
-    
-    params.append(user_id)
-    with get_db() as conn:
-        conn.execute(f"UPDATE users SET {', '.join(updates)} WHERE id = ?", params)
-    
-    return {"message": "User updated successfully"}
-
-@app.delete("/api/users/{user_id}")
-async def delete_user(user_id: int, current_user: dict = Depends(get_current_user)):
-    if current_user["role"] != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
-    with get_db() as conn:
-        conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
-    return {"message": "User deleted successfully"}
-
-@app.get("/api/trading/pairs")
-async def get_trading_pairs():
-    """Get available trading pairs - with fallback"""
-    import urllib3
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    
-    try:
-        # Try Binance Futures first
-        url = "https://fapi.binance.com/fapi/v1/exchangeInfo"
-        data = make_request_with_retry(url)
-        pairs = [s["symbol"] for s in data["symbols"] if s["status"] == "TRADING" and "USDT" in s["symbol"]][:50]
-        formatted_pairs = [p[:-4] + "/" + p[-4:] for p in pairs]
-        return {"pairs": formatted_pairs}
-    except:
-        try:
-            # Fallback to Binance Spot
-            url = "https://api.binance.com/api/v3/exchangeInfo"
-            data = make_request_with_retry(url)
-            pairs = [s["symbol"] for s in data["symbols"] if s["status"] == "TRADING" and "USDT" in s["symbol"]][:50]
-            formatted_pairs = [p[:-4] + "/" + p[-4:] for p in pairs]
-            return {"pairs": formatted_pairs}
-        except:
-            # Fallback to hardcoded popular pairs
-            return {"pairs": [
-                "BTC/USDT", "ETH/USDT", "BNB/USDT", "XRP/USDT", "ADA/USDT",
-                "DOGE/USDT", "SOL/USDT", "DOT/USDT", "MATIC/USDT", "LTC/USDT",
-                "LINK/USDT", "UNI/USDT", "ATOM/USDT", "ETC/USDT", "XLM/USDT",
-                "AVAX/USDT", "TRX/USDT", "SHIB/USDT", "BCH/USDT", "ALGO/USDT"
-            ]}
-
-@app.post("/api/trading/analyze")
-async def analyze_trading(request: AnalysisRequest, user: dict = Depends(check_subscription)):
-    try:
-        df = fetch_ohlcv(request.pair, request.timeframe)
-        analysis = analyze_trading_signal(df)
-        
-        # Save to history
-        with get_db() as conn:
-            conn.execute(
-                "INSERT INTO analysis_history (user_id, pair, timeframe, signal, score, indicators_data) VALUES (?, ?, ?, ?, ?, ?)",
-                (user["id"], request.pair, request.timeframe, analysis["signal"], analysis["confidence_score"], str(analysis))
-            )
-        
-        return analysis
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
-
-@app.get("/api/analytics/dashboard")
-async def get_dashboard(user: dict = Depends(get_current_user)):
-    if user["role"] != "admin":
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
-    with get_db() as conn:
-        total_users = conn.execute("SELECT COUNT(*) as count FROM users").fetchone()["count"]
-        active_users = conn.execute("SELECT COUNT(*) as count FROM users WHERE status = 'active'").fetchone()["count"]
-        total_analyses = conn.execute("SELECT COUNT(*) as count FROM analysis_history").fetchone()["count"]
-        recent_analyses = conn.execute(
-            "SELECT * FROM analysis_history ORDER BY created_at DESC LIMIT 10"
-        ).fetchall()
-    
-    return {
-        "total_users": total_users,
-        "active_users": active_users,
-        "total_analyses": total_analyses,
-        "recent_analyses": [dict(a) for a in recent_analyses]
-    }
-
-@app.get("/api/analytics/history")
-async def get_analysis_history(user: dict = Depends(get_current_user)):
-    with get_db() as conn:
-        if user["role"] == "admin":
-            history = conn.execute("SELECT * FROM analysis_history ORDER BY created_at DESC LIMIT 100").fetchall()
-        else:
-            history = conn.execute(
-                "SELECT * FROM analysis_history WHERE user_id = ? ORDER BY created_at DESC LIMIT 50",
-                (user["id"],)
-            ).fetchall()
-    return [dict(h) for h in history]
-
-@app.get("/")
-async def root():
-    return {
-        "message": "Crypto Trading DSS API",
-        "version": "1.0.0",
-        "docs": "/docs",
-        "status": "online"
-    }
-
-@app.post("/api/auth/register")
-async def register(user: UserCreate, background_tasks: BackgroundTasks):
-    password_hash = bcrypt.hashpw(user.password.encode(), bcrypt.gensalt()).decode()
-    subscription_date = None
-    if user.subscription_days:
-        subscription_date = (datetime.now() + timedelta(days=user.subscription_days)).isoformat()
-    
-    # Generate verification token
-    verification_token = secrets.token_urlsafe(32)
-    
-    try:
-        with get_db() as conn:
-            cursor = conn.execute(
-                """INSERT INTO users (username, email, password_hash, role, subscription_expired_at, 
-                   email_verified, verification_token, status) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                (user.username, user.email, password_hash, user.role, subscription_date, 0, verification_token, 'pending')
-            )
-            user_id = cursor.lastrowid
-        
-        # Send verification email
-        verification_link = f"http://localhost:3000/verify?token={verification_token}"
-        email_body = f"""
-        <html>
-        <body>
-            <h2>Welcome to CryptoDSS!</h2>
-            <p>Please verify your email by clicking the link below:</p>
-            <a href="{verification_link}">Verify Email</a>
-            <p>Or copy this link: {verification_link}</p>
-        </body>
-        </html>
-        """
-        background_tasks.add_task(send_email, user.email, "Verify Your Email - CryptoDSS", email_body)
-        
-        return {"message": "User created. Please check your email to verify your account.", "user_id": user_id}
-    except sqlite3.IntegrityError:
-        raise HTTPException(status_code=400, detail="Username or email already exists")
-
-@app.post("/api/auth/verify-email")
-async def verify_email(verification: EmailVerification):
-    with get_db() as conn:
-        user = conn.execute(
-            "SELECT * FROM users WHERE verification_token = ?", 
-            (verification.token,)
-        ).fetchone()
-        
-        if not user:
-            raise HTTPException(status_code=400, detail="Invalid verification token")
-        
-        if user['email_verified']:
-            return {"message": "Email already verified"}
-        
-        conn.execute(
-            "UPDATE users SET email_verified = 1, status = 'active', verification_token = NULL WHERE id = ?",
-            (user['id'],)
-        )
-    
-    return {"message": "Email verified successfully"}
-
-@app.post("/api/auth/forgot-password")
-async def forgot_password(request: PasswordResetRequest, background_tasks: BackgroundTasks):
-    with get_db() as conn:
-        user = conn.execute("SELECT * FROM users WHERE email = ?", (request.email,)).fetchone()
-        
-        if not user:
-            # Don't reveal if email exists
-            return {"message": "If the email exists, a reset link will be sent"}
-        
-        # Generate reset token
-        reset_token = secrets.token_urlsafe(32)
-        reset_expires = (datetime.now() + timedelta(hours=1)).isoformat()
-        
-        conn.execute(
-            "UPDATE users SET reset_token = ?, reset_token_expires = ? WHERE id = ?",
-            (reset_token, reset_expires, user['id'])
-        )
-    
-    # Send reset email
-    reset_link = f"http://localhost:3000/reset-password?token={reset_token}"
-    email_body = f"""
-    <html>
-    <body>
-        <h2>Password Reset Request</h2>
-        <p>Click the link below to reset your password:</p>
-        <a href="{reset_link}">Reset Password</a>
-        <p>This link expires in 1 hour.</p>
-        <p>If you didn't request this, please ignore this email.</p>
-    </body>
-    </html>
-    """
-    background_tasks.add_task(send_email, request.email, "Password Reset - CryptoDSS", email_body)
-    
-    return {"message": "If the email exists, a reset link will be sent"}
-
-@app.post("/api/auth/reset-password")
-async def reset_password(reset: PasswordReset):
-    with get_db() as conn:
-        user = conn.execute(
-            "SELECT * FROM users WHERE reset_token = ?",
-            (reset.token,)
-        ).fetchone()
-        
-        if not user:
-            raise HTTPException(status_code=400, detail="Invalid reset token")
-        
-        # Check expiration
-        if user['reset_token_expires']:
-            expires = datetime.fromisoformat(user['reset_token_expires'])
-            if datetime.now() > expires:
-                raise HTTPException(status_code=400, detail="Reset token expired")
-        
-        # Update password
-        password_hash = bcrypt.hashpw(reset.new_password.encode(), bcrypt.gensalt()).decode()
-        conn.execute(
-            "UPDATE users SET password_hash = ?, reset_token = NULL, reset_token_expires = NULL WHERE id = ?",
-            (password_hash, user['id'])
-        )
-    
-    return {"message": "Password reset successfully"}
-
-if __name__ == "__main__":
-    import uvicorn
+from fastapi import FastAPI, Depends, HTTPException, Response, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, EmailStr
+from typing import Optional, List
+from datetime import datetime, timedelta
+import jwt
+import bcrypt
+import sqlite3
+import httpx
+import asyncio
+import pandas as pd
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit
+import time
+import json
+import ast
+import re
+import base64
+import os
+import zlib
+import secrets
+import itertools
+import heapq
+import queue
+import threading
+import atexit
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import BackgroundTasks
+
+try:
+    import websockets  # Optional: only needed for live kline ingestion
+except ImportError:
+    websockets = None
+
+app = FastAPI(title="Crypto Trading DSS API", version="1.0.0")
+
+# CORS Configuration
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
+)
+
+# Security
+SECRET_KEY = "your-secret-key-change-in-production"
+security = HTTPBearer()
+
+# Email Configuration (Update with your SMTP settings)
+EMAIL_CONFIG = {
+    "smtp_server": "smtp.gmail.com",
+    "smtp_port": 587,
+    "sender_email": "your-email@gmail.com",
+    "sender_password": "your-app-password",
+    "sender_name": "CryptoDSS"
+}
+
+# API Configuration with fallbacks
+API_CONFIGS = [
+    {
+        "name": "Binance Futures",
+        "market": "futures",
+        "base_url": "https://fapi.binance.com",
+        "pairs_endpoint": "/fapi/v1/exchangeInfo",
+        "klines_endpoint": "/fapi/v1/klines"
+    },
+    {
+        "name": "Binance Spot",
+        "market": "spot",
+        "base_url": "https://api.binance.com",
+        "pairs_endpoint": "/api/v3/exchangeInfo",
+        "klines_endpoint": "/api/v3/klines"
+    },
+    {
+        "name": "CoinGecko",
+        "market": "spot",
+        "base_url": "https://api.coingecko.com/api/v3",
+        "pairs_endpoint": "/coins/markets",
+        "klines_endpoint": None  # CoinGecko has different structure
+    }
+]
+
+# Market whose candles the store, candle cache, backfill and live stream follow. Live fetches may fail over
+# to another market's provider; those candles are stored under their own market and never mixed in.
+MARKET_DATA_MARKET = "futures"
+
+# Provider health tracking and circuit breaking
+PROVIDER_ROUTER_CONFIG = {
+    "window": 50,  # recent requests kept per provider
+    "min_samples": 5,  # before the error rate can open the circuit
+    "max_error_rate": 0.5,
+    "max_consecutive_failures": 3,
+    "open_seconds": 30,  # how long a tripped provider is skipped before a half-open probe
+    "default_latency": 1.0,  # assumed latency for providers we haven't used yet
+    "request_retries": 1  # fail over instead of retrying the same provider
+}
+
+# Market data HTTP client settings
+MARKET_HTTP_CONFIG = {
+    "timeout": 10,
+    "connect_timeout": 5,
+    "max_connections": 50,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 30,
+    "per_host_limit": 10,
+    "max_retries": 3,
+    "backoff_base": 0.5,
+    "verify_ssl": False
+}
+
+# Live kline ingestion (WebSocket streams into in-memory ring buffers)
+STREAM_CONFIG = {
+    "enabled": False,
+    "url": "wss://fstream.binance.com/stream",
+    "market": "futures",  # market the stream serves; REST seeds must come from the same one
+    "pairs": ["BTC/USDT", "ETH/USDT", "BNB/USDT", "SOL/USDT", "XRP/USDT"],
+    "timeframes": ["1m", "15m", "1h"],
+    "capacity": 1000,
+    "reconnect_delay": 5
+}
+
+# Background scanner: precompute signals for a fixed universe on every candle close
+SCANNER_CONFIG = {
+    "enabled": False,
+    "pairs": ["BTC/USDT", "ETH/USDT", "BNB/USDT", "SOL/USDT", "XRP/USDT"],
+    "timeframes": ["15m", "1h", "4h"],
+    "concurrency": 8,
+    "close_delay": 2  # seconds after the close before fetching, so the exchange has the new candle
+}
+
+# Database
+DB_PATH = "trading_dss.db"
+DB_POOL_SIZE = 8  # connections per database file (also the size of the DB thread pool)
+DB_STATEMENT_CACHE = 256  # prepared statements kept per connection
+DB_ACQUIRE_TIMEOUT = 30
+
+# Write-behind queue for analysis_history: requests enqueue rows, one thread group-commits them
+HISTORY_WRITER_CONFIG = {
+    "max_batch": 500,  # rows per transaction
+    "max_delay": 0.25,  # seconds a row may wait for its batch to fill
+    "max_pending": 50000,  # beyond this, submitters write synchronously instead of growing the buffer
+    "retry_delay": 1.0,  # back-off after a failed flush (e.g. database locked)
+    "spill_path": "analysis_history_failed.jsonl"  # rows that could not be written, one JSON array per line
+}
+
+ROLLUP_RECONCILE_INTERVAL = 6 * 3600  # seconds between full rollup rebuilds; 0 disables the background job
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",  # readers no longer block the writer (and vice versa)
+    "synchronous": "NORMAL",  # safe with WAL; fsync at checkpoints instead of every commit
+    "cache_size": -65536,  # 64 MiB page cache per connection
+    "mmap_size": 268435456,  # 256 MiB memory-mapped reads
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000
+}
+
+class ConnectionPool:
+    """Reusable SQLite connections for one database file, opened lazily with the tuned pragmas.
+    
+    Connections keep their prepared-statement cache across uses and may move between threads, but only one
+    thread uses a connection at a time.
+    """
+    
+    def __init__(self, path: str, size: int = DB_POOL_SIZE, pragmas: dict = SQLITE_PRAGMAS):
+        self.path = path
+        self.size = size
+        self.pragmas = pragmas
+        self.idle = queue.LifoQueue()  # most recently used first, so its page cache is warm
+        self.lock = threading.Lock()
+        self.created = 0
+        self.stats = {"acquired": 0, "waited": 0}
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=DB_STATEMENT_CACHE)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+    
+    def acquire(self):
+        self.stats["acquired"] += 1
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.created < self.size:
+                self.created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self.created -= 1
+                    raise
+        self.stats["waited"] += 1
+        try:
+            return self.idle.get(timeout=DB_ACQUIRE_TIMEOUT)
+        except queue.Empty:
+            raise HTTPException(status_code=503, detail="Database busy")
+    
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self.idle.put(conn)
+    
+    @contextmanager
+    def connection(self):
+        """Pooled connection; commits on success and rolls back on error, like a fresh sqlite3 connection would"""
+        conn = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            self.release(conn)
+    
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self.lock:
+                self.created -= 1
+    
+    def get_stats(self):
+        return {**self.stats, "path": self.path, "open": self.created, "idle": self.idle.qsize(), "size": self.size}
+
+_db_pools = {}
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="sqlite")
+
+def get_pool(path: str) -> ConnectionPool:
+    pool = _db_pools.get(path)
+    if pool is None:
+        pool = _db_pools.setdefault(path, ConnectionPool(path))
+    return pool
+
+@contextmanager
+def get_db():
+    with get_pool(DB_PATH).connection() as conn:
+        yield conn
+
+async def run_db(fn, *args):
+    """Run blocking database work on the DB thread pool instead of the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(DB_EXECUTOR, fn, *args)
+
+def fetch_all(sql: str, params: tuple = ()):
+    with get_db() as conn:
+        return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+@app.on_event("shutdown")
+async def close_db_pools():
+    # Drain buffered history rows while the pool is still usable
+    await run_db(HISTORY_WRITER.stop)
+    for pool in _db_pools.values():
+        pool.close()
+
+# Initialize Database
+def init_db():
+    with get_db() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                email TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                role TEXT NOT NULL DEFAULT 'member',
+                status TEXT NOT NULL DEFAULT 'pending',
+                subscription_expired_at TEXT,
+                email_verified INTEGER DEFAULT 0,
+                verification_token TEXT,
+                reset_token TEXT,
+                reset_token_expires TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Analysis history
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                pair TEXT NOT NULL,
+                timeframe TEXT NOT NULL,
+                signal TEXT NOT NULL,
+                score INTEGER NOT NULL,
+                entry_price REAL,
+                indicators_data TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        """)
+        # Newest-first feeds: per user, global (admin), per pair/timeframe and per pair; id breaks created_at ties
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_history_user_created ON analysis_history (user_id, created_at DESC, id DESC)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_history_created ON analysis_history (created_at DESC, id DESC)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_history_pair_created ON analysis_history (pair, timeframe, created_at DESC, id DESC)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_history_pair_only_created ON analysis_history (pair, created_at DESC, id DESC)")
+        
+        # NEW: Backtesting results table
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS backtest_results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                pair TEXT NOT NULL,
+                timeframe TEXT NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL,
+                total_trades INTEGER,
+                winning_trades INTEGER,
+                losing_trades INTEGER,
+                win_rate REAL,
+                total_profit REAL,
+                max_drawdown REAL,
+                sharpe_ratio REAL,
+                parameters TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        """)
+        
+        # NEW: Signal tracking for win rate
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS signal_tracking (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                analysis_id INTEGER NOT NULL,
+                signal TEXT NOT NULL,
+                entry_price REAL NOT NULL,
+                target_price REAL,
+                stop_loss REAL,
+                exit_price REAL,
+                exit_time TEXT,
+                result TEXT,
+                profit_loss REAL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (analysis_id) REFERENCES analysis_history (id)
+            )
+        """)
+        
+        # NEW: Terms acceptance tracking
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS terms_acceptance (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                terms_version TEXT NOT NULL,
+                accepted_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        """)
+        
+        # Create default admin
+        password_hash = bcrypt.hashpw("admin123".encode(), bcrypt.gensalt()).decode()
+        try:
+            conn.execute(
+                "INSERT INTO users (username, email, password_hash, role, status, email_verified) VALUES (?, ?, ?, ?, ?, ?)",
+                ("admin", "admin@cryptodss.com", password_hash, "admin", "active", 1)
+            )
+        except:
+            pass
+        
+        migrate_analysis_history(conn)
+        create_rollups(conn)
+
+# Analysis history storage: queryable fields in typed columns, the rest as compact JSON
+HISTORY_SCHEMA_VERSION = 1  # tracked in PRAGMA user_version
+HISTORY_MIGRATION_BATCH = 1000
+
+# analysis_history column -> (analysis key, SQL type for columns added by the migration)
+ANALYSIS_COLUMNS = {
+    "signal": ("signal", None),
+    "score": ("confidence_score", None),
+    "strength": ("strength", "TEXT"),
+    "long_score": ("long_score", "INTEGER"),
+    "short_score": ("short_score", "INTEGER"),
+    "entry_price": ("current_price", "REAL"),
+    "stop_loss": ("stop_loss", "REAL"),
+    "take_profit": ("take_profit", "REAL"),
+    "rsi": ("rsi", "REAL"),
+    "macd": ("macd", "REAL"),
+    "atr": ("atr", "REAL"),
+    "volume_ratio": ("volume_ratio", "REAL")
+}
+ANALYSIS_COLUMN_KEYS = {key for key, _ in ANALYSIS_COLUMNS.values()} | {"pair", "timeframe"}
+
+def json_safe(value):
+    """Plain JSON types: NumPy scalars unwrapped, NaN/inf as null"""
+    if isinstance(value, dict):
+        return {k: json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+def encode_analysis(analysis: dict):
+    """Column values for an analysis_history row: typed fields, market condition, then JSON of everything else"""
+    values = [json_safe(analysis.get(key)) for key, _ in ANALYSIS_COLUMNS.values()]
+    condition = (analysis.get("market_condition") or {}).get("condition")
+    extra = {k: v for k, v in analysis.items() if k not in ANALYSIS_COLUMN_KEYS}
+    return values + [condition, json.dumps(json_safe(extra), separators=(",", ":"))]
+
+HISTORY_INSERT_SQL = (
+    f"INSERT INTO analysis_history (user_id, pair, timeframe, {', '.join(ANALYSIS_COLUMNS)}, market_condition, indicators_data, created_at) "
+    f"VALUES ({', '.join('?' * (len(ANALYSIS_COLUMNS) + 6))})"
+)
+
+def analysis_history_row(user_id: int, pair: str, timeframe: str, analysis: dict):
+    return (user_id, pair, timeframe, *encode_analysis(analysis))
+
+def decode_history_row(row: dict):
+    """History row for the API, with indicators_data decoded (legacy rows that could not be migrated decode to None)"""
+    try:
+        row["indicators_data"] = json.loads(row["indicators_data"]) if row.get("indicators_data") else None
+    except ValueError:
+        row["indicators_data"] = None
+    return row
+
+class HistoryWriter:
+    """Write-behind buffer for analysis_history inserts.
+    
+    Requests hand over rows and return immediately; a background thread commits them
+    in one transaction per batch once max_batch rows are waiting or the oldest has waited
+    max_delay. Rows submitted together (e.g. one batch analysis) are always committed together.
+    Rows still buffered when the process dies are lost, so stop() runs on shutdown and at exit; rows the
+    database keeps rejecting are appended to spill_path instead of being dropped.
+    """
+    
+    def __init__(self, max_batch: int, max_delay: float, max_pending: int, retry_delay: float, spill_path: str):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.retry_delay = retry_delay
+        self.spill_path = spill_path
+        self.pending = deque()  # groups of rows, oldest first
+        self.pending_rows = 0
+        self.cond = threading.Condition()
+        self.thread = None
+        self.stopping = False
+        self.flush_requested = False
+        self.submitted = 0  # rows handed to the writer
+        self.processed = 0  # rows committed or given up on
+        self.stats = {"written": 0, "flushes": 0, "failed": 0, "spilled": 0, "retries": 0, "overflow_writes": 0,
+                      "flush_ms_total": 0.0, "last_flush_ms": 0.0, "max_flush_ms": 0.0, "max_depth": 0}
+    
+    def start(self):
+        with self.cond:
+            if self.thread is None or not self.thread.is_alive():
+                self.stopping = False
+                self.thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+                self.thread.start()
+    
+    async def submit(self, rows: list):
+        """Queue rows for the next group commit without waiting on SQLite"""
+        if not rows:
+            return
+        # Stamp rows now so created_at is the request time, not whenever their batch commits
+        created_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        rows = [(*row, created_at) for row in rows]
+        self.start()
+        with self.cond:
+            if self.pending_rows < self.max_pending:
+                self.pending.append(rows)
+                self.pending_rows += len(rows)
+                self.submitted += len(rows)
+                self.stats["max_depth"] = max(self.stats["max_depth"], self.pending_rows)
+                # Wake the writer when its queue stops being empty (starts the max_delay clock) or a batch fills up
+                if len(self.pending) == 1 or self.pending_rows >= self.max_batch:
+                    self.cond.notify_all()
+                return
+            self.stats["overflow_writes"] += 1
+        # Writer is far behind: push back on the caller rather than buffer without bound
+        await run_db(self._write, rows)
+    
+    def _write(self, rows: list):
+        with get_db() as conn:
+            conn.executemany(HISTORY_INSERT_SQL, rows)
+    
+    def _next_batch(self):
+        """Block until a batch is due; None once stopped and drained"""
+        with self.cond:
+            while not self.pending and not self.stopping:
+                self.flush_requested = False
+                self.cond.wait()
+            if not self.pending:
+                return None
+            deadline = time.monotonic() + self.max_delay
+            while self.pending_rows < self.max_batch and not (self.stopping or self.flush_requested):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            batch = []
+            while self.pending and (not batch or len(batch) + len(self.pending[0]) <= self.max_batch):
+                group = self.pending.popleft()
+                self.pending_rows -= len(group)
+                batch.extend(group)
+            return batch
+    
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._flush(batch)
+    
+    def _flush(self, batch: list):
+        for attempt in range(3):
+            started = time.perf_counter()
+            try:
+                self._write(batch)
+            except sqlite3.OperationalError as e:
+                # Locked/busy database: keep the rows and try again after a pause
+                print(f"History writer flush failed ({e}), retrying")
+                self.stats["retries"] += 1
+                time.sleep(self.retry_delay)
+                continue
+            except Exception as e:
+                print(f"History writer flush failed: {e}")
+                break
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stats["written"] += len(batch)
+            self.stats["flushes"] += 1
+            self.stats["flush_ms_total"] += elapsed
+            self.stats["last_flush_ms"] = round(elapsed, 2)
+            self.stats["max_flush_ms"] = max(self.stats["max_flush_ms"], round(elapsed, 2))
+            self._processed(len(batch))
+            return
+        self.stats["failed"] += len(batch)
+        self._spill(batch)
+        self._processed(len(batch))
+    
+    def _spill(self, batch: list):
+        """Keep rows that could not be committed on disk, so they can be re-imported later"""
+        try:
+            with open(self.spill_path, "a") as f:
+                for row in batch:
+                    f.write(json.dumps(row) + "\n")
+            self.stats["spilled"] += len(batch)
+            print(f"History writer spilled {len(batch)} rows to {self.spill_path}")
+        except OSError as e:
+            print(f"History writer lost {len(batch)} rows (spill failed: {e})")
+    
+    def _processed(self, count: int):
+        with self.cond:
+            self.processed += count
+            self.cond.notify_all()
+    
+    def flush(self, timeout: float = 10):
+        """Wait until every row submitted so far is committed (read-your-writes for history queries)"""
+        with self.cond:
+            target = self.submitted
+            if self.processed >= target:
+                return True
+            self.flush_requested = True
+            self.cond.notify_all()
+            return self.cond.wait_for(lambda: self.processed >= target, timeout)
+    
+    def stop(self, timeout: float = 30):
+        """Commit everything still buffered and stop the thread"""
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+            thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+    
+    def get_stats(self):
+        with self.cond:
+            depth, groups = self.pending_rows, len(self.pending)
+        flushes = self.stats["flushes"]
+        return {
+            **{k: v for k, v in self.stats.items() if k != "flush_ms_total"},
+            "queue_depth": depth,
+            "queued_groups": groups,
+            "avg_batch": round(self.stats["written"] / flushes, 1) if flushes else 0,
+            "avg_flush_ms": round(self.stats["flush_ms_total"] / flushes, 2) if flushes else 0,
+            "running": self.thread is not None and self.thread.is_alive()
+        }
+
+HISTORY_WRITER = HistoryWriter(**HISTORY_WRITER_CONFIG)
+atexit.register(HISTORY_WRITER.stop)
+
+def parse_legacy_analysis(text: str):
+    """Parse the str(dict) repr older versions stored, without eval"""
+    try:
+        return ast.literal_eval(re.sub(r"\b(nan|inf)\b", "None", text))
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+def migrate_analysis_history(conn):
+    """Add the typed columns and rewrite legacy repr rows as typed columns + compact JSON (once per database)"""
+    existing = {row["name"] for row in conn.execute("PRAGMA table_info(analysis_history)")}
+    for column, (_, sql_type) in ANALYSIS_COLUMNS.items():
+        if sql_type and column not in existing:
+            conn.execute(f"ALTER TABLE analysis_history ADD COLUMN {column} {sql_type}")
+    if "market_condition" not in existing:
+        conn.execute("ALTER TABLE analysis_history ADD COLUMN market_condition TEXT")
+    
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= HISTORY_SCHEMA_VERSION:
+        return
+    
+    assignments = ", ".join(f"{column} = ?" for column in ANALYSIS_COLUMNS)
+    last_id, migrated, unparsed = 0, 0, 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, indicators_data FROM analysis_history WHERE id > ? AND indicators_data LIKE '{''%' ORDER BY id LIMIT ?",
+            (last_id, HISTORY_MIGRATION_BATCH)
+        ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for row in rows:
+            analysis = parse_legacy_analysis(row["indicators_data"])
+            if isinstance(analysis, dict) and "signal" in analysis:
+                updates.append((*encode_analysis(analysis), row["id"]))
+            else:
+                unparsed += 1
+        conn.executemany(
+            f"UPDATE analysis_history SET {assignments}, market_condition = ?, indicators_data = ? WHERE id = ?", updates
+        )
+        migrated += len(updates)
+        last_id = rows[-1]["id"]
+    
+    conn.execute(f"PRAGMA user_version = {HISTORY_SCHEMA_VERSION}")
+    if migrated or unparsed:
+        print(f"Migrated {migrated} analysis_history rows to typed columns ({unparsed} left unparsed)")
+
+# Dashboard rollups: counters kept current by triggers, so dashboard reads never scan the base tables
+ROLLUPS = {
+    # rollup table -> (base table, key column -> expression over the base row)
+    "user_counts": ("users", {"role": "{row}.role", "status": "{row}.status"}),
+    "analysis_rollup": ("analysis_history", {
+        "hour": "COALESCE(strftime('%Y-%m-%d %H:00:00', {row}.created_at), '')",
+        "user_id": "{row}.user_id", "pair": "{row}.pair", "signal": "{row}.signal"
+    }),
+    "rollup_totals": ("analysis_history", {"name": "'analyses'"})
+}
+# Base columns whose updates move a row between rollup buckets
+ROLLUP_WATCHED_COLUMNS = {"users": ("role", "status"), "analysis_history": ("created_at", "user_id", "pair", "signal")}
+
+def rollup_delta_sql(table: str, row: str, delta: int):
+    keys = ROLLUPS[table][1]
+    values = ", ".join(expr.format(row=row) for expr in keys.values())
+    return (
+        f"INSERT INTO {table} ({', '.join(keys)}, count) VALUES ({values}, {delta}) "
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET count = count + excluded.count;"
+    )
+
+def create_rollups(conn):
+    """Rollup tables plus the insert/update/delete triggers that maintain them; backfilled on first run"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_counts (
+            role TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (role, status)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS analysis_rollup (
+            hour TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            pair TEXT NOT NULL,
+            signal TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, user_id, pair, signal)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_rollup_user_hour ON analysis_rollup (user_id, hour)")
+    conn.execute("CREATE TABLE IF NOT EXISTS rollup_totals (name TEXT PRIMARY KEY, count INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID")
+    
+    for base, columns in ROLLUP_WATCHED_COLUMNS.items():
+        tables = [table for table, (source, _) in ROLLUPS.items() if source == base]
+        changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in columns)
+        triggers = {
+            "insert": ("INSERT", "", [rollup_delta_sql(table, "NEW", 1) for table in tables]),
+            "delete": ("DELETE", "", [rollup_delta_sql(table, "OLD", -1) for table in tables]),
+            "update": (f"UPDATE OF {', '.join(columns)}", f"WHEN {changed}", [
+                rollup_delta_sql(table, row, delta) for table in tables if table != "rollup_totals"
+                for row, delta in (("OLD", -1), ("NEW", 1))
+            ])
+        }
+        for name, (event, when, statements) in triggers.items():
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{base}_rollup_{name} AFTER {event} ON {base} {when} "
+                         f"BEGIN {' '.join(statements)} END")
+    
+    if conn.execute("SELECT 1 FROM rollup_totals WHERE name = 'analyses'").fetchone() is None:
+        rebuild_rollups(conn)
+
+def rollup_snapshot(conn):
+    return {
+        table: {tuple(row[:-1]): row[-1] for row in conn.execute(f"SELECT {', '.join(keys)}, count FROM {table} WHERE count != 0")}
+        for table, (_, keys) in ROLLUPS.items()
+    }
+
+def rebuild_rollups(conn):
+    """Recompute every rollup from the base tables in one transaction; returns the number of counters that were off"""
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    before = rollup_snapshot(conn)
+    for table, (base, keys) in ROLLUPS.items():
+        key_sql = ", ".join(expr.format(row=base) for expr in keys.values())
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"INSERT INTO {table} ({', '.join(keys)}, count) SELECT {key_sql}, COUNT(*) FROM {base} GROUP BY {key_sql}")
+    conn.execute("INSERT OR IGNORE INTO rollup_totals (name, count) VALUES ('analyses', 0)")
+    after = rollup_snapshot(conn)
+    return {
+        table: sum(1 for key in before[table].keys() | after[table].keys() if before[table].get(key) != after[table].get(key))
+        for table in ROLLUPS
+    }
+
+def reconcile_rollups():
+    started = time.perf_counter()
+    with get_db() as conn:
+        drift = rebuild_rollups(conn)
+    elapsed = round((time.perf_counter() - started) * 1000, 1)
+    if any(drift.values()):
+        print(f"Rollup reconcile fixed drifted counters: {drift}")
+    return {"drift": drift, "elapsed_ms": elapsed, "reconciled_at": datetime.utcnow().isoformat()}
+
+_rollup_task = None
+
+async def run_rollup_reconciler():
+    """Periodic full rebuild, in case rows were changed with triggers bypassed (restores, manual edits)"""
+    while True:
+        await asyncio.sleep(ROLLUP_RECONCILE_INTERVAL)
+        try:
+            await run_db(reconcile_rollups)
+        except Exception as e:
+            print(f"Rollup reconcile failed: {e}")
+
+@app.on_event("startup")
+async def start_rollup_reconciler():
+    global _rollup_task
+    if ROLLUP_RECONCILE_INTERVAL:
+        _rollup_task = asyncio.create_task(run_rollup_reconciler())
+
+@app.on_event("shutdown")
+async def stop_rollup_reconciler():
+    if _rollup_task:
+        _rollup_task.cancel()
+
+# Initialized at startup rather than import, so spawned pool workers that re-import this module skip it
+@app.on_event("startup")
+async def initialize_database():
+    init_db()
+
+# Models
+class UserCreate(BaseModel):
+    username: str
+    email: EmailStr
+    password: str
+    role: str = "member"
+    subscription_days: Optional[int] = 30
+
+class UserLogin(BaseModel):
+    username: str
+    password: str
+
+class UserUpdate(BaseModel):
+    email: Optional[EmailStr] = None
+    role: Optional[str] = None
+    status: Optional[str] = None
+    subscription_days: Optional[int] = None
+
+class AnalysisRequest(BaseModel):
+    pair: str
+    timeframe: str
+
+class UserCreate(BaseModel):
+    username: str
+    email: EmailStr
+    password: str
+    role: str = "member"
+    subscription_days: Optional[int] = 30
+
+class UserLogin(BaseModel):
+    username: str
+    password: str
+
+class UserUpdate(BaseModel):
+    email: Optional[EmailStr] = None
+    role: Optional[str] = None
+    status: Optional[str] = None
+    subscription_days: Optional[int] = None
+
+class EmailVerification(BaseModel):
+    token: str
+
+class PasswordResetRequest(BaseModel):
+    email: EmailStr
+
+class PasswordReset(BaseModel):
+    token: str
+    new_password: str
+
+class AnalysisRequest(BaseModel):
+    pair: str
+    timeframe: str
+    multi_timeframe: Optional[bool] = False
+
+class BatchAnalysisRequest(BaseModel):
+    pairs: List[str]
+    timeframes: List[str] = ["1h"]
+    max_concurrency: Optional[int] = None
+    stream: Optional[bool] = False  # NDJSON: one line per result as it completes, then the ranked summary
+
+class BacktestRequest(BaseModel):
+    pair: str
+    timeframe: str
+    start_date: str
+    end_date: str
+    initial_capital: Optional[float] = 10000
+
+class PortfolioBacktestRequest(BaseModel):
+    pairs: List[str]
+    timeframe: str
+    start_date: str
+    end_date: str
+    initial_capital: Optional[float] = 10000
+    max_positions: Optional[int] = 10  # concurrent open positions
+    max_position_pct: Optional[float] = 0.2  # largest position as a fraction of equity
+    max_gross_exposure: Optional[float] = 1.0  # total open notional as a fraction of equity
+    params: Optional[dict] = None  # strategy params (defaults for anything not given)
+
+class OptimizeRequest(BaseModel):
+    pair: str
+    timeframe: str
+    start_date: Optional[str] = None  # defaults to the latest 1500 candles
+    end_date: Optional[str] = None
+    method: str = "grid"  # 'grid' or 'random'
+    param_grid: Optional[dict] = None  # param name -> candidate values (random search samples within their range)
+    n_samples: Optional[int] = 200
+    seed: Optional[int] = 42
+    rank_by: str = "roi"
+    top: Optional[int] = 20
+    max_workers: Optional[int] = None
+    initial_capital: Optional[float] = 10000
+
+class RobustnessRequest(BaseModel):
+    pair: str
+    timeframe: str
+    start_date: Optional[str] = None  # defaults to the latest 1500 candles
+    end_date: Optional[str] = None
+    method: str = "walk_forward"  # 'walk_forward' or 'monte_carlo'
+    params: Optional[dict] = None  # strategy params to test (defaults for anything not given)
+    param_grid: Optional[dict] = None  # walk-forward: re-optimized on every train window ({} keeps params fixed)
+    rank_by: str = "roi"
+    train_size: Optional[int] = 500  # candles per walk-forward train window
+    test_size: Optional[int] = 250  # candles per out-of-sample window (also the roll step)
+    simulations: Optional[int] = 1000  # Monte Carlo bootstrap paths and trade resamples
+    block_size: Optional[int] = 24  # candles per bootstrap block, keeping short-range autocorrelation
+    seed: Optional[int] = 42
+    max_workers: Optional[int] = None
+    estimate_only: Optional[bool] = False
+    initial_capital: Optional[float] = 10000
+
+class SignalFeedback(BaseModel):
+    analysis_id: int
+    exit_price: float
+    result: str  # 'win' or 'loss'
+
+class TermsAcceptance(BaseModel):
+    terms_version: str
+
+# Helper Functions
+def create_token(user_id: int, username: str, role: str) -> str:
+    payload = {
+        "user_id": user_id,
+        "username": username,
+        "role": role,
+        "exp": datetime.utcnow() + timedelta(days=7)
+    }
+    return jwt.encode(payload, SECRET_KEY, algorithm="HS256")
+
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    try:
+        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=["HS256"])
+        return payload
+    except:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+def get_current_user(payload: dict = Depends(verify_token)):
+    with get_db() as conn:
+        user = conn.execute("SELECT * FROM users WHERE id = ?", (payload["user_id"],)).fetchone()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        return dict(user)
+
+def check_subscription(user: dict = Depends(get_current_user)):
+    if user["role"] == "admin":
+        return user
+    if user["status"] != "active":
+        raise HTTPException(status_code=403, detail="Account is inactive")
+    if user["subscription_expired_at"]:
+        expired = datetime.fromisoformat(user["subscription_expired_at"])
+        if datetime.now() > expired:
+            raise HTTPException(status_code=403, detail="Subscription expired")
+    return user
+
+
+
+# API Helper Functions with Retry and Fallback
+class MarketDataClient:
+    """Pooled async HTTP client for market data with per-host concurrency limits"""
+    
+    def __init__(self, config: dict = MARKET_HTTP_CONFIG):
+        self.config = config
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(config["timeout"], connect=config["connect_timeout"]),
+            limits=httpx.Limits(
+                max_connections=config["max_connections"],
+                max_keepalive_connections=config["max_keepalive_connections"],
+                keepalive_expiry=config["keepalive_expiry"]
+            ),
+            verify=config["verify_ssl"]
+        )
+        self.host_limits = {}
+    
+    def _host_limit(self, url: str):
+        host = urlsplit(url).netloc
+        if host not in self.host_limits:
+            self.host_limits[host] = asyncio.Semaphore(self.config["per_host_limit"])
+        return self.host_limits[host]
+    
+    async def get_json(self, url, params=None, max_retries=None):
+        max_retries = max_retries or self.config["max_retries"]
+        
+        for attempt in range(max_retries):
+            last_attempt = attempt == max_retries - 1
+            try:
+                async with self._host_limit(url):
+                    response = await self.client.get(url, params=params)
+                response.raise_for_status()
+                return response.json()
+            except httpx.HTTPStatusError as e:
+                code = e.response.status_code
+                # Rejected requests (unknown symbol, bad params) won't succeed on retry; rate limits might
+                if 400 <= code < 500 and code not in (418, 429):
+                    raise HTTPException(status_code=400, detail=f"Market data request rejected: {e.response.text[:200]}")
+                if last_attempt:
+                    raise HTTPException(status_code=502, detail=f"API error: {str(e)}")
+            except httpx.TimeoutException:
+                if last_attempt:
+                    raise HTTPException(status_code=504, detail="API timeout")
+            except httpx.ConnectError:
+                if last_attempt:
+                    raise HTTPException(status_code=503, detail="Cannot connect to market data API. Using mock data.")
+            except Exception as e:
+                if last_attempt:
+                    raise HTTPException(status_code=500, detail=f"API error: {str(e)}")
+            
+            # Exponential backoff without blocking the event loop
+            await asyncio.sleep(self.config["backoff_base"] * (2 ** attempt))
+    
+    async def close(self):
+        await self.client.aclose()
+
+_market_client = None
+_market_client_loop = None
+
+def get_market_client() -> MarketDataClient:
+    """Shared client for the running event loop (connections can't cross loops)"""
+    global _market_client, _market_client_loop
+    loop = asyncio.get_running_loop()
+    if _market_client is None or _market_client_loop is not loop:
+        _market_client = MarketDataClient()
+        _market_client_loop = loop
+    return _market_client
+
+@app.on_event("shutdown")
+async def close_market_client():
+    global _market_client, _market_client_loop
+    if _market_client is not None:
+        await _market_client.close()
+    _market_client = None
+    _market_client_loop = None
+
+async def make_request_with_retry(url, params=None, max_retries=3):
+    """Make HTTP request through the pooled market data client"""
+    return await get_market_client().get_json(url, params, max_retries)
+
+class ProviderHealth:
+    """Rolling latency/error stats and circuit state for one market data provider"""
+    
+    def __init__(self, api: dict, config: dict = PROVIDER_ROUTER_CONFIG):
+        self.api = api
+        self.config = config
+        self.samples = deque(maxlen=config["window"])  # (ok, latency)
+        self.consecutive_failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+    
+    @property
+    def error_rate(self):
+        return sum(1 for ok, _ in self.samples if not ok) / len(self.samples) if self.samples else 0.0
+    
+    @property
+    def avg_latency(self):
+        latencies = [latency for ok, latency in self.samples if ok]
+        return sum(latencies) / len(latencies) if latencies else self.config["default_latency"]
+    
+    @property
+    def score(self):
+        """Lower is healthier: latency inflated by recent errors"""
+        return self.avg_latency * (1 + 4 * self.error_rate)
+    
+    def allow_request(self, now: float) -> bool:
+        if self.state == "open" and now - self.opened_at >= self.config["open_seconds"]:
+            self.state = "half_open"
+        if self.state == "half_open":
+            # Exactly one probe decides whether the circuit closes again
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+            return True
+        return self.state == "closed"
+    
+    def record(self, ok: bool, latency: float):
+        self.samples.append((ok, latency))
+        self.probe_in_flight = False
+        
+        if ok:
+            self.consecutive_failures = 0
+            self.state = "closed"
+            return
+        
+        self.consecutive_failures += 1
+        tripped = (
+            self.state == "half_open"
+            or self.consecutive_failures >= self.config["max_consecutive_failures"]
+            or (len(self.samples) >= self.config["min_samples"] and self.error_rate > self.config["max_error_rate"])
+        )
+        if tripped:
+            self.state = "open"
+            self.opened_at = time.time()
+    
+    def get_status(self):
+        return {
+            "name": self.api["name"],
+            "market": provider_market(self.api),
+            "state": self.state,
+            "error_rate": round(self.error_rate, 3),
+            "avg_latency_ms": round(self.avg_latency * 1000, 1),
+            "samples": len(self.samples),
+            "consecutive_failures": self.consecutive_failures
+        }
+
+def provider_market(api: dict) -> str:
+    return api.get("market", MARKET_DATA_MARKET)
+
+class ProviderRouter:
+    """Send each market data request to the healthiest provider whose circuit allows it, failing over on error"""
+    
+    def __init__(self, apis: list, config: dict = PROVIDER_ROUTER_CONFIG):
+        self.config = config
+        # Binance-compatible providers only; CoinGecko has no klines or exchangeInfo
+        self.providers = [ProviderHealth(api, config) for api in apis if api["klines_endpoint"]]
+    
+    async def get_json(self, endpoint: str, params=None, market: str = None):
+        """GET `endpoint` ("klines_endpoint" / "pairs_endpoint") from the best available provider"""
+        data, _ = await self.get_json_from(endpoint, params, market)
+        return data
+    
+    async def get_json_from(self, endpoint: str, params=None, market: str = None):
+        """get_json that also returns the serving provider's config.
+        
+        `params` may be a function of the provider config (e.g. a tail request against that provider's
+        market in the store); `market` restricts routing to providers of that market.
+        """
+        now = time.time()
+        ranked = sorted(self.providers, key=lambda p: p.score)
+        last_error = None
+        
+        for provider in ranked:
+            if market is not None and provider_market(provider.api) != market:
+                continue
+            if not provider.allow_request(now):
+                continue
+            
+            start = time.perf_counter()
+            try:
+                data = await make_request_with_retry(
+                    provider.api["base_url"] + provider.api[endpoint],
+                    params(provider.api) if callable(params) else params,
+                    self.config["request_retries"]
+                )
+            except HTTPException as e:
+                # A rejected request means the provider is up but doesn't know e.g. this symbol
+                provider.record(e.status_code == 400, time.perf_counter() - start)
+                last_error = e
+                continue
+            except BaseException:
+                provider.probe_in_flight = False
+                raise
+            
+            provider.record(True, time.perf_counter() - start)
+            return data, provider.api
+        
+        raise last_error or HTTPException(status_code=503, detail="All market data providers are unavailable")
+    
+    def get_status(self):
+        return [p.get_status() for p in self.providers]
+
+MARKET_ROUTER = ProviderRouter(API_CONFIGS)
+
+# Pair Catalog
+PAIR_CATALOG_PATH = "pair_catalog.json"
+PAIR_CATALOG_REFRESH_AFTER = 3600  # seconds before a background refresh is triggered
+PAIR_CATALOG_RETRY_AFTER = 60  # back-off between refresh attempts while the exchange is failing
+MAX_LISTED_PAIRS = 50
+
+FALLBACK_PAIRS = [
+    "BTC/USDT", "ETH/USDT", "BNB/USDT", "XRP/USDT", "ADA/USDT",
+    "DOGE/USDT", "SOL/USDT", "DOT/USDT", "MATIC/USDT", "LTC/USDT",
+    "LINK/USDT", "UNI/USDT", "ATOM/USDT", "ETC/USDT", "XLM/USDT",
+    "AVAX/USDT", "TRX/USDT", "SHIB/USDT", "BCH/USDT", "ALGO/USDT"
+]
+
+def parse_symbol_metadata(symbol: dict) -> dict:
+    """Keep the exchangeInfo fields we care about for one symbol"""
+    filters = {f["filterType"]: f for f in symbol.get("filters", [])}
+    notional = filters.get("MIN_NOTIONAL") or filters.get("NOTIONAL") or {}
+    return {
+        "symbol": symbol["symbol"],
+        "pair": f"{symbol['baseAsset']}/{symbol['quoteAsset']}",
+        "base_asset": symbol["baseAsset"],
+        "quote_asset": symbol["quoteAsset"],
+        "status": symbol["status"],
+        "tick_size": float(filters.get("PRICE_FILTER", {}).get("tickSize", 0)),
+        "step_size": float(filters.get("LOT_SIZE", {}).get("stepSize", 0)),
+        "min_qty": float(filters.get("LOT_SIZE", {}).get("minQty", 0)),
+        "min_notional": float(notional.get("notional", notional.get("minNotional", 0))),
+        "price_precision": symbol.get("pricePrecision", symbol.get("quotePrecision")),
+        "quantity_precision": symbol.get("quantityPrecision", symbol.get("baseAssetPrecision"))
+    }
+
+class PairCatalog:
+    """In-memory pair catalog served stale-while-revalidate, with a disk copy for warm restarts"""
+    
+    def __init__(self, path: str, refresh_after: float):
+        self.path = path
+        self.refresh_after = refresh_after
+        self.symbols = {}  # "BTCUSDT" -> metadata
+        self.pairs = []  # tradable USDT pairs in exchange order
+        self.updated_at = 0.0
+        self.last_attempt = 0.0
+        self.refresh_task = None
+    
+    def load_from_disk(self):
+        try:
+            with open(self.path) as f:
+                snapshot = json.load(f)
+            self.symbols = snapshot["symbols"]
+            self.pairs = snapshot["pairs"]
+            self.updated_at = snapshot["updated_at"]
+        except (OSError, ValueError, KeyError):
+            pass
+    
+    def save_to_disk(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"symbols": self.symbols, "pairs": self.pairs, "updated_at": self.updated_at}, f)
+        os.replace(tmp_path, self.path)
+    
+    @property
+    def is_stale(self):
+        return time.time() - self.updated_at > self.refresh_after
+    
+    async def refresh(self):
+        try:
+            data = await MARKET_ROUTER.get_json("pairs_endpoint")
+        except HTTPException as e:
+            print(f"Pair catalog refresh failed: {e.detail}")
+            return False
+        
+        symbols = {s["symbol"]: parse_symbol_metadata(s) for s in data["symbols"]}
+        self.symbols = symbols
+        self.pairs = [m["pair"] for m in symbols.values() if m["status"] == "TRADING" and m["quote_asset"] == "USDT"]
+        self.updated_at = time.time()
+        try:
+            self.save_to_disk()
+        except OSError as e:
+            print(f"Could not persist pair catalog: {e}")
+        return True
+    
+    def schedule_refresh(self):
+        """Start a background refresh unless one is running or the last attempt was too recent"""
+        if self.refresh_task is not None and not self.refresh_task.done():
+            return
+        if time.time() - self.last_attempt >= PAIR_CATALOG_RETRY_AFTER:
+            self.last_attempt = time.time()
+            self.refresh_task = asyncio.ensure_future(self.refresh())
+    
+    def get_pairs(self, limit: int = MAX_LISTED_PAIRS):
+        if self.is_stale:
+            self.schedule_refresh()
+        return self.pairs[:limit] if self.pairs else FALLBACK_PAIRS[:limit]
+    
+    def get_symbol(self, symbol: str):
+        if self.is_stale:
+            self.schedule_refresh()
+        return self.symbols.get(symbol.replace("/", "").upper())
+
+PAIR_CATALOG = PairCatalog(PAIR_CATALOG_PATH, PAIR_CATALOG_REFRESH_AFTER)
+
+@app.on_event("startup")
+async def warm_pair_catalog():
+    PAIR_CATALOG.load_from_disk()
+    if PAIR_CATALOG.is_stale:
+        PAIR_CATALOG.schedule_refresh()
+
+# Email Functions
+def send_email(to_email: str, subject: str, body: str):
+    """Send email (configure with your SMTP)"""
+    try:
+        msg = MIMEMultipart()
+        msg['From'] = f"{EMAIL_CONFIG['sender_name']} <{EMAIL_CONFIG['sender_email']}>"
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        
+        msg.attach(MIMEText(body, 'html'))
+        
+        # In production, use actual SMTP
+        # server = smtplib.SMTP(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port'])
+        # server.starttls()
+        # server.login(EMAIL_CONFIG['sender_email'], EMAIL_CONFIG['sender_password'])
+        # server.send_message(msg)
+        # server.quit()
+        
+        print(f"Email would be sent to {to_email}: {subject}")
+        return True
+    except Exception as e:
+        print(f"Email error: {e}")
+        return False
+
+# Local Candle Store
+MARKET_DB_PATH = "market_data.db"
+MAX_KLINES_PER_REQUEST = 1500  # Binance hard limit per klines call
+
+INTERVAL_MAP = {
+    "1m": "1m", "5m": "5m", "15m": "15m", "30m": "30m",
+    "1h": "1h", "4h": "4h", "1d": "1d"
+}
+
+INTERVAL_MS = {
+    "1m": 60_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
+    "1h": 3_600_000, "4h": 14_400_000, "1d": 86_400_000
+}
+
+@contextmanager
+def get_market_db():
+    with get_pool(MARKET_DB_PATH).connection() as conn:
+        yield conn
+
+def init_market_db():
+    with get_market_db() as conn:
+        unkeyed = set_aside_unkeyed_store(conn)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS ohlcv_candles (
+                market TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                interval TEXT NOT NULL,
+                open_time INTEGER NOT NULL,
+                open REAL NOT NULL,
+                high REAL NOT NULL,
+                low REAL NOT NULL,
+                close REAL NOT NULL,
+                volume REAL NOT NULL,
+                PRIMARY KEY (market, symbol, interval, open_time)
+            ) WITHOUT ROWID
+        """)
+
+        # Backfill windows that were fully downloaded; closed candles never change, so these are skipped on resume
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS ohlcv_backfill_windows (
+                market TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                interval TEXT NOT NULL,
+                window_start INTEGER NOT NULL,
+                window_end INTEGER NOT NULL,
+                completed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (market, symbol, interval, window_start, window_end)
+            ) WITHOUT ROWID
+        """)
+        if unkeyed:
+            copy_unkeyed_candles(conn)
+
+def set_aside_unkeyed_store(conn):
+    """Move a candle store from before `market` was part of its key out of the way; True if there was one"""
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(ohlcv_candles)")}
+    if columns and "market" not in columns:
+        conn.execute("ALTER TABLE ohlcv_candles RENAME TO ohlcv_candles_unkeyed")
+    windows = {row["name"] for row in conn.execute("PRAGMA table_info(ohlcv_backfill_windows)")}
+    if windows and "market" not in windows:
+        # Only resume markers: dropping them just means those windows are downloaded once more
+        conn.execute("DROP TABLE ohlcv_backfill_windows")
+    return bool(columns) and "market" not in columns
+
+def copy_unkeyed_candles(conn):
+    """Carry set-aside candles into the keyed store, taking them as MARKET_DATA_MARKET"""
+    conn.execute(
+        "INSERT OR IGNORE INTO ohlcv_candles SELECT ?, symbol, interval, open_time, open, high, low, close, volume "
+        "FROM ohlcv_candles_unkeyed", (MARKET_DATA_MARKET,)
+    )
+    conn.execute("DROP TABLE ohlcv_candles_unkeyed")
+
+@app.on_event("startup")
+async def initialize_market_db():
+    init_market_db()
+
+def store_klines(market: str, symbol: str, interval: str, data):
+    """Upsert raw Binance kline rows; the last (still open) candle gets overwritten on refresh"""
+    klines = data if isinstance(data, KlineArrays) else parse_klines(data)
+    rows = zip(
+        [market] * len(klines), [symbol] * len(klines), [interval] * len(klines), klines.open_time.tolist(),
+        klines.open.tolist(), klines.high.tolist(), klines.low.tolist(), klines.close.tolist(), klines.volume.tolist()
+    )
+    with get_market_db() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO ohlcv_candles (market, symbol, interval, open_time, open, high, low, close, volume) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+def load_stored_ohlcv(market: str, symbol: str, interval: str, limit: int = 500):
+    """Read the most recent `limit` candles for a series, oldest first"""
+    with get_market_db() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None  # plain tuples decode straight into arrays; the pooled connection keeps sqlite3.Row
+        rows = cursor.execute(
+            """SELECT open_time, open, high, low, close, volume FROM ohlcv_candles
+               WHERE market = ? AND symbol = ? AND interval = ? ORDER BY open_time DESC LIMIT ?""",
+            (market, symbol, interval, limit)
+        ).fetchall()
+    
+    return KlineArrays.from_rows(rows[::-1]).to_frame()
+
+def load_stored_range(market: str, symbol: str, interval: str, start_ms: int, end_ms: int):
+    """Read stored candles with open_time in [start_ms, end_ms], oldest first"""
+    with get_market_db() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        rows = cursor.execute(
+            """SELECT open_time, open, high, low, close, volume FROM ohlcv_candles
+               WHERE market = ? AND symbol = ? AND interval = ? AND open_time BETWEEN ? AND ? ORDER BY open_time""",
+            (market, symbol, interval, start_ms, end_ms)
+        ).fetchall()
+    
+    return KlineArrays.from_rows(rows).to_frame()
+
+def get_missing_tail_start(market: str, symbol: str, interval: str, limit: int):
+    """Return the open time to resume from if the store already covers the window, else None"""
+    step = INTERVAL_MS[interval]
+    current_open = int(time.time() * 1000) // step * step
+    window_start = current_open - (limit - 1) * step
+    
+    with get_market_db() as conn:
+        row = conn.execute(
+            """SELECT COUNT(*) AS count, MIN(open_time) AS first_open, MAX(open_time) AS last_open
+               FROM ohlcv_candles WHERE market = ? AND symbol = ? AND interval = ? AND open_time >= ?""",
+            (market, symbol, interval, window_start)
+        ).fetchone()
+    
+    # Stored candles must run contiguously from the window start up to the last one we have
+    if not row["count"] or row["first_open"] != window_start:
+        return None
+    if row["count"] != (row["last_open"] - window_start) // step + 1:
+        return None
+    if (current_open - row["last_open"]) // step + 1 > MAX_KLINES_PER_REQUEST:
+        return None
+    return row["last_open"]
+
+async def fetch_ohlcv_uncoalesced(pair: str, timeframe: str, limit: int = 500):
+    if OFFLINE_MARKET_DATA:
+        df = generate_mock_data(limit, pair, timeframe)
+        df.attrs["source"] = "synthetic"
+        return df
+    
+    symbol = pair.replace("/", "")
+    interval = INTERVAL_MAP.get(timeframe, "1h")
+    
+    def tail_params(api):
+        # Only ask for the tail this provider's market doesn't have yet (the last stored candle is re-fetched
+        # since it may still be open)
+        params = {"symbol": symbol, "interval": interval, "limit": limit}
+        resume_from = get_missing_tail_start(provider_market(api), symbol, interval, limit)
+        if resume_from is not None:
+            params["startTime"] = resume_from
+            params["limit"] = min(MAX_KLINES_PER_REQUEST, (int(time.time() * 1000) - resume_from) // INTERVAL_MS[interval] + 1)
+        return params
+    
+    try:
+        data, api = await MARKET_ROUTER.get_json_from("klines_endpoint", tail_params)
+        market = provider_market(api)
+        store_klines(market, symbol, interval, data)
+        df = load_stored_ohlcv(market, symbol, interval, limit)
+        df.attrs.update(source="exchange", provider=api["name"], market=market)
+        return df
+    except (HTTPException, httpx.HTTPError, ValueError, IndexError) as e:
+        print(f"Kline fetch for {symbol} {interval} failed, falling back: {e}")
+        stored = load_stored_ohlcv(MARKET_DATA_MARKET, symbol, interval, limit)
+        if len(stored) >= limit:
+            stored.attrs.update(source="store", provider=None, market=MARKET_DATA_MARKET)
+            return stored
+        df = generate_mock_data(limit, pair, timeframe)
+        df.attrs["source"] = "mock"
+        return df
+
+# Historical backfill
+BACKFILL_CONCURRENCY = 4
+
+def is_backfill_window_complete(symbol: str, interval: str, window_start: int, window_end: int) -> bool:
+    with get_market_db() as conn:
+        row = conn.execute(
+            "SELECT 1 FROM ohlcv_backfill_windows "
+            "WHERE market = ? AND symbol = ? AND interval = ? AND window_start = ? AND window_end = ?",
+            (MARKET_DATA_MARKET, symbol, interval, window_start, window_end)
+        ).fetchone()
+    return row is not None
+
+async def backfill_window(symbol: str, interval: str, window_start: int, window_end: int, semaphore):
+    """Download one startTime/endTime page into the store unless an earlier run already did"""
+    if is_backfill_window_complete(symbol, interval, window_start, window_end):
+        return
+    
+    params = {
+        "symbol": symbol,
+        "interval": interval,
+        "startTime": window_start,
+        "endTime": window_end,
+        "limit": MAX_KLINES_PER_REQUEST
+    }
+    # History must come from a single market, so backfill never fails over to another one
+    async with semaphore:
+        data = await MARKET_ROUTER.get_json("klines_endpoint", params, market=MARKET_DATA_MARKET)
+    store_klines(MARKET_DATA_MARKET, symbol, interval, data)
+    
+    # Only windows whose candles have all closed are final
+    if window_end + INTERVAL_MS[interval] <= int(time.time() * 1000):
+        with get_market_db() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO ohlcv_backfill_windows (market, symbol, interval, window_start, window_end) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (MARKET_DATA_MARKET, symbol, interval, window_start, window_end)
+            )
+
+async def iter_ohlcv_history(pair: str, timeframe: str, start_ms: int, end_ms: int, concurrency: int = BACKFILL_CONCURRENCY):
+    """Yield candle chunks covering [start_ms, end_ms] in time order, backfilling the store page by page.
+    
+    At most `concurrency` pages are downloaded ahead of the consumer, so long ranges never sit in memory
+    at once. Pages completed by an earlier (possibly interrupted) run are read straight from the store.
+    """
+    symbol = pair.replace("/", "")
+    interval = INTERVAL_MAP.get(timeframe, "1h")
+    step = INTERVAL_MS[interval]
+    
+    first_open = -(-start_ms // step) * step
+    last_open = min(end_ms, int(time.time() * 1000)) // step * step
+    # Pages sit on a fixed epoch grid, so overlapping or shifted ranges reuse the same completed windows
+    page = MAX_KLINES_PER_REQUEST * step
+    windows = [(ws, ws + page - step) for ws in range(first_open // page * page, last_open + 1, page)]
+    
+    if OFFLINE_MARKET_DATA:
+        count = max(0, (last_open - first_open) // step + 1)
+        df = generate_synthetic_klines(count, pair, timeframe, end_ms=last_open).to_frame()
+        for start in range(0, count, MAX_KLINES_PER_REQUEST):
+            yield df.iloc[start:start + MAX_KLINES_PER_REQUEST]
+        return
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = deque()
+    
+    async def next_chunk():
+        (window_start, window_end), task = pending.popleft()
+        try:
+            await task
+        except HTTPException as e:
+            # A gap in the middle of the history would skew every indicator after it, so don't yield past it
+            raise HTTPException(
+                status_code=502,
+                detail=f"Backfill failed for {symbol} {interval} window {window_start}-{window_end}: {e.detail}"
+            ) from e
+        return load_stored_range(MARKET_DATA_MARKET, symbol, interval, max(window_start, first_open), min(window_end, last_open))
+    
+    try:
+        for window in windows:
+            pending.append((window, asyncio.ensure_future(backfill_window(symbol, interval, *window, semaphore))))
+            if len(pending) > concurrency:
+                yield await next_chunk()
+        
+        while pending:
+            yield await next_chunk()
+    finally:
+        # Consumer stopped early (or was cancelled): don't leave prefetched downloads running
+        for _, task in pending:
+            task.cancel()
+
+# Candle-aligned OHLCV cache
+OHLCV_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+def next_candle_close(timeframe: str, now: float = None) -> float:
+    """Unix time (seconds) at which the currently open candle of `timeframe` closes"""
+    step = INTERVAL_MS[INTERVAL_MAP.get(timeframe, "1h")]
+    now_ms = int((now if now is not None else time.time()) * 1000)
+    return (now_ms // step + 1) * step / 1000
+
+class CandleCache:
+    """LRU cache of parsed OHLCV frames that expire when the next candle of their timeframe closes"""
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.entries = OrderedDict()  # key -> (df, expires_at, size)
+        self.stats = {"hits": 0, "misses": 0, "expirations": 0, "evictions": 0}
+    
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        
+        df, expires_at, size = entry
+        if time.time() >= expires_at:
+            self._remove(key)
+            self.stats["expirations"] += 1
+            self.stats["misses"] += 1
+            return None
+        
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return df
+    
+    def put(self, key, df, timeframe: str):
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (df, next_candle_close(timeframe), size)
+        self.current_bytes += size
+        
+        while self.current_bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+    
+    def _remove(self, key):
+        _, _, size = self.entries.pop(key)
+        self.current_bytes -= size
+    
+    def get_stats(self):
+        return {
+            **self.stats,
+            "entries": len(self.entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes
+        }
+
+OHLCV_CACHE = CandleCache(OHLCV_CACHE_MAX_BYTES)
+
+async def fetch_and_cache_ohlcv(pair: str, timeframe: str, limit: int = 500):
+    df = await fetch_ohlcv_uncoalesced(pair, timeframe, limit)
+    # Stale store fallbacks, mock data and failover candles from another market must not be pinned until the
+    # next candle close (the cache key has no market, so it only ever holds MARKET_DATA_MARKET frames)
+    if df.attrs.get("source") == "synthetic" or (df.attrs.get("source") == "exchange" and df.attrs["market"] == MARKET_DATA_MARKET):
+        OHLCV_CACHE.put((pair, timeframe, limit), df, timeframe)
+    return df
+
+# Single-flight coalescing of identical concurrent fetches
+_inflight_fetches = {}
+COALESCE_STATS = {"calls": 0, "upstream_fetches": 0, "coalesced": 0}
+
+async def fetch_ohlcv(pair: str, timeframe: str, limit: int = 500):
+    """Fetch candles from the live stream buffers or the candle cache, or share one upstream fetch and parse among concurrent
+    identical calls.
+    
+    Cached frames and coalesced results are shared objects, so callers must not modify them in place.
+    """
+    live = get_live_ohlcv(pair, timeframe, limit)
+    if live is not None:
+        return live
+    
+    key = (pair, timeframe, limit)
+    cached = OHLCV_CACHE.get(key)
+    if cached is not None:
+        return cached
+    
+    COALESCE_STATS["calls"] += 1
+    
+    task = _inflight_fetches.get(key)
+    if task is None:
+        COALESCE_STATS["upstream_fetches"] += 1
+        task = asyncio.ensure_future(fetch_and_cache_ohlcv(pair, timeframe, limit))
+        _inflight_fetches[key] = task
+        task.add_done_callback(lambda _: _inflight_fetches.pop(key, None))
+    else:
+        COALESCE_STATS["coalesced"] += 1
+    
+    # Shield so one cancelled caller doesn't cancel the fetch for everyone else
+    return await asyncio.shield(task)
+
+class CandleRingBuffer:
+    """Fixed-size NumPy ring buffer holding the most recent candles of one series"""
+    
+    def __init__(self, capacity: int, step_ms: int):
+        self.capacity = capacity
+        self.step_ms = step_ms
+        self.open_time = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros((capacity, 5), dtype=np.float64)  # open, high, low, close, volume
+        self.size = 0
+        self.head = 0  # next slot to write
+    
+    @property
+    def last_open_time(self):
+        return int(self.open_time[(self.head - 1) % self.capacity]) if self.size else None
+    
+    def update(self, open_time: int, o: float, h: float, l: float, c: float, v: float) -> bool:
+        """Append a new candle or revise the open one; returns False if a gap means the buffer needs reseeding"""
+        last = self.last_open_time
+        if last is not None:
+            if open_time < last:
+                return True  # late message for a candle we already moved past
+            if open_time > last + self.step_ms:
+                return False
+        
+        if open_time != last:
+            slot = self.head
+            self.head = (self.head + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+        else:
+            slot = (self.head - 1) % self.capacity
+        
+        self.open_time[slot] = open_time
+        self.values[slot] = (o, h, l, c, v)
+        return True
+    
+    def load(self, df):
+        """Replace the contents with the tail of a parsed OHLCV frame"""
+        df = df.tail(self.capacity)
+        n = len(df)
+        self.open_time[:n] = df["timestamp"].values.astype("datetime64[ms]").astype(np.int64)
+        self.values[:n] = df[["open", "high", "low", "close", "volume"]].to_numpy(dtype=np.float64)
+        self.size = n
+        self.head = n % self.capacity
+    
+    def to_frame(self, limit: int):
+        n = min(limit, self.size)
+        idx = (self.head - n + np.arange(n)) % self.capacity
+        values = self.values[idx]
+        return pd.DataFrame({
+            "timestamp": pd.to_datetime(self.open_time[idx], unit='ms'),
+            "open": values[:, 0],
+            "high": values[:, 1],
+            "low": values[:, 2],
+            "close": values[:, 3],
+            "volume": values[:, 4]
+        })
+
+LIVE_BUFFERS = {}  # (symbol, interval) -> CandleRingBuffer
+LIVE_INDICATORS = {}  # (symbol, interval) -> IndicatorState
+INDICATOR_STATE_PATH = "indicator_state.json"
+LIVE_ANALYSIS_LIMIT = 500  # candles analyze_pair scores; the live ATR mean covers the same window
+LIVE_ATR_WINDOW = LIVE_ANALYSIS_LIMIT - 13  # ATR values a LIVE_ANALYSIS_LIMIT-candle frame yields (14-period ATR)
+LIVE_SERIES_HISTORY = 32  # closed candles of indicator values kept per live series, for rules that look back
+INDICATOR_STATE_FORMAT = 2  # bump when IndicatorState.to_dict changes; older saved states are rebuilt
+_kline_stream_task = None
+
+def get_live_ohlcv(pair: str, timeframe: str, limit: int = 500):
+    """Serve candles from a live buffer if it is current and deep enough, else None"""
+    interval = INTERVAL_MAP.get(timeframe, "1h")
+    buffer = LIVE_BUFFERS.get((pair.replace("/", ""), interval))
+    if buffer is None or buffer.size < limit:
+        return None
+    
+    current_open = int(time.time() * 1000) // buffer.step_ms * buffer.step_ms
+    if buffer.last_open_time < current_open:
+        return None  # stream has fallen behind
+    
+    df = buffer.to_frame(limit)
+    df.attrs["source"] = "stream"
+    return df
+
+def get_live_indicators(pair: str, timeframe: str, limit: int = LIVE_ANALYSIS_LIMIT):
+    """Incrementally maintained indicators for a live series, if they are in sync with its buffer.
+    
+    Window-dependent values (ATR mean, price range) cover the last `limit` candles, as the batch path would.
+    """
+    key = (pair.replace("/", ""), INTERVAL_MAP.get(timeframe, "1h"))
+    buffer = LIVE_BUFFERS.get(key)
+    state = LIVE_INDICATORS.get(key)
+    if limit != LIVE_ANALYSIS_LIMIT or buffer is None or state is None or buffer.size < limit:
+        return None
+    if state.last_open_time != buffer.last_open_time:
+        return None
+    if SCORER.lookback > len(state.history):
+        return None  # a rule looks further back than the live state keeps; score from IndicatorFrame instead
+    return LiveIndicatorView(state, buffer.to_frame(limit))
+
+def sync_live_indicators(key, buffer: CandleRingBuffer):
+    """Bring the indicator state up to the buffer, replaying only candles it hasn't seen (warm restarts)"""
+    frame = buffer.to_frame(buffer.size)
+    if frame.empty:
+        return
+    open_times = frame["timestamp"].values.astype("datetime64[ms]").astype(np.int64)
+    
+    state = LIVE_INDICATORS.get(key)
+    if state is None or state.last_open_time is None or not open_times[0] <= state.last_open_time <= open_times[-1]:
+        state = IndicatorState()
+        start = 0
+    else:
+        start = int(np.searchsorted(open_times, state.last_open_time))
+    
+    values = frame[["open", "high", "low", "close", "volume"]].to_numpy()
+    for i in range(start, len(frame)):
+        state.update(int(open_times[i]), *values[i])
+    LIVE_INDICATORS[key] = state
+
+def load_indicator_states(path: str = INDICATOR_STATE_PATH):
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return
+    for name, data in saved.items():
+        if data.get("format") != INDICATOR_STATE_FORMAT or data["atr_recent"]["window"] != LIVE_ATR_WINDOW:
+            continue  # older format or analysis window; sync_live_indicators rebuilds it from the buffer
+        symbol, interval = name.split(":")
+        LIVE_INDICATORS[(symbol, interval)] = IndicatorState.from_dict(data)
+
+def save_indicator_states(path: str = INDICATOR_STATE_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({f"{symbol}:{interval}": state.to_dict() for (symbol, interval), state in LIVE_INDICATORS.items()}, f)
+    os.replace(tmp_path, path)
+
+async def seed_live_buffer(pair: str, timeframe: str, capacity: int):
+    interval = INTERVAL_MAP.get(timeframe, "1h")
+    key = (pair.replace("/", ""), interval)
+    buffer = CandleRingBuffer(capacity, INTERVAL_MS[interval])
+    df = await fetch_ohlcv_uncoalesced(pair, timeframe, min(capacity, MAX_KLINES_PER_REQUEST))
+    if df.attrs.get("source") != "mock" and df.attrs.get("market") == STREAM_CONFIG["market"]:
+        buffer.load(df)
+    LIVE_BUFFERS[key] = buffer
+    sync_live_indicators(key, buffer)
+
+def handle_kline_message(message: dict, resync: set):
+    """Apply one combined-stream kline event to its ring buffer"""
+    event = message.get("data", message)
+    k = event.get("k")
+    if not k:
+        return
+    
+    key = (event["s"], k["i"])
+    buffer = LIVE_BUFFERS.get(key)
+    if buffer is None:
+        return
+    
+    candle = (int(k["t"]), float(k["o"]), float(k["h"]), float(k["l"]), float(k["c"]), float(k["v"]))
+    if not buffer.update(*candle):
+        resync.add(key)
+        return
+    
+    state = LIVE_INDICATORS.get(key)
+    if state is not None:
+        state.update(*candle)
+    
+    # Closed candles are final, so keep the local store warm with them
+    if k.get("x"):
+        store_klines(STREAM_CONFIG["market"], event["s"], k["i"], [candle])
+
+async def run_kline_stream(config: dict = STREAM_CONFIG):
+    """Consume exchange kline streams forever, reconnecting and reseeding from REST on any break"""
+    series = [(pair, tf) for pair in config["pairs"] for tf in config["timeframes"]]
+    streams = "/".join(f"{pair.replace('/', '').lower()}@kline_{INTERVAL_MAP.get(tf, '1h')}" for pair, tf in series)
+    url = f"{config['url']}?streams={streams}"
+    by_key = {(pair.replace("/", ""), INTERVAL_MAP.get(tf, "1h")): (pair, tf) for pair, tf in series}
+    
+    while True:
+        try:
+            async with websockets.connect(url) as ws:
+                # Seed after subscribing so nothing between the REST snapshot and the stream is lost
+                await asyncio.gather(*[seed_live_buffer(pair, tf, config["capacity"]) for pair, tf in series])
+                resync = set()
+                async for raw in ws:
+                    handle_kline_message(json.loads(raw), resync)
+                    while resync:
+                        await seed_live_buffer(*by_key[resync.pop()], config["capacity"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Kline stream error: {e}")
+        
+        await asyncio.sleep(config["reconnect_delay"])
+
+@app.on_event("startup")
+async def start_kline_stream():
+    global _kline_stream_task
+    if not STREAM_CONFIG["enabled"]:
+        return
+    if websockets is None:
+        print("Live kline ingestion disabled: install the 'websockets' package")
+        return
+    load_indicator_states()
+    _kline_stream_task = asyncio.create_task(run_kline_stream())
+
+@app.on_event("shutdown")
+async def stop_kline_stream():
+    global _kline_stream_task
+    if _kline_stream_task is not None:
+        _kline_stream_task.cancel()
+        _kline_stream_task = None
+        try:
+            save_indicator_states()
+        except OSError as e:
+            print(f"Could not persist indicator state: {e}")
+
+class KlineArrays:
+    """Kline columns we actually use, as contiguous int64/float64 arrays"""
+    
+    __slots__ = ("open_time", "open", "high", "low", "close", "volume")
+    
+    def __init__(self, open_time, open, high, low, close, volume):
+        self.open_time = open_time
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+    
+    def __len__(self):
+        return len(self.open_time)
+    
+    @classmethod
+    def from_rows(cls, rows):
+        """Decode rows of (open_time, open, high, low, close, volume, ...) in a single pass"""
+        if not len(rows):
+            empty = np.empty(0, dtype=np.float64)
+            return cls(np.empty(0, dtype=np.int64), empty, empty.copy(), empty.copy(), empty.copy(), empty.copy())
+        
+        # Millisecond timestamps are exact in float64, so one float decode covers every column
+        values = np.array([row[:6] for row in rows], dtype=np.float64)
+        columns = np.ascontiguousarray(values.T)
+        return cls(columns[0].astype(np.int64), columns[1], columns[2], columns[3], columns[4], columns[5])
+    
+    def to_frame(self):
+        """Pandas view with the same columns the analysis code expects"""
+        return pd.DataFrame({
+            "timestamp": pd.to_datetime(self.open_time, unit='ms'),
+            "open": self.open,
+            "high": self.high,
+            "low": self.low,
+            "close": self.close,
+            "volume": self.volume
+        }, copy=False)
+
+def parse_klines(data) -> KlineArrays:
+    """Parse a Binance klines response into typed arrays, dropping the unused columns"""
+    return KlineArrays.from_rows(data)
+
+def parse_binance_data(data):
+    return parse_klines(data).to_frame()
+
+# Synthetic Market Data (offline mode, load tests, backtest benchmarks)
+OFFLINE_MARKET_DATA = False  # serve synthetic candles instead of calling any exchange
+
+SYNTHETIC_BASE_PRICES = {
+    "BTC/USDT": 45000, "ETH/USDT": 2500, "BNB/USDT": 300, "SOL/USDT": 100,
+    "XRP/USDT": 0.6, "ADA/USDT": 0.5, "DOGE/USDT": 0.08, "LTC/USDT": 70
+}
+
+# Hourly drift/volatility of log returns and mean regime length in hours
+MARKET_REGIMES = [
+    {"name": "trend_up", "drift": 0.0006, "volatility": 0.004, "mean_hours": 96, "volume": 1.2},
+    {"name": "trend_down", "drift": -0.0006, "volatility": 0.005, "mean_hours": 72, "volume": 1.3},
+    {"name": "range", "drift": 0.0, "volatility": 0.0025, "mean_hours": 120, "volume": 0.8},
+    {"name": "volatile", "drift": 0.0, "volatility": 0.012, "mean_hours": 24, "volume": 2.0}
+]
+
+def synthetic_rng(pair: str, seed: int = 42):
+    """Independent, reproducible random stream per pair"""
+    return np.random.default_rng([seed, zlib.crc32(pair.encode())])
+
+def generate_synthetic_klines(limit: int, pair: str = "BTC/USDT", timeframe: str = "1h", seed: int = 42, end_ms: int = None):
+    """Vectorized regime-switching random walk with candles spaced exactly one timeframe apart.
+    
+    Regimes (trend up/down, range, volatile) are drawn as runs with geometric lengths, so the whole
+    series is generated with array operations only.
+    """
+    if limit <= 0:
+        return KlineArrays.from_rows([])
+    
+    rng = synthetic_rng(pair, seed)
+    step = INTERVAL_MS[INTERVAL_MAP.get(timeframe, "1h")]
+    step_hours = step / 3_600_000
+    
+    drift = np.array([r["drift"] for r in MARKET_REGIMES]) * step_hours
+    volatility = np.array([r["volatility"] for r in MARKET_REGIMES]) * np.sqrt(step_hours)
+    mean_runs = np.maximum(np.array([r["mean_hours"] for r in MARKET_REGIMES]) / step_hours, 1.0)
+    volume_factor = np.array([r["volume"] for r in MARKET_REGIMES])
+    
+    # Draw regime runs until they cover the series
+    regime_ids = []
+    run_lengths = []
+    covered = 0
+    while covered < limit:
+        batch = max(16, int(limit / mean_runs.min()) + 1)
+        ids = rng.integers(0, len(MARKET_REGIMES), size=batch)
+        lengths = rng.geometric(1.0 / mean_runs[ids])
+        regime_ids.append(ids)
+        run_lengths.append(lengths)
+        covered += int(lengths.sum())
+    regime = np.repeat(np.concatenate(regime_ids), np.concatenate(run_lengths))[:limit]
+    
+    shocks = rng.standard_normal(limit)
+    log_returns = drift[regime] + volatility[regime] * shocks
+    base_price = SYNTHETIC_BASE_PRICES.get(pair, 100.0)
+    close = base_price * np.exp(np.cumsum(log_returns))
+    open_ = np.empty(limit)
+    open_[0] = base_price
+    open_[1:] = close[:-1]
+    
+    wick = np.abs(rng.standard_normal((2, limit))) * volatility[regime] * 0.5
+    high = np.maximum(open_, close) * np.exp(wick[0])
+    low = np.minimum(open_, close) * np.exp(-wick[1])
+    volume = 1_000_000 / base_price * volume_factor[regime] * rng.lognormal(0.0, 0.5, limit) * (1 + np.abs(shocks))
+    
+    if end_ms is None:
+        end_ms = int(time.time() * 1000)
+    last_open = end_ms // step * step
+    open_time = last_open - step * np.arange(limit - 1, -1, -1, dtype=np.int64)
+    
+    return KlineArrays(open_time, open_, high, low, close, volume)
+
+def generate_mock_data(limit: int = 500, pair: str = "BTC/USDT", timeframe: str = "1h", seed: int = 42):
+    return generate_synthetic_klines(limit, pair, timeframe, seed).to_frame()
+
+# Technical Analysis Functions
+def calculate_rsi(prices, period=14):
+    delta = prices.diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
+    rs = gain / loss
+    return 100 - (100 / (1 + rs))
+
+def calculate_macd(prices, fast=12, slow=26, signal=9):
+    ema_fast = prices.ewm(span=fast).mean()
+    ema_slow = prices.ewm(span=slow).mean()
+    macd_line = ema_fast - ema_slow
+    signal_line = macd_line.ewm(span=signal).mean()
+    histogram = macd_line - signal_line
+    return macd_line, signal_line, histogram
+
+def calculate_bollinger_bands(prices, period=20, std_dev=2):
+    sma = prices.rolling(window=period).mean()
+    std = prices.rolling(window=period).std()
+    upper = sma + (std * std_dev)
+    lower = sma - (std * std_dev)
+    return upper, sma, lower
+
+def calculate_atr(df, period=14):
+    """Average True Range for volatility"""
+    high_low = df['high'] - df['low']
+    high_close = (df['high'] - df['close'].shift()).abs()
+    low_close = (df['low'] - df['close'].shift()).abs()
+    
+    tr = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
+    atr = tr.rolling(window=period).mean()
+    return atr
+
+# Vectorized indicator kernels. They work along axis 0, so a 2-D (time x symbol) matrix is
+# processed column by column in one call. Results match the pandas versions above.
+def rolling_mean(x, window):
+    out = np.full(x.shape, np.nan)
+    if len(x) >= window:
+        out[window - 1:] = sliding_window_view(x, window, axis=0).mean(axis=-1)
+    return out
+
+def rolling_std(x, window):
+    out = np.full(x.shape, np.nan)
+    if len(x) >= window:
+        out[window - 1:] = sliding_window_view(x, window, axis=0).std(axis=-1, ddof=1)
+    return out
+
+def _decaying_sum(x, beta):
+    """y[t] = x[t] + beta * y[t-1], evaluated in blocks of closed-form cumulative sums"""
+    out = np.empty(x.shape)
+    if not len(x):
+        return out
+    
+    # Largest block for which beta**-block stays far from float64 overflow
+    block = max(1, int(200 / -np.log(beta)))
+    carry = np.zeros(x.shape[1:])
+    for start in range(0, len(x), block):
+        chunk = x[start:start + block]
+        k = np.arange(len(chunk)).reshape((-1,) + (1,) * (x.ndim - 1))
+        inner = np.cumsum(chunk * beta ** -k, axis=0)
+        out[start:start + len(chunk)] = beta ** k * (beta * carry + inner)
+        carry = out[start + len(chunk) - 1]
+    return out
+
+def ewm_mean(x, span):
+    """pandas ewm(span=span).mean() (adjust=True); NaNs keep decaying but add no weight"""
+    beta = 1 - 2 / (span + 1)
+    valid = ~np.isnan(x)
+    numerator = _decaying_sum(np.where(valid, x, 0.0), beta)
+    denominator = _decaying_sum(valid.astype(np.float64), beta)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+def shift_down(x, periods=1):
+    """Previous values along axis 0 (like pandas shift)"""
+    out = np.full(x.shape, np.nan)
+    out[periods:] = x[:-periods]
+    return out
+
+def rsi_array(close, period=14):
+    delta = close - shift_down(close)
+    gain = rolling_mean(np.where(delta > 0, delta, 0.0), period)
+    loss = rolling_mean(np.where(delta < 0, -delta, 0.0), period)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return 100 - (100 / (1 + gain / loss))
+
+def atr_array(high, low, close, period=14):
+    prev_close = shift_down(close)
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    return rolling_mean(true_range, period)
+
+def expanding_nanmean(x):
+    """Mean of all non-NaN values up to each point (the per-bar equivalent of Series.mean())"""
+    valid = ~np.isnan(x)
+    counts = np.cumsum(valid, axis=0)
+    totals = np.cumsum(np.where(valid, x, 0.0), axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, totals / counts, np.nan)
+
+class IndicatorFrame:
+    """Every indicator series used by scoring, market-condition detection, charts and backtests,
+    computed once per price series."""
+    
+    def __init__(self, open_, high, low, close, volume):
+        self.open = open_
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        
+        self.rsi = rsi_array(close)
+        ema_fast = ewm_mean(close, 12)
+        ema_slow = ewm_mean(close, 26)
+        self.macd = ema_fast - ema_slow
+        self.macd_signal = ewm_mean(self.macd, 9)
+        self.macd_histogram = self.macd - self.macd_signal
+        
+        # The 20-period mean serves as both SMA20 and the Bollinger middle band
+        self.sma_20 = rolling_mean(close, 20)
+        bb_std = rolling_std(close, 20)
+        self.middle_bb = self.sma_20
+        self.upper_bb = self.sma_20 + bb_std * 2
+        self.lower_bb = self.sma_20 - bb_std * 2
+        
+        self.sma_50 = rolling_mean(close, 50)
+        self.ema_9 = ewm_mean(close, 9)
+        self.atr = atr_array(high, low, close)
+        self.volume_ma = rolling_mean(volume, 20)
+    
+    @classmethod
+    def from_frame(cls, df):
+        return cls(*(df[c].to_numpy(dtype=np.float64) for c in ("open", "high", "low", "close", "volume")))
+    
+    @property
+    def atr_mean(self):
+        return expanding_nanmean(self.atr)[-1]
+    
+    def __len__(self):
+        return len(self.close)
+    
+    def to_frame(self, timestamps=None):
+        """Pandas view of the indicator series, e.g. for charts"""
+        columns = ["open", "high", "low", "close", "volume", "rsi", "macd", "macd_signal", "macd_histogram",
+                   "upper_bb", "middle_bb", "lower_bb", "sma_20", "sma_50", "ema_9", "atr", "volume_ma"]
+        df = pd.DataFrame({c: getattr(self, c) for c in columns})
+        if timestamps is not None:
+            df.insert(0, "timestamp", timestamps)
+        return df
+
+# Incremental indicator state: O(1) updates per appended or revised candle
+class EWMState:
+    """Adjusted EWM (pandas ewm(span).mean()) kept as a decaying numerator/denominator pair"""
+    
+    def __init__(self, span: int):
+        self.span = span
+        self.beta = 1 - 2 / (span + 1)
+        self.numerator = 0.0
+        self.denominator = 0.0
+        self.prev = (0.0, 0.0)  # state before the last candle, for revisions
+    
+    def update(self, x: float, revise: bool = False):
+        if not revise:
+            self.prev = (self.numerator, self.denominator)
+        numerator, denominator = self.prev
+        self.numerator = x + self.beta * numerator
+        self.denominator = 1 + self.beta * denominator
+    
+    @property
+    def value(self):
+        return self.numerator / self.denominator if self.denominator else float("nan")
+    
+    def to_dict(self):
+        return {"span": self.span, "numerator": self.numerator, "denominator": self.denominator, "prev": list(self.prev)}
+    
+    @classmethod
+    def from_dict(cls, data):
+        state = cls(data["span"])
+        state.numerator = data["numerator"]
+        state.denominator = data["denominator"]
+        state.prev = tuple(data["prev"])
+        return state
+
+class RollingState:
+    """Rolling mean/std over a fixed window with running sums (shifted by the first value for precision)"""
+    
+    RESUM_EVERY = 1000  # re-add the window occasionally so float drift can't accumulate
+    
+    def __init__(self, window: int):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.shift = None
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.updates = 0
+    
+    def update(self, x: float, revise: bool = False):
+        if self.shift is None:
+            self.shift = x
+        if revise and self.values:
+            self._remove(self.values.pop())
+        elif len(self.values) == self.window:
+            self._remove(self.values[0])
+        self.values.append(x)
+        y = x - self.shift
+        self.total += y
+        self.total_sq += y * y
+        
+        self.updates += 1
+        if self.updates % self.RESUM_EVERY == 0:
+            shifted = [v - self.shift for v in self.values]
+            self.total = sum(shifted)
+            self.total_sq = sum(v * v for v in shifted)
+    
+    def _remove(self, x: float):
+        y = x - self.shift
+        self.total -= y
+        self.total_sq -= y * y
+    
+    @property
+    def mean(self):
+        if len(self.values) < self.window:
+            return float("nan")
+        return self.shift + self.total / self.window
+    
+    @property
+    def std(self):
+        if len(self.values) < self.window:
+            return float("nan")
+        variance = (self.total_sq - self.total * self.total / self.window) / (self.window - 1)
+        return float(np.sqrt(max(variance, 0.0)))
+    
+    def to_dict(self):
+        return {"window": self.window, "values": list(self.values), "shift": self.shift, "updates": self.updates}
+    
+    @classmethod
+    def from_dict(cls, data):
+        state = cls(data["window"])
+        state.shift = data["shift"]
+        state.values.extend(data["values"])
+        state.updates = data["updates"]
+        if state.shift is not None:
+            shifted = [v - state.shift for v in state.values]
+            state.total = sum(shifted)
+            state.total_sq = sum(v * v for v in shifted)
+        return state
+
+class IndicatorState:
+    """Streaming counterpart of IndicatorFrame for one series.
+    
+    `update` appends a candle, or revises the last one when the open time repeats, in constant time.
+    The latest values match the batch calculate_* functions over the same candles.
+    """
+    
+    def __init__(self):
+        self.last_open_time = None
+        self.count = 0
+        self.close = float("nan")
+        self.prev_close = float("nan")  # close of the candle before the current one
+        self.volume = float("nan")
+        
+        self.ema_fast = EWMState(12)
+        self.ema_slow = EWMState(26)
+        self.macd_signal_ema = EWMState(9)
+        self.ema_9_state = EWMState(9)
+        
+        self.close_20 = RollingState(20)
+        self.close_50 = RollingState(50)
+        self.volume_20 = RollingState(20)
+        self.gains = RollingState(14)
+        self.losses = RollingState(14)
+        self.true_range = RollingState(14)
+        
+        # Mean ATR over the analysis window (market condition), matching atr.mean() on a LIVE_ANALYSIS_LIMIT frame
+        self.atr_recent = RollingState(LIVE_ATR_WINDOW)
+        self.current_atr = float("nan")
+        
+        # Final indicator values of the last closed candles, oldest first (LiveIndicatorView series)
+        self.history = deque(maxlen=LIVE_SERIES_HISTORY)
+    
+    def update(self, open_time: int, o: float, h: float, l: float, c: float, v: float):
+        revise = open_time == self.last_open_time
+        if self.last_open_time is not None and open_time < self.last_open_time:
+            return  # stale message
+        
+        # A revised candle replaces its ATR value in the window rather than adding another
+        revise_atr = revise and not np.isnan(self.current_atr)
+        if not revise:
+            if self.count:
+                snapshot = self.snapshot()
+                self.history.append([snapshot[name] for name in LiveIndicatorView.INDICATOR_SERIES])
+            self.prev_close = self.close
+            self.count += 1
+        self.last_open_time = open_time
+        self.close = c
+        self.volume = v
+        
+        self.ema_fast.update(c, revise)
+        self.ema_slow.update(c, revise)
+        self.macd_signal_ema.update(self.ema_fast.value - self.ema_slow.value, revise)
+        self.ema_9_state.update(c, revise)
+        
+        self.close_20.update(c, revise)
+        self.close_50.update(c, revise)
+        self.volume_20.update(v, revise)
+        
+        delta = 0.0 if np.isnan(self.prev_close) else c - self.prev_close
+        self.gains.update(max(delta, 0.0), revise)
+        self.losses.update(max(-delta, 0.0), revise)
+        
+        true_range = h - l
+        if not np.isnan(self.prev_close):
+            true_range = max(true_range, abs(h - self.prev_close), abs(l - self.prev_close))
+        self.true_range.update(true_range, revise)
+        
+        self.current_atr = self.true_range.mean
+        if not np.isnan(self.current_atr):
+            self.atr_recent.update(self.current_atr, revise_atr)
+    
+    @property
+    def macd(self):
+        return self.ema_fast.value - self.ema_slow.value if self.count else float("nan")
+    
+    @property
+    def macd_signal(self):
+        return self.macd_signal_ema.value if self.count else float("nan")
+    
+    @property
+    def rsi(self):
+        gain, loss = self.gains.mean, self.losses.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return float(100 - 100 / (1 + np.float64(gain) / np.float64(loss)))
+    
+    def snapshot(self):
+        sma_20 = self.close_20.mean
+        bb_std = self.close_20.std
+        return {
+            "open_time": self.last_open_time,
+            "close": self.close,
+            "prev_close": self.prev_close,
+            "volume": self.volume,
+            "rsi": self.rsi,
+            "macd": self.macd,
+            "macd_signal": self.macd_signal,
+            "macd_histogram": self.macd - self.macd_signal,
+            "upper_bb": sma_20 + bb_std * 2,
+            "middle_bb": sma_20,
+            "lower_bb": sma_20 - bb_std * 2,
+            "sma_20": sma_20,
+            "sma_50": self.close_50.mean,
+            "ema_9": self.ema_9_state.value,
+            "atr": self.current_atr,
+            "atr_mean": self.atr_recent.mean,
+            "volume_ma": self.volume_20.mean
+        }
+    
+    def to_dict(self):
+        data = {k: getattr(self, k) for k in ("last_open_time", "count", "close", "prev_close", "volume", "current_atr")}
+        data["format"] = INDICATOR_STATE_FORMAT
+        data["history"] = list(self.history)
+        for name in ("ema_fast", "ema_slow", "macd_signal_ema", "ema_9_state"):
+            data[name] = getattr(self, name).to_dict()
+        for name in ("close_20", "close_50", "volume_20", "gains", "losses", "true_range", "atr_recent"):
+            data[name] = getattr(self, name).to_dict()
+        return data
+    
+    @classmethod
+    def from_dict(cls, data):
+        state = cls()
+        for key, value in data.items():
+            if key in ("ema_fast", "ema_slow", "macd_signal_ema", "ema_9_state"):
+                value = EWMState.from_dict(value)
+            elif key in ("close_20", "close_50", "volume_20", "gains", "losses", "true_range", "atr_recent"):
+                value = RollingState.from_dict(value)
+            elif key == "history":
+                value = deque(value, maxlen=LIVE_SERIES_HISTORY)
+            elif key == "format":
+                continue
+            setattr(state, key, value)
+        return state
+
+class LiveIndicatorView:
+    """IndicatorFrame-shaped view of an IndicatorState for the scorer and market-condition detection.
+    
+    OHLCV covers the buffer frame; indicator series hold the state's closed-candle history plus the current
+    candle, enough for any rule whose lookback fits in LIVE_SERIES_HISTORY.
+    """
+    
+    INDICATOR_SERIES = ("rsi", "macd", "macd_signal", "macd_histogram", "upper_bb", "middle_bb", "lower_bb",
+                        "sma_20", "sma_50", "ema_9", "atr", "volume_ma")
+    
+    def __init__(self, state: IndicatorState, frame):
+        for name in ("open", "high", "low", "close", "volume"):
+            setattr(self, name, frame[name].to_numpy(dtype=np.float64))
+        snapshot = state.snapshot()
+        rows = np.array([*state.history, [snapshot[name] for name in self.INDICATOR_SERIES]], dtype=np.float64)
+        for i, name in enumerate(self.INDICATOR_SERIES):
+            setattr(self, name, rows[:, i])
+        self.atr_mean = snapshot["atr_mean"]
+
+# Scoring rules: each rule maps whole indicator series to long/short masks, and the registry compiles them into
+# one vectorized pass shared by live scoring, backtests and parameter sweeps.
+REGIME_CODES = {"RANGING": 0, "TRENDING_UP": 1, "TRENDING_DOWN": -1, "VOLATILE": 2}
+
+# Strategy knobs shared by the scorer, the backtest engine and the optimizer (rules add their `weight_<name>`)
+DEFAULT_STRATEGY_PARAMS = {
+    "rsi_oversold": 30,
+    "rsi_overbought": 70,
+    "stop_atr": 2.0,  # stop loss distance in ATRs
+    "target_atr": 3.0,  # take profit distance in ATRs
+    "min_confidence": 60,  # score needed to open a position
+    "fee_haircut": 0.95  # keep 95% of each trade's P&L to account for fees
+}
+
+# Series a rule may require: IndicatorFrame attributes plus the derived per-bar market regime
+SCORING_SERIES = ("open", "high", "low", "close", "volume", "rsi", "macd", "macd_signal", "macd_histogram",
+                  "upper_bb", "middle_bb", "lower_bb", "sma_20", "sma_50", "ema_9", "atr", "volume_ma", "regime")
+
+def market_regime_series(ind: IndicatorFrame):
+    """detect_market_condition for every bar, as REGIME_CODES"""
+    with np.errstate(invalid="ignore"):
+        volatile = ind.atr > expanding_nanmean(ind.atr) * 1.5
+        trending_up = ~volatile & (ind.sma_20 > ind.sma_50) & (ind.close > ind.sma_20)
+        trending_down = ~volatile & ~trending_up & (ind.sma_20 < ind.sma_50) & (ind.close < ind.sma_20)
+    regime = np.zeros(ind.close.shape, dtype=np.int8)
+    regime[volatile] = REGIME_CODES["VOLATILE"]
+    regime[trending_up] = REGIME_CODES["TRENDING_UP"]
+    regime[trending_down] = REGIME_CODES["TRENDING_DOWN"]
+    return regime
+
+class ScoringRule:
+    """A named long/short condition, weighted by the `weight_<name>` strategy param"""
+    
+    def __init__(self, name: str, requires: tuple, evaluate, bullish: str, bearish: str, caution: str = None,
+                 lookback: int = 1):
+        unknown = set(requires) - set(SCORING_SERIES)
+        if unknown:
+            raise ValueError(f"Rule '{name}' requires unknown series: {', '.join(sorted(unknown))}")
+        self.name = name
+        self.requires = tuple(requires)
+        self.lookback = lookback  # earlier bars the rule reads besides the current one (shift_down = 1)
+        self.evaluate = evaluate
+        self.weight_param = f"weight_{name}"
+        # Labels may reference strategy params, e.g. "RSI Oversold (<{rsi_oversold})"
+        self.bullish = bullish
+        self.bearish = bearish
+        self.caution = caution
+
+class RuleScorer:
+    """Registered rules compiled into one vectorized evaluation over whole indicator series"""
+    
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.requires = sorted({name for rule in self.rules for name in rule.requires})
+        self.lookback = max((rule.lookback for rule in self.rules), default=0)
+    
+    def evaluate(self, ind, params: dict = DEFAULT_STRATEGY_PARAMS, regime=None, tail: int = None):
+        """Scores for every bar (or only the last `tail` bars). `regime` overrides the per-bar market regime."""
+        series = {}
+        for name in self.requires:
+            if name == "regime":
+                values = regime if regime is not None else market_regime_series(ind)
+            else:
+                values = getattr(ind, name)
+            series[name] = values[-tail:] if tail else values
+        # Works on 1-D series and on 2-D (time x symbol) matrices alike
+        shape = (ind.close[-tail:] if tail else ind.close).shape
+        long_score = np.zeros(shape, dtype=np.int64)
+        short_score = np.zeros(shape, dtype=np.int64)
+        masks = {}
+        with np.errstate(invalid="ignore"):
+            for rule in self.rules:
+                masks[rule.name] = rule.evaluate(series, params)
+                weight = params.get(rule.weight_param, 0)
+                long_score = long_score + weight * masks[rule.name][0]
+                short_score = short_score + weight * masks[rule.name][1]
+        
+        return {
+            "long_score": long_score,
+            "short_score": short_score,
+            "signal": np.sign(long_score - short_score),  # 1 = LONG, -1 = SHORT, 0 = WAIT
+            "confidence": np.maximum(long_score, short_score),
+            "rules": masks
+        }
+    
+    def describe(self, scores: dict, params: dict = DEFAULT_STRATEGY_PARAMS, i: int = -1):
+        """Human-readable reasons for bar `i`, in rule order"""
+        signals = []
+        for rule in self.rules:
+            long_mask, short_mask, *caution = scores["rules"][rule.name]
+            if long_mask[i]:
+                signals.append(rule.bullish.format(**params))
+            elif short_mask[i]:
+                signals.append(rule.bearish.format(**params))
+            elif caution and caution[0][i]:
+                signals.append(rule.caution.format(**params))
+        return signals
+
+SCORING_RULES = OrderedDict()
+SCORER = RuleScorer([])
+
+def scoring_rule(name: str, requires: tuple, weight, bullish: str, bearish: str, caution: str = None,
+                 lookback: int = 1):
+    """Register `fn(series, params) -> (long_mask, short_mask[, caution_mask])` as a scoring rule and recompile.
+    
+    `weight` becomes the default `weight_<name>` param, so the optimizer can sweep it like any other knob.
+    `lookback` is how many bars before the current one the rule reads when scoring the latest bar.
+    """
+    def register(fn):
+        global SCORER
+        SCORING_RULES[name] = ScoringRule(name, requires, fn, bullish, bearish, caution, lookback)
+        DEFAULT_STRATEGY_PARAMS.setdefault(f"weight_{name}", weight)
+        SCORER = RuleScorer(SCORING_RULES.values())
+        return fn
+    return register
+
+@scoring_rule("rsi", ("rsi",), 20, "RSI Oversold (<{rsi_oversold}) - BULLISH", "RSI Overbought (>{rsi_overbought}) - BEARISH")
+def rsi_extremes_rule(s, params):
+    long_mask = s["rsi"] < params["rsi_oversold"]
+    return long_mask, ~long_mask & (s["rsi"] > params["rsi_overbought"])
+
+@scoring_rule("macd", ("macd", "macd_signal"), 20, "MACD Bullish Crossover - BULLISH", "MACD Bearish Crossover - BEARISH")
+def macd_cross_rule(s, params):
+    macd_prev = shift_down(s["macd"])
+    signal_prev = shift_down(s["macd_signal"])
+    long_mask = (s["macd"] > s["macd_signal"]) & (macd_prev <= signal_prev)
+    return long_mask, ~long_mask & (s["macd"] < s["macd_signal"]) & (macd_prev >= signal_prev)
+
+@scoring_rule("bb", ("close", "upper_bb", "lower_bb"), 15, "Price Below Lower BB - BULLISH", "Price Above Upper BB - BEARISH")
+def bollinger_breach_rule(s, params):
+    long_mask = s["close"] < s["lower_bb"]
+    return long_mask, ~long_mask & (s["close"] > s["upper_bb"])
+
+@scoring_rule("ma", ("close", "sma_20", "sma_50"), 15, "Price Above MAs - BULLISH", "Price Below MAs - BEARISH")
+def ma_alignment_rule(s, params):
+    # SMA20 stands in for SMA50 until there are 50 candles
+    sma_50 = np.where(np.isnan(s["sma_50"]), s["sma_20"], s["sma_50"])
+    long_mask = (s["close"] > s["sma_20"]) & (s["sma_20"] > sma_50)
+    return long_mask, ~long_mask & (s["close"] < s["sma_20"]) & (s["sma_20"] < sma_50)
+
+@scoring_rule("volume", ("close", "volume", "volume_ma"), 15,
+              "High Volume on Green Candle - BULLISH", "High Volume on Red Candle - BEARISH")
+def volume_spike_rule(s, params):
+    spike = s["volume"] > s["volume_ma"] * 1.5
+    green = s["close"] > shift_down(s["close"])
+    return spike & green, spike & ~green
+
+@scoring_rule("regime", ("regime",), 10, "Market Trending Up - BULLISH", "Market Trending Down - BEARISH",
+              caution="High Volatility - Use Caution")
+def market_regime_rule(s, params):
+    regime = s["regime"]
+    return (regime == REGIME_CODES["TRENDING_UP"], regime == REGIME_CODES["TRENDING_DOWN"],
+            regime == REGIME_CODES["VOLATILE"])
+
+def detect_market_condition(df, indicators: IndicatorFrame = None):
+    """Detect if market is trending, ranging, or volatile"""
+    ind = indicators or IndicatorFrame.from_frame(df)
+    close = ind.close
+    
+    # Simple trend detection using price position vs MAs
+    current_price = close[-1]
+    sma_20_val = ind.sma_20[-1]
+    sma_50_val = ind.sma_50[-1]
+    
+    # Volatility using ATR
+    atr_current = ind.atr[-1]
+    atr_avg = ind.atr_mean
+    
+    # Price range
+    price_range = (close.max() - close.min()) / close.mean() * 100
+    
+    # Determine condition
+    if atr_current > atr_avg * 1.5:
+        condition = "VOLATILE"
+        description = "High volatility - use wider stops"
+    elif sma_20_val > sma_50_val and current_price > sma_20_val:
+        condition = "TRENDING_UP"
+        description = "Uptrend - favor long positions"
+    elif sma_20_val < sma_50_val and current_price < sma_20_val:
+        condition = "TRENDING_DOWN"
+        description = "Downtrend - favor short positions"
+    else:
+        condition = "RANGING"
+        description = "Sideways market - use range-bound strategies"
+    
+    return {
+        "condition": condition,
+        "description": description,
+        "volatility": float(atr_current),
+        "price_range": float(price_range)
+    }
+
+def analyze_trading_signal(df, market_condition: dict = None, indicators: IndicatorFrame = None,
+                           params: dict = DEFAULT_STRATEGY_PARAMS):
+    """Comprehensive trading signal analysis"""
+    ind = indicators or IndicatorFrame.from_frame(df)
+    close = ind.close
+    
+    # Latest indicator values
+    rsi = ind.rsi[-1]
+    macd_current = ind.macd[-1]
+    signal_current = ind.macd_signal[-1]
+    
+    upper_bb = ind.upper_bb[-1]
+    lower_bb = ind.lower_bb[-1]
+    current_price = close[-1]
+    
+    sma_20 = ind.sma_20[-1]
+    sma_50 = ind.sma_50[-1] if len(close) >= 50 else sma_20
+    
+    avg_volume = ind.volume_ma[-1]
+    current_volume = ind.volume[-1]
+    
+    # ATR for stop loss
+    atr = ind.atr[-1]
+    
+    # Score the last bar with the registered rules, plus as many earlier bars as the rules look back
+    tail = SCORER.lookback + 1
+    regime = np.zeros(tail, dtype=np.int8)
+    if market_condition:
+        regime[-1] = REGIME_CODES[market_condition["condition"]]
+    scores = SCORER.evaluate(ind, params, regime=regime, tail=tail)
+    long_score = scores["long_score"][-1].item()
+    short_score = scores["short_score"][-1].item()
+    signals = SCORER.describe(scores, params)
+    
+    # Determine final signal
+    if long_score > short_score:
+        final_signal = "LONG"
+        confidence = long_score
+    elif short_score > long_score:
+        final_signal = "SHORT"
+        confidence = short_score
+    else:
+        final_signal = "WAIT"
+        confidence = max(long_score, short_score)
+    
+    strength = "STRONG" if confidence >= 70 else "MODERATE" if confidence >= 50 else "WEAK"
+    
+    # Calculate stop loss and take profit
+    if final_signal == "LONG":
+        stop_loss = current_price - (atr * params["stop_atr"])
+        take_profit = current_price + (atr * params["target_atr"])
+    elif final_signal == "SHORT":
+        stop_loss = current_price + (atr * params["stop_atr"])
+        take_profit = current_price - (atr * params["target_atr"])
+    else:
+        stop_loss = None
+        take_profit = None
+    
+    return {
+        "signal": final_signal,
+        "strength": strength,
+        "confidence_score": confidence,
+        "long_score": long_score,
+        "short_score": short_score,
+        "current_price": float(current_price),
+        "stop_loss": float(stop_loss) if stop_loss else None,
+        "take_profit": float(take_profit) if take_profit else None,
+        "rsi": float(rsi),
+        "macd": float(macd_current),
+        "macd_signal": float(signal_current),
+        "upper_bb": float(upper_bb),
+        "lower_bb": float(lower_bb),
+        "sma_20": float(sma_20),
+        "sma_50": float(sma_50),
+        "atr": float(atr),
+        "signals": signals,
+        "volume_ratio": float(current_volume / avg_volume),
+        "market_condition": market_condition
+    }
+
+# Multi-timeframe analysis
+MULTI_TIMEFRAMES = ["15m", "1h", "4h"]
+
+def resample_ohlcv(df, timeframe: str):
+    """Aggregate lower-timeframe candles into `timeframe` candles aligned to UTC bucket boundaries.
+    
+    A leading bucket that starts mid-candle is dropped; the trailing bucket is kept as the still-open candle,
+    just as the exchange would return it.
+    """
+    step = INTERVAL_MS[INTERVAL_MAP.get(timeframe, "1h")]
+    open_time = df["timestamp"].values.astype("datetime64[ms]").astype(np.int64)
+    if len(open_time) == 0:
+        return df.iloc[:0]
+    
+    bucket = open_time // step
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    if open_time[0] != bucket[0] * step:
+        starts = starts[1:]
+    if len(starts) == 0:
+        return df.iloc[:0]
+    ends = np.r_[starts[1:], len(bucket)]
+    
+    resampled = pd.DataFrame({
+        "timestamp": pd.to_datetime(bucket[starts] * step, unit='ms'),
+        "open": df["open"].values[starts],
+        "high": np.maximum.reduceat(df["high"].values, starts),
+        "low": np.minimum.reduceat(df["low"].values, starts),
+        "close": df["close"].values[ends - 1],
+        "volume": np.add.reduceat(df["volume"].values, starts)
+    })
+    resampled.attrs = dict(df.attrs)
+    return resampled
+
+def plan_timeframe_fetches(timeframes: List[str], limit: int):
+    """Pick which timeframes to fetch and which to derive by resampling a fetched lower one.
+    
+    Returns ({fetched timeframe: candles to fetch}, {derived timeframe: source timeframe}). A timeframe is derived
+    only if its step is a multiple of the source's and the source stays within one exchange request.
+    """
+    fetches, derived = {}, {}
+    for tf in sorted(dict.fromkeys(timeframes), key=lambda t: INTERVAL_MS[INTERVAL_MAP.get(t, "1h")]):
+        step = INTERVAL_MS[INTERVAL_MAP.get(tf, "1h")]
+        for source in fetches:
+            source_step = INTERVAL_MS[INTERVAL_MAP.get(source, "1h")]
+            # +1 source bucket so a leading partial candle can be dropped without losing depth
+            needed = (step // source_step) * (limit + 1)
+            if step % source_step == 0 and needed <= MAX_KLINES_PER_REQUEST:
+                derived[tf] = source
+                fetches[source] = max(fetches[source], needed)
+                break
+        else:
+            fetches[tf] = limit
+    return fetches, derived
+
+async def load_timeframes(pair: str, timeframes: List[str], limit: int = 200):
+    """Candles for several timeframes: one concurrent fetch per source timeframe, the rest resampled locally"""
+    fetches, derived = plan_timeframe_fetches(timeframes, limit)
+    frames = await asyncio.gather(*[fetch_ohlcv(pair, tf, limit=n) for tf, n in fetches.items()])
+    by_tf = dict(zip(fetches, frames))
+    
+    result = {}
+    for tf in timeframes:
+        source = derived.get(tf)
+        if source is None:
+            result[tf] = by_tf[tf].iloc[-limit:].reset_index(drop=True)
+        else:
+            result[tf] = resample_ohlcv(by_tf[source], tf).iloc[-limit:].reset_index(drop=True)
+            result[tf].attrs["resampled_from"] = source
+    return result
+
+async def multi_timeframe_analysis(pair: str, timeframes: List[str]):
+    """Analyze multiple timeframes"""
+    results = {}
+    frames = await load_timeframes(pair, timeframes, limit=200)
+    
+    for tf in timeframes:
+        df = frames[tf]
+        indicators = IndicatorFrame.from_frame(df)
+        market_condition = detect_market_condition(df, indicators)
+        analysis = analyze_trading_signal(df, market_condition, indicators)
+        results[tf] = analysis
+    
+    # Aggregate signals
+    signals = [results[tf]["signal"] for tf in timeframes]
+    long_count = signals.count("LONG")
+    short_count = signals.count("SHORT")
+    
+    if long_count > short_count:
+        consensus = "LONG"
+    elif short_count > long_count:
+        consensus = "SHORT"
+    else:
+        consensus = "WAIT"
+    
+    return {
+        "consensus": consensus,
+        "timeframes": results,
+        "alignment": f"{max(long_count, short_count)}/{len(timeframes)} timeframes agree"
+    }
+
+# Batch analysis across many pairs
+BATCH_ANALYSIS_CONCURRENCY = 8
+MAX_BATCH_ANALYSES = 200
+
+async def analyze_pair(pair: str, timeframe: str):
+    """Fetch candles for one pair/timeframe and score the latest bar; `source` says where the candles came from"""
+    df = await fetch_ohlcv(pair, timeframe, LIVE_ANALYSIS_LIMIT)
+    source = df.attrs.get("source")
+    live = get_live_indicators(pair, timeframe, len(df)) if source == "stream" else None
+    indicators = live or IndicatorFrame.from_frame(df)
+    market_condition = detect_market_condition(df, indicators)
+    return {**analyze_trading_signal(df, market_condition, indicators), "source": source}
+
+async def iter_batch_analyses(jobs: list, concurrency: int = BATCH_ANALYSIS_CONCURRENCY):
+    """Analyze (pair, timeframe) jobs with bounded concurrency, yielding results as they complete"""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    
+    async def run_one(pair, timeframe):
+        async with semaphore:
+            try:
+                analysis = await analyze_pair(pair, timeframe)
+            except Exception as e:
+                return {"pair": pair, "timeframe": timeframe, "error": str(e)}
+        if analysis["source"] == "mock":
+            # Signals on made-up candles must not be ranked, published or saved next to real ones
+            return {"pair": pair, "timeframe": timeframe, "source": "mock", "error": "Market data unavailable"}
+        return {"pair": pair, "timeframe": timeframe, **analysis}
+    
+    tasks = [asyncio.ensure_future(run_one(pair, timeframe)) for pair, timeframe in jobs]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Client went away mid-stream: stop the remaining fetches
+        for task in tasks:
+            task.cancel()
+
+def rank_analyses(results: list):
+    """Actionable signals first, then by confidence and long/short spread"""
+    scored = [r for r in results if "error" not in r]
+    return sorted(scored, key=lambda r: (r["signal"] == "WAIT", -r["confidence_score"], -abs(r["long_score"] - r["short_score"])))
+
+async def save_analyses(user_id: int, results: list):
+    """Queue a batch of analyses for the history writer; they are committed in a single transaction"""
+    await HISTORY_WRITER.submit([analysis_history_row(user_id, r["pair"], r["timeframe"], r) for r in results if "error" not in r])
+
+def batch_summary(results: list, started: float):
+    """Ranked list plus per-job errors for a finished batch"""
+    return {
+        "ranked": rank_analyses(results),
+        "errors": [r for r in results if "error" in r],
+        "count": len(results),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+# Background market scanner
+SIGNAL_SNAPSHOTS = {}  # (pair, timeframe) -> {"analysis", "computed_at", "expires_at"}
+SCANNER_STATS = {}  # timeframe -> lag and run metrics
+_scanner_tasks = []
+
+def get_signal_snapshot(pair: str, timeframe: str):
+    """Precomputed analysis for the current candle, or None if the scanner has not produced one yet"""
+    snapshot = SIGNAL_SNAPSHOTS.get((pair, timeframe))
+    if snapshot is None or time.time() >= snapshot["expires_at"]:
+        return None
+    return snapshot["analysis"]
+
+async def scan_timeframe(timeframe: str, candle_close: float = None, config: dict = SCANNER_CONFIG):
+    """Analyze every configured pair on `timeframe` and publish the results to the snapshot table.
+    
+    `candle_close` is the close this scan reacts to; lag is measured from it (the startup warm-up scan passes None).
+    """
+    stats = SCANNER_STATS.setdefault(timeframe, {"runs": 0, "errors": 0, "missed_closes": 0, "max_lag_ms": 0.0})
+    started = time.time()
+    jobs = [(pair, timeframe) for pair in config["pairs"]]
+    async for result in iter_batch_analyses(jobs, config["concurrency"]):
+        if "error" in result:
+            stats["errors"] += 1
+            print(f"Scanner failed for {result['pair']} {timeframe}: {result['error']}")
+            continue
+        computed_at = time.time()
+        pair = result.pop("pair")
+        result.pop("timeframe")  # keyed by pair/timeframe; the stored analysis has the same shape /analyze returns live
+        SIGNAL_SNAPSHOTS[(pair, timeframe)] = {
+            "analysis": result,
+            "computed_at": computed_at,
+            "expires_at": next_candle_close(timeframe, computed_at)
+        }
+    
+    finished = time.time()
+    stats["runs"] += 1
+    stats["last_duration_ms"] = round((finished - started) * 1000, 1)
+    if candle_close is not None:
+        # Lag: how long after the candle closed its signals were available
+        lag_ms = round((finished - candle_close) * 1000, 1)
+        stats["last_close"] = candle_close
+        stats["last_lag_ms"] = lag_ms
+        stats["max_lag_ms"] = max(stats["max_lag_ms"], lag_ms)
+
+async def run_scanner(timeframe: str, config: dict = SCANNER_CONFIG):
+    """Scan once immediately, then again shortly after every candle close of `timeframe`"""
+    step = INTERVAL_MS[INTERVAL_MAP.get(timeframe, "1h")] / 1000
+    candle_close = None
+    while True:
+        try:
+            await scan_timeframe(timeframe, candle_close, config)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Scanner error on {timeframe}: {e}")
+        
+        next_close = next_candle_close(timeframe)
+        if candle_close is not None:
+            # A scan that overran a whole candle skips ahead instead of queueing catch-up runs
+            missed = int(round((next_close - candle_close) / step)) - 1
+            if missed > 0:
+                SCANNER_STATS[timeframe]["missed_closes"] += missed
+        candle_close = next_close
+        await asyncio.sleep(max(0.0, candle_close + config["close_delay"] - time.time()))
+
+def scanner_metrics():
+    now = time.time()
+    return {
+        "enabled": bool(_scanner_tasks),
+        "snapshots": len(SIGNAL_SNAPSHOTS),
+        "fresh_snapshots": sum(1 for s in SIGNAL_SNAPSHOTS.values() if now < s["expires_at"]),
+        "timeframes": {tf: dict(stats) for tf, stats in SCANNER_STATS.items()}
+    }
+
+@app.on_event("startup")
+async def start_market_scanner():
+    if not SCANNER_CONFIG["enabled"]:
+        return
+    for timeframe in SCANNER_CONFIG["timeframes"]:
+        _scanner_tasks.append(asyncio.create_task(run_scanner(timeframe)))
+
+@app.on_event("shutdown")
+async def stop_market_scanner():
+    while _scanner_tasks:
+        _scanner_tasks.pop().cancel()
+
+# Vectorized backtest engine
+BACKTEST_WARMUP = 50  # bars of history before the first trade decision
+
+def compute_signal_series(ind: IndicatorFrame, params: dict = DEFAULT_STRATEGY_PARAMS):
+    """Long/short scores and signal for every bar in one pass.
+    
+    Bar i gets exactly what detect_market_condition + analyze_trading_signal return for the
+    candles up to and including i, because every indicator involved is causal.
+    """
+    return SCORER.evaluate(ind, params)
+
+def find_first(mask_fn, start: int, n: int):
+    """First index >= start where mask_fn(lo, hi) is True, scanning in growing windows (amortized by trade length)"""
+    lo, width = start, 64
+    while lo < n:
+        hi = min(n, lo + width)
+        hits = np.flatnonzero(mask_fn(lo, hi))
+        if len(hits):
+            return lo + int(hits[0])
+        lo, width = hi, width * 2
+    return None
+
+def simulate_trades(close, atr, signal, confidence, start: int, initial_capital: float,
+                    params: dict = DEFAULT_STRATEGY_PARAMS):
+    """Event-driven single-position simulator: jump to the next qualifying entry, then to its exit"""
+    n = len(close)
+    entries = np.flatnonzero((signal != 0) & (confidence >= params["min_confidence"]))
+    capital = initial_capital
+    trades = []
+    equity_curve = [initial_capital]
+    
+    i = start
+    while True:
+        k = np.searchsorted(entries, i)
+        if k == len(entries):
+            break
+        entry = int(entries[k])
+        side = int(signal[entry])
+        entry_price = close[entry]
+        stop_loss = entry_price - side * atr[entry] * params["stop_atr"]
+        take_profit = entry_price + side * atr[entry] * params["target_atr"]
+        
+        with np.errstate(invalid="ignore"):
+            if side == 1:
+                def exit_mask(lo, hi):
+                    c = close[lo:hi]
+                    return (c >= take_profit) | (c <= stop_loss) | (signal[lo:hi] == -1)
+            else:
+                def exit_mask(lo, hi):
+                    c = close[lo:hi]
+                    return (c <= take_profit) | (c >= stop_loss) | (signal[lo:hi] == 1)
+            exit_index = find_first(exit_mask, entry + 1, n)
+        
+        if exit_index is None:
+            break  # position still open at the end of the data
+        
+        exit_price = close[exit_index]
+        if side * (exit_price - take_profit) >= 0:
+            exit_reason = "Take Profit"
+        elif side * (exit_price - stop_loss) <= 0:
+            exit_reason = "Stop Loss"
+        else:
+            exit_reason = "Signal Reversal"
+        
+        pnl = side * (exit_price - entry_price) / entry_price
+        profit = capital * pnl * params["fee_haircut"]
+        capital += profit
+        trades.append({
+            "entry_index": entry,
+            "exit_index": exit_index,
+            "type": "LONG" if side == 1 else "SHORT",
+            "entry_price": float(entry_price),
+            "exit_price": float(exit_price),
+            "profit": float(profit),
+            "result": "WIN" if profit > 0 else "LOSS",
+            "exit_reason": exit_reason
+        })
+        equity_curve.append(capital)
+        i = exit_index + 1  # no re-entry on the exit bar
+    
+    return trades, equity_curve, capital
+
+def summarize_backtest(trades, equity_curve, capital: float, initial_capital: float):
+    total_trades = len(trades)
+    winning_trades = len([t for t in trades if t['result'] == 'WIN'])
+    losing_trades = len([t for t in trades if t['result'] == 'LOSS'])
+    
+    win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
+    total_profit = capital - initial_capital
+    roi = (total_profit / initial_capital) * 100
+    
+    # Max drawdown
+    equity = np.asarray(equity_curve, dtype=np.float64)
+    peaks = np.maximum.accumulate(equity)
+    max_dd = float(((peaks - equity) / peaks * 100).max())
+    
+    # Sharpe ratio (simplified)
+    returns = np.diff(equity) / equity[:-1]
+    std = returns.std(ddof=1) if len(returns) > 1 else 0
+    sharpe = (returns.mean() / std) * np.sqrt(252) if len(returns) > 0 and std > 0 else 0
+    
+    return {
+        "total_trades": total_trades,
+        "winning_trades": winning_trades,
+        "losing_trades": losing_trades,
+        "win_rate": round(win_rate, 2),
+        "initial_capital": initial_capital,
+        "final_capital": round(capital, 2),
+        "total_profit": round(total_profit, 2),
+        "roi": round(roi, 2),
+        "max_drawdown": round(max_dd, 2),
+        "sharpe_ratio": round(float(sharpe), 2)
+    }
+
+def run_backtest(df, initial_capital: float = 10000):
+    """Backtest on a candle frame: one indicator pass, one scoring pass, then the trade simulator"""
+    ind = IndicatorFrame.from_frame(df)
+    scores = compute_signal_series(ind)
+    trades, equity_curve, capital = simulate_trades(
+        ind.close, ind.atr, scores["signal"], scores["confidence"], BACKTEST_WARMUP, initial_capital
+    )
+    
+    timestamps = df["timestamp"].to_numpy()
+    for trade in trades:
+        trade["entry_time"] = str(pd.Timestamp(timestamps[trade.pop("entry_index")]))
+        trade["exit_time"] = str(pd.Timestamp(timestamps[trade.pop("exit_index")]))
+    
+    return {
+        **summarize_backtest(trades, equity_curve, capital, initial_capital),
+        "trades": trades[-10:],  # Last 10 trades
+        "equity_curve": [round(e, 2) for e in equity_curve[-50:]]  # Last 50 points
+    }
+
+async def load_history_frame(pair: str, timeframe: str, start_date: str, end_date: str):
+    """All candles between two dates, paged through the local store and backfill.
+    
+    Only the download is streamed: the returned frame holds the whole range, since the backtest's EWM
+    indicators and expanding ATR mean depend on every earlier candle.
+    """
+    start_ms = int(pd.Timestamp(start_date).value // 1_000_000)
+    end_ms = int(pd.Timestamp(end_date).value // 1_000_000)
+    chunks = [chunk async for chunk in iter_ohlcv_history(pair, timeframe, start_ms, end_ms)]
+    if not chunks:
+        return pd.DataFrame(columns=["timestamp", "open", "high", "low", "close", "volume"])
+    return pd.concat(chunks, ignore_index=True)
+
+async def backtest_strategy(pair: str, timeframe: str, start_date: str, end_date: str, initial_capital: float = 10000):
+    """Backtest trading strategy"""
+    # Page through the requested range instead of only the latest 500 candles
+    df = await load_history_frame(pair, timeframe, start_date, end_date)
+    
+    if len(df) < 50:
+        raise HTTPException(status_code=400, detail="Insufficient data for backtesting")
+    
+    return run_backtest(df, initial_capital)
+
+# Portfolio backtesting: many pairs on one aligned (time x symbol) matrix
+MAX_PORTFOLIO_PAIRS = 100
+PORTFOLIO_LOAD_CONCURRENCY = 8
+
+def align_ohlcv_frames(frames: list):
+    """Stack per-pair candle frames into a (5, time, symbol) OHLCV array on the union of their timestamps.
+    
+    Gaps become flat zero-volume candles at the last close, and bars before a pair's first candle take its first
+    close, so indicators stay finite. `listed_at` is the row where each pair's real data starts.
+    """
+    times = [f["timestamp"].values.astype("datetime64[ms]").astype(np.int64) for f in frames]
+    index = np.unique(np.concatenate(times))
+    n_bars, n_pairs = len(index), len(frames)
+    cube = np.full((5, n_bars, n_pairs), np.nan)
+    for j, (frame, t) in enumerate(zip(frames, times)):
+        cube[:, np.searchsorted(index, t), j] = frame[["open", "high", "low", "close", "volume"]].to_numpy(dtype=np.float64).T
+    
+    valid = ~np.isnan(cube[3])
+    listed_at = valid.argmax(axis=0)
+    last_valid = np.maximum.accumulate(np.where(valid, np.arange(n_bars)[:, None], -1), axis=0)
+    last_valid = np.where(last_valid < 0, listed_at, last_valid)
+    fill = cube[3][last_valid, np.arange(n_pairs)]
+    missing = ~valid
+    for k in range(4):
+        cube[k][missing] = fill[missing]
+    cube[4][missing] = 0.0
+    return index, cube, listed_at
+
+def pair_trade_candidates(ind: IndicatorFrame, scores: dict, listed_at, params: dict):
+    """Each pair's own single-position trade sequence as (entry, exit, column, side, return, confidence) rows"""
+    candidates = []
+    for j in range(ind.close.shape[1]):
+        close = ind.close[:, j]
+        trades, _, _ = simulate_trades(
+            close, ind.atr[:, j], scores["signal"][:, j], scores["confidence"][:, j],
+            int(listed_at[j]) + BACKTEST_WARMUP, 1.0, params
+        )
+        for t in trades:
+            side = 1 if t["type"] == "LONG" else -1
+            ret = side * (t["exit_price"] - t["entry_price"]) / t["entry_price"]
+            candidates.append((t["entry_index"], t["exit_index"], j, side, ret, float(scores["confidence"][t["entry_index"], j])))
+    return candidates
+
+def allocate_portfolio(candidates: list, initial_capital: float, request, params: dict):
+    """Open candidate trades in time order (highest confidence first within a bar) while the caps allow.
+    
+    Positions are sized off realized equity. A skipped trade leaves its pair flat until the trade would have exited.
+    """
+    candidates = sorted(candidates, key=lambda c: (c[0], -c[5]))
+    open_positions = []  # heap of (exit_index, size, profit)
+    realized = initial_capital
+    exposure = 0.0
+    accepted, skipped = [], []
+    max_concurrent = 0
+    
+    for entry, exit_index, col, side, ret, confidence in candidates:
+        # Positions closing on or before this bar free their capital first
+        while open_positions and open_positions[0][0] <= entry:
+            _, size, profit = heapq.heappop(open_positions)
+            realized += profit
+            exposure -= size
+        
+        size = min(request.max_position_pct * realized, request.max_gross_exposure * realized - exposure)
+        if len(open_positions) >= request.max_positions or size <= 0:
+            skipped.append(col)
+            continue
+        
+        profit = size * ret * params["fee_haircut"]
+        heapq.heappush(open_positions, (exit_index, size, profit))
+        exposure += size
+        max_concurrent = max(max_concurrent, len(open_positions))
+        accepted.append((entry, exit_index, col, side, size, profit))
+    
+    return accepted, skipped, max_concurrent
+
+def max_drawdown_pct(equity):
+    peaks = np.maximum.accumulate(equity)
+    return float(((peaks - equity) / peaks * 100).max())
+
+def return_correlations(close, listed_at, symbols: list, top: int = 5):
+    """Pairwise correlation of bar returns over the window where every pair is listed"""
+    common = close[int(listed_at.max()):]
+    if len(symbols) < 2 or len(common) < 3:
+        return None
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = np.corrcoef(np.diff(np.log(common), axis=0), rowvar=False)
+    upper = np.triu_indices(len(symbols), k=1)
+    values = corr[upper]
+    order = np.argsort(np.nan_to_num(values, nan=-2))[::-1][:top]
+    return {
+        "average": round(float(np.nanmean(values)), 3),
+        "most_correlated": [
+            {"pairs": [symbols[upper[0][k]], symbols[upper[1][k]]], "correlation": round(float(values[k]), 3)}
+            for k in order
+        ]
+    }
+
+def run_portfolio_backtest(symbols: list, index, cube, listed_at, timeframe: str, request, params: dict):
+    """Backtest every pair in one vectorized indicator and scoring pass, then allocate one shared capital pool"""
+    ind = IndicatorFrame(*cube)
+    scores = compute_signal_series(ind, params)
+    candidates = pair_trade_candidates(ind, scores, listed_at, params)
+    accepted, skipped, max_concurrent = allocate_portfolio(candidates, request.initial_capital, request, params)
+    
+    # Mark-to-market: signed units held over each bar times that bar's price change
+    close = ind.close
+    n_bars, n_pairs = close.shape
+    deltas = np.zeros((n_bars + 1, n_pairs))
+    if accepted:
+        entry, exit_index, col, side, size, profit = (np.array(v) for v in zip(*accepted))
+        units = side * size / close[entry, col]
+        np.add.at(deltas, (entry + 1, col), units)
+        np.add.at(deltas, (exit_index + 1, col), -units)
+    holdings = np.cumsum(deltas[:-1], axis=0)
+    bar_pnl = holdings * np.diff(close, axis=0, prepend=close[:1]) * params["fee_haircut"]
+    pair_pnl = np.cumsum(bar_pnl, axis=0)
+    equity = request.initial_capital + pair_pnl.sum(axis=1)
+    gross_exposure = (np.abs(holdings) * close).sum(axis=1) / equity
+    
+    returns = np.diff(equity) / equity[:-1]
+    bars_per_year = 365 * 86_400_000 / INTERVAL_MS[INTERVAL_MAP.get(timeframe, "1h")]
+    std = returns.std(ddof=1) if len(returns) > 1 else 0
+    sharpe = returns.mean() / std * np.sqrt(bars_per_year) if std > 0 else 0
+    
+    # Sum of each pair's standalone P&L drawdown: what the portfolio would suffer if they all coincided
+    pair_drawdowns = (np.maximum.accumulate(pair_pnl, axis=0) - pair_pnl).max(axis=0)
+    
+    attribution = []
+    total_profit = equity[-1] - request.initial_capital
+    for j, symbol in enumerate(symbols):
+        trades = [a for a in accepted if a[2] == j]
+        profit = sum(a[5] for a in trades)
+        attribution.append({
+            "pair": symbol,
+            "trades": len(trades),
+            "win_rate": round(sum(1 for a in trades if a[5] > 0) / len(trades) * 100, 2) if trades else 0,
+            "profit": round(profit, 2),
+            "contribution": round(profit / abs(total_profit) * 100, 2) if total_profit else 0,
+            "skipped_trades": skipped.count(j),
+            "time_in_market": round(float((holdings[:, j] != 0).mean() * 100), 2),
+            "max_drawdown": round(float(pair_drawdowns[j] / request.initial_capital * 100), 2)
+        })
+    attribution.sort(key=lambda a: a["profit"], reverse=True)
+    
+    return {
+        "pairs": len(symbols),
+        "bars": n_bars,
+        "start": str(pd.Timestamp(index[0], unit="ms")),
+        "end": str(pd.Timestamp(index[-1], unit="ms")),
+        "initial_capital": request.initial_capital,
+        "final_capital": round(float(equity[-1]), 2),
+        "total_profit": round(float(total_profit), 2),
+        "roi": round(float(total_profit / request.initial_capital * 100), 2),
+        "max_drawdown": round(max_drawdown_pct(equity), 2),
+        "undiversified_drawdown": round(float(pair_drawdowns.sum() / request.initial_capital * 100), 2),
+        "sharpe_ratio": round(float(sharpe), 2),
+        "total_trades": len(accepted),
+        "win_rate": round(sum(1 for a in accepted if a[5] > 0) / len(accepted) * 100, 2) if accepted else 0,
+        "skipped_trades": len(skipped),
+        "max_concurrent_positions": max_concurrent,
+        "average_exposure": round(float(gross_exposure.mean() * 100), 2),
+        "max_exposure": round(float(gross_exposure.max() * 100), 2),
+        "correlation": return_correlations(close, listed_at, symbols),
+        "attribution": attribution,
+        "equity_curve": [round(e, 2) for e in equity[-50:].tolist()]  # Last 50 points
+    }
+
+async def portfolio_backtest(request, params: dict):
+    """Load every pair's history concurrently, align them and run the portfolio backtest off the event loop"""
+    semaphore = asyncio.Semaphore(PORTFOLIO_LOAD_CONCURRENCY)
+    
+    async def load(pair):
+        async with semaphore:
+            return await load_history_frame(pair, request.timeframe, request.start_date, request.end_date)
+    
+    pairs = list(dict.fromkeys(request.pairs))
+    frames = await asyncio.gather(*[load(pair) for pair in pairs])
+    usable = [(pair, df) for pair, df in zip(pairs, frames) if len(df) >= BACKTEST_WARMUP]
+    if not usable:
+        raise HTTPException(status_code=400, detail="Insufficient data for backtesting")
+    
+    symbols = [pair for pair, _ in usable]
+    index, cube, listed_at = align_ohlcv_frames([df for _, df in usable])
+    result = await asyncio.to_thread(run_portfolio_backtest, symbols, index, cube, listed_at, request.timeframe, request, params)
+    result["excluded_pairs"] = [pair for pair in pairs if pair not in symbols]
+    return result
+
+# Strategy optimizer: parameter sweeps on a process pool over prices in shared memory
+OPTIMIZER_MAX_WORKERS = os.cpu_count() or 2
+OPTIMIZER_BATCH_SIZE = 16  # parameter sets per task, to amortize IPC
+MAX_OPTIMIZER_EVALUATIONS = 5000
+MAX_KEPT_JOBS = 20
+
+DEFAULT_PARAM_GRID = {
+    "rsi_oversold": [25, 30, 35],
+    "rsi_overbought": [65, 70, 75],
+    "stop_atr": [1.5, 2.0, 2.5],
+    "target_atr": [2.0, 3.0, 4.0],
+    "min_confidence": [50, 60, 70]
+}
+
+RANKING_METRICS = {"roi": True, "win_rate": True, "sharpe_ratio": True, "total_profit": True, "max_drawdown": False}
+
+OPTIMIZATION_JOBS = {}  # job_id -> job dict (also used by the robustness engine)
+
+_worker_shm = None
+_worker_prices = None
+_worker_indicators = None
+
+def attach_price_arrays(shm_name: str, shape: tuple):
+    """Pool initializer: map the shared OHLCV block and compute indicators once per worker"""
+    global _worker_shm, _worker_prices, _worker_indicators
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_prices = np.ndarray(shape, dtype=np.float64, buffer=_worker_shm.buf)
+    _worker_indicators = IndicatorFrame(*_worker_prices)
+
+def evaluate_params_batch(param_sets: list, initial_capital: float):
+    """Worker task: backtest each parameter set against the shared price arrays"""
+    ind = _worker_indicators
+    results = []
+    for params in param_sets:
+        scores = compute_signal_series(ind, params)
+        trades, equity_curve, capital = simulate_trades(
+            ind.close, ind.atr, scores["signal"], scores["confidence"], BACKTEST_WARMUP, initial_capital, params
+        )
+        results.append({"params": params, **summarize_backtest(trades, equity_curve, capital, initial_capital)})
+    return results
+
+def validate_strategy_params(params: dict):
+    unknown = set(params) - set(DEFAULT_STRATEGY_PARAMS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown strategy parameters: {', '.join(sorted(unknown))}")
+
+def build_param_sets(method: str, grid: dict, n_samples: int, seed: int, base: dict = None):
+    validate_strategy_params(grid)
+    if any(not isinstance(values, list) or not values for values in grid.values()):
+        raise HTTPException(status_code=400, detail="Each parameter needs a non-empty list of values")
+    
+    keys = list(grid)
+    if method == "grid":
+        total = int(np.prod([len(grid[k]) for k in keys]))
+        if total > MAX_OPTIMIZER_EVALUATIONS:
+            raise HTTPException(status_code=400, detail=f"Grid has {total} combinations (max {MAX_OPTIMIZER_EVALUATIONS})")
+        combos = itertools.product(*(grid[k] for k in keys))
+    elif method == "random":
+        n_samples = min(n_samples, MAX_OPTIMIZER_EVALUATIONS)
+        rng = np.random.default_rng(seed)
+        columns = []
+        for k in keys:
+            low, high = min(grid[k]), max(grid[k])
+            if all(isinstance(v, int) for v in grid[k]):
+                columns.append(rng.integers(low, high + 1, size=n_samples).tolist())
+            else:
+                columns.append(np.round(rng.uniform(low, high, size=n_samples), 4).tolist())
+        combos = zip(*columns)
+    else:
+        raise HTTPException(status_code=400, detail="method must be 'grid' or 'random'")
+    
+    return [{**DEFAULT_STRATEGY_PARAMS, **(base or {}), **dict(zip(keys, combo))} for combo in combos]
+
+def rank_results(results: list, rank_by: str, swept: list, top: int):
+    descending = RANKING_METRICS[rank_by]
+    ranked = sorted(results, key=lambda r: r[rank_by], reverse=descending)[:top]
+    return [
+        {
+            "rank": i + 1,
+            "params": {k: r["params"][k] for k in swept},
+            "win_rate": r["win_rate"],
+            "roi": r["roi"],
+            "max_drawdown": r["max_drawdown"],
+            "sharpe_ratio": r["sharpe_ratio"],
+            "total_trades": r["total_trades"]
+        }
+        for i, r in enumerate(ranked)
+    ]
+
+async def load_price_matrix(pair: str, timeframe: str, start_date: str = None, end_date: str = None):
+    """OHLCV as a contiguous (5, n) float64 block, ready to copy into shared memory"""
+    if start_date and end_date:
+        df = await load_history_frame(pair, timeframe, start_date, end_date)
+    else:
+        df = await fetch_ohlcv(pair, timeframe, limit=MAX_KLINES_PER_REQUEST)
+    
+    if len(df) < BACKTEST_WARMUP:
+        raise HTTPException(status_code=400, detail="Insufficient data for backtesting")
+    return np.ascontiguousarray(df[["open", "high", "low", "close", "volume"]].to_numpy(dtype=np.float64).T)
+
+def run_in_process_pool(prices, max_workers: int):
+    """Copy prices into a new shared memory block and start a pool whose workers attach to it"""
+    shm = shared_memory.SharedMemory(create=True, size=prices.nbytes)
+    np.ndarray(prices.shape, dtype=np.float64, buffer=shm.buf)[:] = prices
+    executor = ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=attach_price_arrays,
+        initargs=(shm.name, prices.shape)
+    )
+    return shm, executor
+
+async def iter_pool_results(prices, max_workers: int, fn, batches: list, *args):
+    """Run fn(batch, *args) for every batch on a pool attached to `prices`, yielding results as batches complete.
+    
+    The pool and its shared memory block are torn down on completion, error or cancellation.
+    """
+    shm, executor = run_in_process_pool(prices, max_workers)
+    try:
+        futures = [asyncio.wrap_future(executor.submit(fn, batch, *args)) for batch in batches]
+        for future in asyncio.as_completed(futures):
+            yield await future
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        shm.close()
+        shm.unlink()
+
+def register_job(job: dict):
+    finished = [j for j in OPTIMIZATION_JOBS.values() if j["status"] in ("completed", "cancelled", "failed")]
+    for old in sorted(finished, key=lambda j: j["created_at"])[:max(0, len(OPTIMIZATION_JOBS) - MAX_KEPT_JOBS + 1)]:
+        OPTIMIZATION_JOBS.pop(old["job_id"], None)
+    OPTIMIZATION_JOBS[job["job_id"]] = job
+
+def get_owned_job(job_id: str, user: dict, kind: str = "optimize"):
+    job = OPTIMIZATION_JOBS.get(job_id)
+    if not job or job["kind"] != kind or (job["user_id"] != user["id"] and user["role"] != "admin"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def cancel_job(job: dict):
+    if job["status"] not in ("loading", "running"):
+        raise HTTPException(status_code=400, detail=f"Job already {job['status']}")
+    job["task"].cancel()
+    return {"message": "Cancellation requested", "job_id": job["job_id"]}
+
+async def run_job(job: dict, work):
+    """Await a job's work coroutine, recording how it ended"""
+    try:
+        await work
+        job["status"] = "completed"
+    except asyncio.CancelledError:
+        job["status"] = "cancelled"
+    except HTTPException as e:
+        job["status"] = "failed"
+        job["error"] = e.detail
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = time.time()
+
+async def run_optimization_job(job: dict, request: OptimizeRequest, param_sets: list):
+    prices = await load_price_matrix(request.pair, request.timeframe, request.start_date, request.end_date)
+    job["candles"] = prices.shape[1]
+    job["status"] = "running"
+    
+    workers = max(1, min(request.max_workers or OPTIMIZER_MAX_WORKERS, OPTIMIZER_MAX_WORKERS))
+    batches = [param_sets[i:i + OPTIMIZER_BATCH_SIZE] for i in range(0, len(param_sets), OPTIMIZER_BATCH_SIZE)]
+    async for results in iter_pool_results(prices, workers, evaluate_params_batch, batches, request.initial_capital):
+        job["results"].extend(results)
+        job["completed"] += len(results)
+
+def optimization_job_status(job: dict):
+    elapsed = (job.get("finished_at") or time.time()) - job["created_at"]
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "pair": job["pair"],
+        "timeframe": job["timeframe"],
+        "candles": job.get("candles"),
+        "total": job["total"],
+        "completed": job["completed"],
+        "progress": round(job["completed"] / job["total"] * 100, 1) if job["total"] else 100.0,
+        "elapsed_seconds": round(elapsed, 2),
+        "error": job.get("error"),
+        "results": rank_results(job["results"], job["rank_by"], job["swept"], job["top"])
+    }
+
+# Robustness engine: walk-forward and Monte Carlo runs on the optimizer's shared-memory process pool
+ROBUSTNESS_METHODS = ("walk_forward", "monte_carlo")
+MAX_MONTE_CARLO_SIMULATIONS = 20000
+MONTE_CARLO_BATCH_SIZE = 20  # bootstrap paths per task
+MAX_WALK_FORWARD_WINDOWS = 200
+POOL_STARTUP_SECONDS = 1.5  # spawn + import + per-worker indicator pass, for run-time estimates
+CALIBRATION_RUNS = 3
+DISTRIBUTION_METRICS = ("roi", "max_drawdown", "sharpe_ratio", "win_rate")
+
+def distribution(values):
+    """Summary statistics and percentiles of a metric across runs"""
+    v = np.asarray(values, dtype=np.float64)
+    if len(v) == 0:
+        return None
+    p5, p25, p50, p75, p95 = np.percentile(v, [5, 25, 50, 75, 95])
+    return {
+        "mean": round(float(v.mean()), 2), "std": round(float(v.std()), 2),
+        "min": round(float(v.min()), 2), "p5": round(float(p5), 2), "p25": round(float(p25), 2),
+        "median": round(float(p50), 2), "p75": round(float(p75), 2), "p95": round(float(p95), 2),
+        "max": round(float(v.max()), 2)
+    }
+
+def walk_forward_windows(n: int, train_size: int, test_size: int):
+    """Rolling (train_start, split, test_end) candle indices, stepping by one test window"""
+    windows = []
+    start = BACKTEST_WARMUP
+    while start + train_size + test_size <= n and len(windows) < MAX_WALK_FORWARD_WINDOWS:
+        windows.append((start, start + train_size, start + train_size + test_size))
+        start += test_size
+    return windows
+
+def backtest_window(ind: IndicatorFrame, scores: dict, start: int, end: int, initial_capital: float, params: dict):
+    """Backtest bars [start, end) only; indicators are causal, so earlier bars just serve as warm-up"""
+    trades, equity_curve, capital = simulate_trades(
+        ind.close[:end], ind.atr[:end], scores["signal"][:end], scores["confidence"][:end], start, initial_capital, params
+    )
+    summary = summarize_backtest(trades, equity_curve, capital, initial_capital)
+    return {k: summary[k] for k in (*DISTRIBUTION_METRICS, "total_trades")}
+
+def walk_forward_evaluation(ind: IndicatorFrame, params: dict, windows: list, initial_capital: float):
+    scores = compute_signal_series(ind, params)
+    return {
+        "params": params,
+        "train": [backtest_window(ind, scores, start, split, initial_capital, params) for start, split, _ in windows],
+        "test": [backtest_window(ind, scores, split, end, initial_capital, params) for _, split, end in windows]
+    }
+
+def evaluate_walk_forward_batch(param_sets: list, windows: list, initial_capital: float):
+    """Worker task: score each parameter set once, then backtest it on every train and test window"""
+    return [walk_forward_evaluation(_worker_indicators, params, windows, initial_capital) for params in param_sets]
+
+def bootstrap_price_path(prices, block_size: int, rng):
+    """Block-bootstrap whole candles, as ratios to the previous close, into a new OHLCV path of the same length"""
+    open_, high, low, close, volume = prices
+    m = len(close) - 1
+    block_size = max(1, min(block_size, m))
+    prev_close = close[:-1]
+    starts = rng.integers(0, m - block_size + 1, size=-(-m // block_size))
+    idx = (starts[:, None] + np.arange(block_size)).ravel()[:m]
+    
+    path = np.empty_like(prices)
+    path[:, 0] = prices[:, 0]
+    path[3, 1:] = close[0] * np.cumprod(close[1:][idx] / prev_close[idx])
+    new_prev = path[3, :-1]
+    path[0, 1:] = new_prev * (open_[1:][idx] / prev_close[idx])
+    path[1, 1:] = new_prev * (high[1:][idx] / prev_close[idx])
+    path[2, 1:] = new_prev * (low[1:][idx] / prev_close[idx])
+    path[4, 1:] = volume[1:][idx]
+    return path
+
+def bootstrap_simulation(prices, path_id: int, seed: int, block_size: int, params: dict, initial_capital: float):
+    # Seeded per path, so results don't depend on how paths are batched across workers
+    path = bootstrap_price_path(prices, block_size, np.random.default_rng([seed, path_id]))
+    ind = IndicatorFrame(*path)
+    return backtest_window(ind, compute_signal_series(ind, params), BACKTEST_WARMUP, len(ind), initial_capital, params)
+
+def simulate_bootstrap_batch(path_ids: list, seed: int, block_size: int, params: dict, initial_capital: float):
+    """Worker task: backtest the strategy on bootstrapped price paths"""
+    return [bootstrap_simulation(_worker_prices, i, seed, block_size, params, initial_capital) for i in path_ids]
+
+def resample_trades(equity_curve, simulations: int, initial_capital: float, seed: int):
+    """Monte Carlo over realized trades: redraw per-trade returns with replacement into alternative sequences"""
+    equity = np.asarray(equity_curve, dtype=np.float64)
+    returns = np.diff(equity) / equity[:-1]
+    if len(returns) == 0:
+        return None
+    
+    rng = np.random.default_rng(seed)
+    sampled = rng.choice(returns, size=(simulations, len(returns)), replace=True)
+    curves = initial_capital * np.cumprod(1 + sampled, axis=1)
+    curves = np.hstack([np.full((simulations, 1), initial_capital), curves])
+    peaks = np.maximum.accumulate(curves, axis=1)
+    roi = (curves[:, -1] / initial_capital - 1) * 100
+    std = sampled.std(axis=1, ddof=1) if len(returns) > 1 else np.zeros(simulations)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sharpe = np.where(std > 0, sampled.mean(axis=1) / std * np.sqrt(252), 0.0)
+    return {
+        "roi": distribution(roi),
+        "max_drawdown": distribution(((peaks - curves) / peaks * 100).max(axis=1)),
+        "sharpe_ratio": distribution(sharpe),
+        "probability_of_loss": round(float((roi < 0).mean() * 100), 2)
+    }
+
+def calibrate_robustness(method: str, prices, params: dict, param_sets: list, windows: list, request: RobustnessRequest):
+    """Time a few units of work in-process to estimate the run; Monte Carlo also backtests the real path as its baseline"""
+    ind = IndicatorFrame(*prices)
+    if method == "walk_forward":
+        unit = lambda i: walk_forward_evaluation(ind, param_sets[i % len(param_sets)], windows, request.initial_capital)
+        baseline = None
+    else:
+        unit = lambda i: bootstrap_simulation(prices, i, request.seed, request.block_size or 1, params, request.initial_capital)
+        scores = compute_signal_series(ind, params)
+        trades, equity_curve, capital = simulate_trades(
+            ind.close, ind.atr, scores["signal"], scores["confidence"], BACKTEST_WARMUP, request.initial_capital, params
+        )
+        baseline = summarize_backtest(trades, equity_curve, capital, request.initial_capital)
+        baseline["trade_resampling"] = resample_trades(equity_curve, request.simulations, request.initial_capital, request.seed)
+    
+    timings = []
+    for i in range(CALIBRATION_RUNS):
+        started = time.perf_counter()
+        unit(i)
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings)), baseline
+
+def summarize_walk_forward(job: dict):
+    """Pick the best in-sample parameters per window and report how they did out of sample"""
+    results, descending = job["results"], RANKING_METRICS[job["rank_by"]]
+    windows = []
+    for k, (start, split, end) in enumerate(job["windows"]):
+        pick = max if descending else min
+        best = pick(results, key=lambda r: r["train"][k][job["rank_by"]])
+        windows.append({
+            "window": k + 1,
+            "train_candles": [start, split],
+            "test_candles": [split, end],
+            "params": {name: best["params"][name] for name in job["swept"]},
+            "in_sample": best["train"][k],
+            "out_of_sample": best["test"][k]
+        })
+    
+    oos = [w["out_of_sample"] for w in windows]
+    in_sample_roi = np.mean([w["in_sample"]["roi"] for w in windows])
+    oos_roi = np.mean([o["roi"] for o in oos])
+    # Out-of-sample return per candle relative to in-sample return per candle
+    train_size, test_size = job["train_size"], job["test_size"]
+    efficiency = (oos_roi / test_size) / (in_sample_roi / train_size) if in_sample_roi > 0 else None
+    return {
+        "distributions": {m: distribution([o[m] for o in oos]) for m in DISTRIBUTION_METRICS},
+        "walk_forward_efficiency": round(float(efficiency), 2) if efficiency is not None else None,
+        "profitable_windows": sum(1 for o in oos if o["roi"] > 0),
+        "windows": windows
+    }
+
+def robustness_job_status(job: dict):
+    elapsed = (job.get("finished_at") or time.time()) - job["created_at"]
+    status = {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "method": job["method"],
+        "pair": job["pair"],
+        "timeframe": job["timeframe"],
+        "candles": job["candles"],
+        "total": job["total"],
+        "completed": job["completed"],
+        "progress": round(job["completed"] / job["total"] * 100, 1) if job["total"] else 100.0,
+        "estimated_seconds": job["estimated_seconds"],
+        "elapsed_seconds": round(elapsed, 2),
+        "error": job.get("error")
+    }
+    if job["method"] == "monte_carlo":
+        roi = [r["roi"] for r in job["results"]]
+        status["baseline"] = job["baseline"]
+        status["bootstrap"] = {
+            **{m: distribution([r[m] for r in job["results"]]) for m in DISTRIBUTION_METRICS},
+            "probability_of_loss": round(float(np.mean(np.asarray(roi) < 0) * 100), 2) if roi else None
+        }
+    elif job["status"] == "completed":
+        status["walk_forward"] = summarize_walk_forward(job)
+    return status
+
+async def run_robustness_job(job: dict, prices, batches: list, workers: int, args: tuple):
+    job["status"] = "running"
+    worker_fn = evaluate_walk_forward_batch if job["method"] == "walk_forward" else simulate_bootstrap_batch
+    async for results in iter_pool_results(prices, workers, worker_fn, batches, *args):
+        job["results"].extend(results)
+        job["completed"] += len(results)
+
+# API Routes
+@app.post("/api/auth/register")
+async def register(user: UserCreate):
+    password_hash = bcrypt.hashpw(user.password.encode(), bcrypt.gensalt()).decode()
+    subscription_date = None
+    if user.subscription_days:
+        subscription_date = (datetime.now() + timedelta(days=user.subscription_days)).isoformat()
+    
+    try:
+        with get_db() as conn:
+            conn.execute(
+                "INSERT INTO users (username, email, password_hash, role, subscription_expired_at) VALUES (?, ?, ?, ?, ?)",
+                (user.username, user.email, password_hash, user.role, subscription_date)
+            )
+        return {"message": "User created successfully"}
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=400, detail="Username or email already exists")
+
+@app.post("/api/auth/login")
+async def login(credentials: UserLogin):
+    with get_db() as conn:
+        user = conn.execute("SELECT * FROM users WHERE username = ?", (credentials.username,)).fetchone()
+    
+    if not user or not bcrypt.checkpw(credentials.password.encode(), user["password_hash"].encode()):
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    
+    token = create_token(user["id"], user["username"], user["role"])
+    return {
+        "access_token": token,
+        "token_type": "bearer",
+        "user": {
+            "id": user["id"],
+            "username": user["username"],
+            "email": user["email"],
+            "role": user["role"],
+            "status": user["status"]
+        }
+    }
+
+@app.get("/api/users/me")
+async def get_me(user: dict = Depends(get_current_user)):
+    return user
+
+@app.get("/api/users")
+async def list_users(user: dict = Depends(get_current_user)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    with get_db() as conn:
+        users = conn.execute("SELECT id, username, email, role, status, subscription_expired_at, created_at FROM users").fetchall()
+    return [dict(u) for u in users]
+
+@app.put("/api/users/{user_id}")
+async def update_user(user_id: int, update: UserUpdate, current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    updates = []
+    params = []
+    if update.email:
+        updates.append("email = ?")
+        params.append(update.email)
+    if update.role:
+        updates.append("role = ?")
+        params.append(update.role)
+    if update.status:
+        updates.append("status = ?")
+        params.append(update.status)
+    if update.subscription_days:
+        new_date = (datetime.now() + timedelta(days=update.subscription_days)).isoformat()
+        updates.append("subscription_expired_at = ?")
+        params.append(new_date)
+    
+    if not updates:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    
+    params.append(user_id)
+    with get_db() as conn:
+        conn.execute(f"UPDATE users SET {', '.join(updates)} WHERE id = ?", params)
+    
+    return {"message": "User updated successfully"}
+
+@app.delete("/api/users/{user_id}")
+async def delete_user(user_id: int, current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    with get_db() as conn:
+        conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    return {"message": "User deleted successfully"}
+
+@app.get("/api/trading/pairs")
+async def get_trading_pairs():
+    """Get available trading pairs from the cached catalog (refreshed in the background)"""
+    return {"pairs": PAIR_CATALOG.get_pairs()}
+
+@app.get("/api/trading/pairs/{symbol}")
+async def get_trading_pair_metadata(symbol: str):
+    """Exchange metadata (status, tick size, lot size...) for one symbol, e.g. BTCUSDT"""
+    metadata = PAIR_CATALOG.get_symbol(symbol)
+    if not metadata:
+        raise HTTPException(status_code=404, detail="Unknown trading pair")
+    return metadata
+
+@app.post("/api/trading/analyze")
+async def analyze_trading(request: AnalysisRequest, user: dict = Depends(check_subscription)):
+    try:
+        analysis = get_signal_snapshot(request.pair, request.timeframe) or await analyze_pair(request.pair, request.timeframe)
+        if request.multi_timeframe:
+            timeframes = list(dict.fromkeys([request.timeframe, *MULTI_TIMEFRAMES]))
+            analysis = {**analysis, "multi_timeframe": await multi_timeframe_analysis(request.pair, timeframes)}
+        
+        # Save to history
+        await save_analyses(user["id"], [{"pair": request.pair, "timeframe": request.timeframe, **analysis}])
+        
+        return analysis
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+@app.post("/api/trading/analyze/batch")
+async def analyze_trading_batch(request: BatchAnalysisRequest, user: dict = Depends(check_subscription)):
+    jobs = list(dict.fromkeys((pair, tf) for pair in request.pairs for tf in request.timeframes))
+    if not jobs:
+        raise HTTPException(status_code=400, detail="At least one pair and timeframe required")
+    if len(jobs) > MAX_BATCH_ANALYSES:
+        raise HTTPException(status_code=400, detail=f"Batch limited to {MAX_BATCH_ANALYSES} pair/timeframe combinations")
+    
+    concurrency = min(request.max_concurrency or BATCH_ANALYSIS_CONCURRENCY, BATCH_ANALYSIS_CONCURRENCY * 4)
+    started = time.perf_counter()
+    
+    if request.stream:
+        async def ndjson_lines():
+            results = []
+            try:
+                async for result in iter_batch_analyses(jobs, concurrency):
+                    results.append(result)
+                    # NaN/inf become null: bare NaN is not valid JSON
+                    yield json.dumps(json_safe({"type": "result", **result}), allow_nan=False) + "\n"
+            finally:
+                # Also on client disconnect, so results already computed are kept
+                await save_analyses(user["id"], results)
+            yield json.dumps(json_safe({"type": "summary", **batch_summary(results, started)}), allow_nan=False) + "\n"
+        
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+    
+    results = [result async for result in iter_batch_analyses(jobs, concurrency)]
+    await save_analyses(user["id"], results)
+    return json_safe(batch_summary(results, started))
+
+@app.post("/api/trading/backtest/portfolio")
+async def backtest_portfolio(request: PortfolioBacktestRequest, user: dict = Depends(check_subscription)):
+    if not request.pairs or len(request.pairs) > MAX_PORTFOLIO_PAIRS:
+        raise HTTPException(status_code=400, detail=f"Provide between 1 and {MAX_PORTFOLIO_PAIRS} pairs")
+    if request.max_positions < 1 or not 0 < request.max_position_pct <= request.max_gross_exposure:
+        raise HTTPException(status_code=400, detail="Need max_positions >= 1 and 0 < max_position_pct <= max_gross_exposure")
+    validate_strategy_params(request.params or {})
+    return await portfolio_backtest(request, {**DEFAULT_STRATEGY_PARAMS, **(request.params or {})})
+
+@app.post("/api/trading/optimize")
+async def start_optimization(request: OptimizeRequest, user: dict = Depends(check_subscription)):
+    if request.rank_by not in RANKING_METRICS:
+        raise HTTPException(status_code=400, detail=f"rank_by must be one of: {', '.join(RANKING_METRICS)}")
+    
+    grid = request.param_grid or DEFAULT_PARAM_GRID
+    param_sets = build_param_sets(request.method, grid, request.n_samples or 0, request.seed)
+    if not param_sets:
+        raise HTTPException(status_code=400, detail="No parameter combinations to evaluate")
+    
+    job = {
+        "job_id": secrets.token_hex(8),
+        "kind": "optimize",
+        "user_id": user["id"],
+        "status": "loading",
+        "pair": request.pair,
+        "timeframe": request.timeframe,
+        "total": len(param_sets),
+        "completed": 0,
+        "results": [],
+        "swept": list(grid),
+        "rank_by": request.rank_by,
+        "top": request.top or 20,
+        "created_at": time.time()
+    }
+    register_job(job)
+    job["task"] = asyncio.create_task(run_job(job, run_optimization_job(job, request, param_sets)))
+    return optimization_job_status(job)
+
+@app.get("/api/trading/optimize/{job_id}")
+async def get_optimization(job_id: str, user: dict = Depends(check_subscription)):
+    return optimization_job_status(get_owned_job(job_id, user))
+
+@app.delete("/api/trading/optimize/{job_id}")
+async def cancel_optimization(job_id: str, user: dict = Depends(check_subscription)):
+    return cancel_job(get_owned_job(job_id, user))
+
+@app.post("/api/trading/robustness")
+async def start_robustness(request: RobustnessRequest, user: dict = Depends(check_subscription)):
+    if request.method not in ROBUSTNESS_METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of: {', '.join(ROBUSTNESS_METHODS)}")
+    if request.rank_by not in RANKING_METRICS:
+        raise HTTPException(status_code=400, detail=f"rank_by must be one of: {', '.join(RANKING_METRICS)}")
+    validate_strategy_params(request.params or {})
+    params = {**DEFAULT_STRATEGY_PARAMS, **(request.params or {})}
+    
+    prices = await load_price_matrix(request.pair, request.timeframe, request.start_date, request.end_date)
+    workers = max(1, min(request.max_workers or OPTIMIZER_MAX_WORKERS, OPTIMIZER_MAX_WORKERS))
+    
+    if request.method == "walk_forward":
+        if (request.train_size or 0) < 1 or (request.test_size or 0) < 1:
+            raise HTTPException(status_code=400, detail="train_size and test_size must be positive")
+        windows = walk_forward_windows(prices.shape[1], request.train_size, request.test_size)
+        if not windows:
+            raise HTTPException(status_code=400, detail="Not enough candles for one train + test window")
+        grid = DEFAULT_PARAM_GRID if request.param_grid is None else request.param_grid
+        param_sets = build_param_sets("grid", grid, 0, request.seed, base=request.params)
+        units = param_sets
+        batches = [param_sets[i:i + OPTIMIZER_BATCH_SIZE] for i in range(0, len(param_sets), OPTIMIZER_BATCH_SIZE)]
+        args = (windows, request.initial_capital)
+    else:
+        if not 1 <= (request.simulations or 0) <= MAX_MONTE_CARLO_SIMULATIONS:
+            raise HTTPException(status_code=400, detail=f"simulations must be between 1 and {MAX_MONTE_CARLO_SIMULATIONS}")
+        windows, grid, param_sets = [], {}, []
+        units = list(range(request.simulations))
+        batches = [units[i:i + MONTE_CARLO_BATCH_SIZE] for i in range(0, len(units), MONTE_CARLO_BATCH_SIZE)]
+        args = (request.seed, request.block_size or 1, params, request.initial_capital)
+    
+    unit_seconds, baseline = await asyncio.to_thread(
+        calibrate_robustness, request.method, prices, params, param_sets, windows, request
+    )
+    estimate = {
+        "method": request.method,
+        "candles": prices.shape[1],
+        "total": len(units),
+        "workers": workers,
+        "seconds_per_run": round(unit_seconds, 4),
+        "estimated_seconds": round(POOL_STARTUP_SECONDS + unit_seconds * len(units) / workers, 1)
+    }
+    if request.estimate_only:
+        return estimate
+    
+    job = {
+        "job_id": secrets.token_hex(8),
+        "kind": "robustness",
+        "user_id": user["id"],
+        "status": "loading",
+        "method": request.method,
+        "pair": request.pair,
+        "timeframe": request.timeframe,
+        "candles": prices.shape[1],
+        "total": len(units),
+        "completed": 0,
+        "results": [],
+        "estimated_seconds": estimate["estimated_seconds"],
+        "baseline": baseline,
+        "windows": windows,
+        "swept": list(grid),
+        "rank_by": request.rank_by,
+        "train_size": request.train_size,
+        "test_size": request.test_size,
+        "created_at": time.time()
+    }
+    register_job(job)
+    job["task"] = asyncio.create_task(run_job(job, run_robustness_job(job, prices, batches, workers, args)))
+    return robustness_job_status(job)
+
+@app.get("/api/trading/robustness/{job_id}")
+async def get_robustness(job_id: str, user: dict = Depends(check_subscription)):
+    return robustness_job_status(get_owned_job(job_id, user, kind="robustness"))
+
+@app.delete("/api/trading/robustness/{job_id}")
+async def cancel_robustness(job_id: str, user: dict = Depends(check_subscription)):
+    return cancel_job(get_owned_job(job_id, user, kind="robustness"))
+
+@app.get("/api/analytics/dashboard")
+async def get_dashboard(recent_limit: int = 10, recent_cursor: Optional[str] = None,
+                        user: dict = Depends(get_current_user)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    def query_dashboard():
+        HISTORY_WRITER.flush()
+        with get_db() as conn:
+            user_counts = conn.execute("SELECT role, status, count FROM user_counts WHERE count != 0").fetchall()
+            total_analyses = conn.execute("SELECT count FROM rollup_totals WHERE name = 'analyses'").fetchone()["count"]
+        recent_analyses, next_cursor = fetch_history_page("", (), max(1, min(recent_limit, MAX_PAGE_SIZE)), recent_cursor)
+        
+        users_by_status, users_by_role = {}, {}
+        for row in user_counts:
+            users_by_status[row["status"]] = users_by_status.get(row["status"], 0) + row["count"]
+            users_by_role[row["role"]] = users_by_role.get(row["role"], 0) + row["count"]
+        
+        return {
+            "total_users": sum(users_by_status.values()),
+            "active_users": users_by_status.get("active", 0),
+            "users_by_status": users_by_status,
+            "users_by_role": users_by_role,
+            "total_analyses": total_analyses,
+            "recent_analyses": recent_analyses,
+            "recent_next_cursor": next_cursor
+        }
+    
+    return await run_db(query_dashboard)
+
+@app.get("/api/analytics/history")
+async def get_analysis_history(response: Response, limit: Optional[int] = None, cursor: Optional[str] = None,
+                               pair: Optional[str] = None, timeframe: Optional[str] = None, signal: Optional[str] = None,
+                               start_date: Optional[str] = None, end_date: Optional[str] = None,
+                               user: dict = Depends(get_current_user)):
+    """Newest-first history page; pass the X-Next-Cursor response header back as `cursor` for the next page"""
+    limit = max(1, min(limit or (100 if user["role"] == "admin" else 50), MAX_PAGE_SIZE))
+    where, params = history_filters(
+        user, pair=pair, timeframe=timeframe, signal=signal, start_date=start_date, end_date=end_date
+    )
+    await run_db(HISTORY_WRITER.flush)
+    history, next_cursor = await run_db(fetch_history_page, where, params, limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return history
+
+INDICATOR_STATS_GROUPS = ("signal", "market_condition", "strength", "pair", "timeframe")
+
+def history_filters(user: dict, **filters):
+    """WHERE clause and params for analysis_history; members only ever see their own rows"""
+    clauses, params = [], []
+    if user["role"] != "admin":
+        clauses.append("user_id = ?")
+        params.append(user["id"])
+    conditions = {
+        "pair": "pair = ?", "timeframe": "timeframe = ?", "signal": "signal = ?",
+        "market_condition": "market_condition = ?", "min_score": "score >= ?",
+        "min_rsi": "rsi >= ?", "max_rsi": "rsi <= ?",
+        "start_date": "created_at >= ?", "end_date": "created_at <= ?"
+    }
+    for name, value in filters.items():
+        if value is not None:
+            clauses.append(conditions[name])
+            params.append(to_db_timestamp(value) if name.endswith("_date") else value)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), tuple(params)
+
+def to_db_timestamp(value: str) -> str:
+    """ISO date/datetime -> the 'YYYY-MM-DD HH:MM:SS' UTC text SQLite's CURRENT_TIMESTAMP produces"""
+    try:
+        ts = pd.Timestamp(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return ts.strftime("%Y-%m-%d %H:%M:%S")
+
+# Keyset pagination: the cursor is the (created_at, id) of the last row served, so every page is an index seek
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(row: dict) -> str:
+    return base64.urlsafe_b64encode(f"{row['created_at']}|{row['id']}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().rsplit("|", 1)
+        return created_at, int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def fetch_history_page(where: str, params: tuple, limit: int, cursor: str = None):
+    """One newest-first page of analysis_history plus the cursor for the next page (None on the last page)"""
+    if cursor:
+        where += (" AND " if where else " WHERE ") + "(created_at, id) < (?, ?)"
+        params += decode_cursor(cursor)
+    rows = fetch_all(
+        f"SELECT * FROM analysis_history{where} ORDER BY created_at DESC, id DESC LIMIT ?", params + (limit + 1,)
+    )
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [decode_history_row(row) for row in rows[:limit]], next_cursor
+
+@app.get("/api/analytics/indicators")
+async def get_indicator_stats(group_by: str = "signal", pair: Optional[str] = None, timeframe: Optional[str] = None,
+                              signal: Optional[str] = None, market_condition: Optional[str] = None,
+                              min_score: Optional[int] = None, min_rsi: Optional[float] = None,
+                              max_rsi: Optional[float] = None, user: dict = Depends(get_current_user)):
+    if group_by not in INDICATOR_STATS_GROUPS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of: {', '.join(INDICATOR_STATS_GROUPS)}")
+    
+    where, params = history_filters(
+        user, pair=pair, timeframe=timeframe, signal=signal, market_condition=market_condition,
+        min_score=min_score, min_rsi=min_rsi, max_rsi=max_rsi
+    )
+    await run_db(HISTORY_WRITER.flush)
+    rows = await run_db(fetch_all, f"""
+        SELECT {group_by} AS bucket, COUNT(*) AS analyses, AVG(score) AS avg_score, AVG(rsi) AS avg_rsi,
+               MIN(rsi) AS min_rsi, MAX(rsi) AS max_rsi, AVG(volume_ratio) AS avg_volume_ratio
+        FROM analysis_history{where}
+        GROUP BY {group_by} ORDER BY analyses DESC
+    """, params)
+    return {"group_by": group_by, "groups": rows}
+
+# Chart series straight from analysis_rollup: bucket -> SQL expression over the rollup row
+SIGNAL_SERIES_BUCKETS = {"hour": "hour", "day": "substr(hour, 1, 10)", "pair": "pair", "signal": "signal", "user": "user_id"}
+
+@app.get("/api/analytics/signals")
+async def get_signal_series(bucket: str = "hour", pair: Optional[str] = None, signal: Optional[str] = None,
+                            start_date: Optional[str] = None, end_date: Optional[str] = None,
+                            user: dict = Depends(get_current_user)):
+    """Analysis counts per bucket, split by signal (e.g. signals per hour); members only see their own"""
+    if bucket not in SIGNAL_SERIES_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of: {', '.join(SIGNAL_SERIES_BUCKETS)}")
+    
+    clauses, params = [], []
+    if user["role"] != "admin":
+        clauses.append("user_id = ?")
+        params.append(user["id"])
+    for column, value in (("pair", pair), ("signal", signal)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    # Rollup rows are hourly, so date bounds round to the hour
+    if start_date is not None:
+        clauses.append("hour >= ?")
+        params.append(to_db_timestamp(start_date)[:13] + ":00:00")
+    if end_date is not None:
+        clauses.append("hour <= ?")
+        params.append(to_db_timestamp(end_date))
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    
+    expr = SIGNAL_SERIES_BUCKETS[bucket]
+    await run_db(HISTORY_WRITER.flush)
+    rows = await run_db(fetch_all, f"""
+        SELECT {expr} AS bucket, signal, SUM(count) AS count FROM analysis_rollup{where}
+        GROUP BY {expr}, signal HAVING SUM(count) != 0
+    """, tuple(params))
+    
+    series = {}
+    for row in rows:
+        point = series.setdefault(row["bucket"], {"bucket": row["bucket"], "total": 0, "signals": {}})
+        point["signals"][row["signal"]] = row["count"]
+        point["total"] += row["count"]
+    points = list(series.values())
+    if bucket in ("hour", "day"):
+        points.sort(key=lambda p: p["bucket"])
+    else:
+        points.sort(key=lambda p: -p["total"])
+    return {"bucket": bucket, "series": points}
+
+@app.post("/api/analytics/rollups/reconcile")
+async def reconcile_dashboard_rollups(user: dict = Depends(get_current_user)):
+    """Rebuild the dashboard rollups from the base tables and report how many counters had drifted"""
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    await run_db(HISTORY_WRITER.flush)
+    return await run_db(reconcile_rollups)
+
+@app.get("/api/system/metrics")
+async def get_system_metrics(user: dict = Depends(get_current_user)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return {
+        "fetch_coalescing": dict(COALESCE_STATS),
+        "ohlcv_cache": OHLCV_CACHE.get_stats(),
+        "providers": MARKET_ROUTER.get_status(),
+        "scanner": scanner_metrics(),
+        "database": [pool.get_stats() for pool in _db_pools.values()],
+        "history_writer": HISTORY_WRITER.get_stats()
+    }
+
+@app.get("/")
+async def root():
+    return {
+        "message": "Crypto Trading DSS API",
+        "version": "1.0.0",
+        "docs": "/docs",
+        "status": "online"
+    }
+
+@app.post("/api/auth/register")
+async def register(user: UserCreate, background_tasks: BackgroundTasks):
+    password_hash = bcrypt.hashpw(user.password.encode(), bcrypt.gensalt()).decode()
+    subscription_date = None
+    if user.subscription_days:
+        subscription_date = (datetime.now() + timedelta(days=user.subscription_days)).isoformat()
+    
+    # Generate verification token
+    verification_token = secrets.token_urlsafe(32)
+    
+    try:
+        with get_db() as conn:
+            cursor = conn.execute(
+                """INSERT INTO users (username, email, password_hash, role, subscription_expired_at, 
+                   email_verified, verification_token, status) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (user.username, user.email, password_hash, user.role, subscription_date, 0, verification_token, 'pending')
+            )
+            user_id = cursor.lastrowid
+        
+        # Send verification email
+        verification_link = f"http://localhost:3000/verify?token={verification_token}"
+        email_body = f"""
+        <html>
+        <body>
+            <h2>Welcome to CryptoDSS!</h2>
+            <p>Please verify your email by clicking the link below:</p>
+            <a href="{verification_link}">Verify Email</a>
+            <p>Or copy this link: {verification_link}</p>
+        </body>
+        </html>
+        """
+        background_tasks.add_task(send_email, user.email, "Verify Your Email - CryptoDSS", email_body)
+        
+        return {"message": "User created. Please check your email to verify your account.", "user_id": user_id}
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=400, detail="Username or email already exists")
+
+@app.post("/api/auth/verify-email")
+async def verify_email(verification: EmailVerification):
+    with get_db() as conn:
+        user = conn.execute(
+            "SELECT * FROM users WHERE verification_token = ?", 
+            (verification.token,)
+        ).fetchone()
+        
+        if not user:
+            raise HTTPException(status_code=400, detail="Invalid verification token")
+        
+        if user['email_verified']:
+            return {"message": "Email already verified"}
+        
+        conn.execute(
+            "UPDATE users SET email_verified = 1, status = 'active', verification_token = NULL WHERE id = ?",
+            (user['id'],)
+        )
+    
+    return {"message": "Email verified successfully"}
+
+@app.post("/api/auth/forgot-password")
+async def forgot_password(request: PasswordResetRequest, background_tasks: BackgroundTasks):
+    with get_db() as conn:
+        user = conn.execute("SELECT * FROM users WHERE email = ?", (request.email,)).fetchone()
+        
+        if not user:
+            # Don't reveal if email exists
+            return {"message": "If the email exists, a reset link will be sent"}
+        
+        # Generate reset token
+        reset_token = secrets.token_urlsafe(32)
+        reset_expires = (datetime.now() + timedelta(hours=1)).isoformat()
+        
+        conn.execute(
+            "UPDATE users SET reset_token = ?, reset_token_expires = ? WHERE id = ?",
+            (reset_token, reset_expires, user['id'])
+        )
+    
+    # Send reset email
+    reset_link = f"http://localhost:3000/reset-password?token={reset_token}"
+    email_body = f"""
+    <html>
+    <body>
+        <h2>Password Reset Request</h2>
+        <p>Click the link below to reset your password:</p>
+        <a href="{reset_link}">Reset Password</a>
+        <p>This link expires in 1 hour.</p>
+        <p>If you didn't request this, please ignore this email.</p>
+    </body>
+    </html>
+    """
+    background_tasks.add_task(send_email, request.email, "Password Reset - CryptoDSS", email_body)
+    
+    return {"message": "If the email exists, a reset link will be sent"}
+
+@app.post("/api/auth/reset-password")
+async def reset_password(reset: PasswordReset):
+    with get_db() as conn:
+        user = conn.execute(
+            "SELECT * FROM users WHERE reset_token = ?",
+            (reset.token,)
+        ).fetchone()
+        
+        if not user:
+            raise HTTPException(status_code=400, detail="Invalid reset token")
+        
+        # Check expiration
+        if user['reset_token_expires']:
+            expires = datetime.fromisoformat(user['reset_token_expires'])
+            if datetime.now() > expires:
+                raise HTTPException(status_code=400, detail="Reset token expired")
+        
+        # Update password
+        password_hash = bcrypt.hashpw(reset.new_password.encode(), bcrypt.gensalt()).decode()
+        conn.execute(
+            "UPDATE users SET password_hash = ?, reset_token = NULL, reset_token_expires = NULL WHERE id = ?",
+            (password_hash, user['id'])
+        )
+    
+    return {"message": "Password reset successfully"}
+
+if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=2401)
\ No newline at end of file
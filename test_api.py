@@ -1,248 +1,791 @@
-#!/usr/bin/env python3
-"""
-Test script to verify all crypto APIs are working
-"""
-
-import requests
-import time
-from datetime import datetime
-import urllib3
-
-# Disable SSL warnings
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-def test_binance_futures():
-    """Test Binance Futures API (fapi)"""
-    print("\n🔍 Testing Binance Futures API...")
-    try:
-        url = "https://fapi.binance.com/fapi/v1/klines"
-        params = {
-            "symbol": "BTCUSDT",
-            "interval": "1h",
-            "limit": 5
-        }
-        
-        start_time = time.time()
-        # Disable SSL verification
-        response = requests.get(url, params=params, timeout=10, verify=False)
-        elapsed = time.time() - start_time
-        
-        if response.status_code == 200:
-            data = response.json()
-            latest_close = float(data[-1][4])
-            print(f"✅ SUCCESS - BTC Price: ${latest_close:,.2f}")
-            print(f"   Response time: {elapsed:.2f}s")
-            print(f"   Data points: {len(data)}")
-            return True
-        else:
-            print(f"❌ FAILED - Status: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ ERROR - {str(e)}")
-        return False
-
-def test_binance_spot():
-    """Test Binance Spot API"""
-    print("\n🔍 Testing Binance Spot API...")
-    try:
-        url = "https://api.binance.com/api/v3/klines"
-        params = {
-            "symbol": "BTCUSDT",
-            "interval": "1h",
-            "limit": 5
-        }
-        
-        start_time = time.time()
-        response = requests.get(url, params=params, timeout=10)
-        elapsed = time.time() - start_time
-        
-        if response.status_code == 200:
-            data = response.json()
-            latest_close = float(data[-1][4])
-            print(f"✅ SUCCESS - BTC Price: ${latest_close:,.2f}")
-            print(f"   Response time: {elapsed:.2f}s")
-            print(f"   Data points: {len(data)}")
-            return True
-        else:
-            print(f"❌ FAILED - Status: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ ERROR - {str(e)}")
-        return False
-
-def test_bybit():
-    """Test Bybit API"""
-    print("\n🔍 Testing Bybit API...")
-    try:
-        url = "https://api.bybit.com/v5/market/kline"
-        params = {
-            "category": "linear",
-            "symbol": "BTCUSDT",
-            "interval": "60",
-            "limit": 5
-        }
-        
-        start_time = time.time()
-        response = requests.get(url, params=params, timeout=10)
-        elapsed = time.time() - start_time
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('retCode') == 0:
-                klines = data['result']['list']
-                latest_close = float(klines[0][4])
-                print(f"✅ SUCCESS - BTC Price: ${latest_close:,.2f}")
-                print(f"   Response time: {elapsed:.2f}s")
-                print(f"   Data points: {len(klines)}")
-                return True
-        print(f"❌ FAILED - Status: {response.status_code}")
-        return False
-    except Exception as e:
-        print(f"❌ ERROR - {str(e)}")
-        return False
-
-def test_okx():
-    """Test OKX API"""
-    print("\n🔍 Testing OKX API...")
-    try:
-        url = "https://www.okx.com/api/v5/market/candles"
-        params = {
-            "instId": "BTC-USDT",
-            "bar": "1H",
-            "limit": 5
-        }
-        
-        start_time = time.time()
-        response = requests.get(url, params=params, timeout=10)
-        elapsed = time.time() - start_time
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('code') == '0':
-                klines = data['data']
-                latest_close = float(klines[0][4])
-                print(f"✅ SUCCESS - BTC Price: ${latest_close:,.2f}")
-                print(f"   Response time: {elapsed:.2f}s")
-                print(f"   Data points: {len(klines)}")
-                return True
-        print(f"❌ FAILED - Status: {response.status_code}")
-        return False
-    except Exception as e:
-        print(f"❌ ERROR - {str(e)}")
-        return False
-
-def test_coingecko():
-    """Test CoinGecko API"""
-    print("\n🔍 Testing CoinGecko API...")
-    try:
-        url = "https://api.coingecko.com/api/v3/simple/price"
-        params = {
-            "ids": "bitcoin",
-            "vs_currencies": "usd"
-        }
-        
-        start_time = time.time()
-        response = requests.get(url, params=params, timeout=10)
-        elapsed = time.time() - start_time
-        
-        if response.status_code == 200:
-            data = response.json()
-            btc_price = data['bitcoin']['usd']
-            print(f"✅ SUCCESS - BTC Price: ${btc_price:,.2f}")
-            print(f"   Response time: {elapsed:.2f}s")
-            print(f"   ⚠️  Note: This is current price only, not OHLC data")
-            return True
-        else:
-            print(f"❌ FAILED - Status: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ ERROR - {str(e)}")
-        return False
-
-def test_backend_api():
-    """Test our own backend API"""
-    print("\n🔍 Testing Backend API (Trading Pairs)...")
-    try:
-        url = "http://localhost:8000/api/trading/pairs"
-        
-        start_time = time.time()
-        response = requests.get(url, timeout=10)
-        elapsed = time.time() - start_time
-        
-        if response.status_code == 200:
-            data = response.json()
-            pairs = data.get('pairs', [])
-            print(f"✅ SUCCESS - {len(pairs)} pairs available")
-            print(f"   Response time: {elapsed:.2f}s")
-            print(f"   Sample pairs: {', '.join(pairs[:5])}")
-            return True
-        else:
-            print(f"❌ FAILED - Status: {response.status_code}")
-            print(f"   Make sure backend is running: python main.py")
-            return False
-    except requests.exceptions.ConnectionError:
-        print(f"❌ ERROR - Backend not running")
-        print(f"   Start backend: python main.py")
-        return False
-    except Exception as e:
-        print(f"❌ ERROR - {str(e)}")
-        return False
-
-def main():
-    print("=" * 60)
-    print("🚀 Crypto API Testing Script")
-    print("=" * 60)
-    print(f"📅 Test Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    
-    results = {}
-    
-    # Test all APIs
-    results['Binance Futures'] = test_binance_futures()
-    time.sleep(1)  # Avoid rate limiting
-    
-    results['Binance Spot'] = test_binance_spot()
-    time.sleep(1)
-    
-    results['Bybit'] = test_bybit()
-    time.sleep(1)
-    
-    results['OKX'] = test_okx()
-    time.sleep(1)
-    
-    results['CoinGecko'] = test_coingecko()
-    time.sleep(1)
-    
-    results['Backend'] = test_backend_api()
-    
-    # Summary
-    print("\n" + "=" * 60)
-    print("📊 SUMMARY")
-    print("=" * 60)
-    
-    working = sum(1 for v in results.values() if v)
-    total = len(results)
-    
-    for api, status in results.items():
-        status_icon = "✅" if status else "❌"
-        print(f"{status_icon} {api}: {'Working' if status else 'Failed'}")
-    
-    print("\n" + "=" * 60)
-    print(f"✅ Working: {working}/{total} APIs")
-    print(f"❌ Failed: {total - working}/{total} APIs")
-    print("=" * 60)
-    
-    if results.get('Binance Futures') or results.get('Binance Spot'):
-        print("\n✅ Your system should work! At least one API is accessible.")
-    else:
-        print("\n⚠️  Warning: Primary APIs are down!")
-        print("   System will use mock data for demo purposes.")
-    
-    if not results.get('Backend'):
-        print("\n❌ Backend is not running!")
-        print("   Start it with: python main.py")
-    
-    print("\n🎯 Recommended: Use Binance Futures API (fapi) - Most reliable!")
-    print("=" * 60)
-
-if __name__ == "__main__":
+#!/usr/bin/env python3
+"""
+Test script to verify all crypto APIs are working
+"""
+
+import requests
+import time
+import json
+import threading
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+import urllib3
+
+# Disable SSL warnings
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+def test_binance_futures():
+    """Test Binance Futures API (fapi)"""
+    print("\n🔍 Testing Binance Futures API...")
+    try:
+        url = "https://fapi.binance.com/fapi/v1/klines"
+        params = {
+            "symbol": "BTCUSDT",
+            "interval": "1h",
+            "limit": 5
+        }
+        
+        start_time = time.time()
+        # Disable SSL verification
+        response = requests.get(url, params=params, timeout=10, verify=False)
+        elapsed = time.time() - start_time
+        
+        if response.status_code == 200:
+            data = response.json()
+            latest_close = float(data[-1][4])
+            print(f"✅ SUCCESS - BTC Price: ${latest_close:,.2f}")
+            print(f"   Response time: {elapsed:.2f}s")
+            print(f"   Data points: {len(data)}")
+            return True
+        else:
+            print(f"❌ FAILED - Status: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ ERROR - {str(e)}")
+        return False
+
+def test_binance_spot():
+    """Test Binance Spot API"""
+    print("\n🔍 Testing Binance Spot API...")
+    try:
+        url = "https://api.binance.com/api/v3/klines"
+        params = {
+            "symbol": "BTCUSDT",
+            "interval": "1h",
+            "limit": 5
+        }
+        
+        start_time = time.time()
+        response = requests.get(url, params=params, timeout=10)
+        elapsed = time.time() - start_time
+        
+        if response.status_code == 200:
+            data = response.json()
+            latest_close = float(data[-1][4])
+            print(f"✅ SUCCESS - BTC Price: ${latest_close:,.2f}")
+            print(f"   Response time: {elapsed:.2f}s")
+            print(f"   Data points: {len(data)}")
+            return True
+        else:
+            print(f"❌ FAILED - Status: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ ERROR - {str(e)}")
+        return False
+
+def test_bybit():
+    """Test Bybit API"""
+    print("\n🔍 Testing Bybit API...")
+    try:
+        url = "https://api.bybit.com/v5/market/kline"
+        params = {
+            "category": "linear",
+            "symbol": "BTCUSDT",
+            "interval": "60",
+            "limit": 5
+        }
+        
+        start_time = time.time()
+        response = requests.get(url, params=params, timeout=10)
+        elapsed = time.time() - start_time
+        
+        if response.status_code == 200:
+            data = response.json()
+            if data.get('retCode') == 0:
+                klines = data['result']['list']
+                latest_close = float(klines[0][4])
+                print(f"✅ SUCCESS - BTC Price: ${latest_close:,.2f}")
+                print(f"   Response time: {elapsed:.2f}s")
+                print(f"   Data points: {len(klines)}")
+                return True
+        print(f"❌ FAILED - Status: {response.status_code}")
+        return False
+    except Exception as e:
+        print(f"❌ ERROR - {str(e)}")
+        return False
+
+def test_okx():
+    """Test OKX API"""
+    print("\n🔍 Testing OKX API...")
+    try:
+        url = "https://www.okx.com/api/v5/market/candles"
+        params = {
+            "instId": "BTC-USDT",
+            "bar": "1H",
+            "limit": 5
+        }
+        
+        start_time = time.time()
+        response = requests.get(url, params=params, timeout=10)
+        elapsed = time.time() - start_time
+        
+        if response.status_code == 200:
+            data = response.json()
+            if data.get('code') == '0':
+                klines = data['data']
+                latest_close = float(klines[0][4])
+                print(f"✅ SUCCESS - BTC Price: ${latest_close:,.2f}")
+                print(f"   Response time: {elapsed:.2f}s")
+                print(f"   Data points: {len(klines)}")
+                return True
+        print(f"❌ FAILED - Status: {response.status_code}")
+        return False
+    except Exception as e:
+        print(f"❌ ERROR - {str(e)}")
+        return False
+
+def test_coingecko():
+    """Test CoinGecko API"""
+    print("\n🔍 Testing CoinGecko API...")
+    try:
+        url = "https://api.coingecko.com/api/v3/simple/price"
+        params = {
+            "ids": "bitcoin",
+            "vs_currencies": "usd"
+        }
+        
+        start_time = time.time()
+        response = requests.get(url, params=params, timeout=10)
+        elapsed = time.time() - start_time
+        
+        if response.status_code == 200:
+            data = response.json()
+            btc_price = data['bitcoin']['usd']
+            print(f"✅ SUCCESS - BTC Price: ${btc_price:,.2f}")
+            print(f"   Response time: {elapsed:.2f}s")
+            print(f"   ⚠️  Note: This is current price only, not OHLC data")
+            return True
+        else:
+            print(f"❌ FAILED - Status: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ ERROR - {str(e)}")
+        return False
+
+def start_stub_kline_server():
+    """Serve Binance-style kline JSON from a local keep-alive HTTP server"""
+    class KlineHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        
+        def do_GET(self):
+            query = parse_qs(urlsplit(self.path).query)
+            if query["symbol"][0] == "DELISTEDUSDT":
+                body = b'{"code":-1121,"msg":"Invalid symbol."}'
+                self.send_response(400)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            step = {"1m": 60_000, "5m": 300_000, "15m": 900_000, "1h": 3_600_000, "4h": 14_400_000}[query["interval"][0]]
+            limit = int(query.get("limit", ["500"])[0])
+            now = int(time.time() * 1000) // step * step
+            start = int(query["startTime"][0]) if "startTime" in query else now - (limit - 1) * step
+            
+            klines = []
+            for i in range(limit):
+                open_time = start + i * step
+                if open_time > now:
+                    break
+                price = 45000 + (open_time // step) % 500
+                klines.append([open_time, str(price), str(price + 50), str(price - 50), str(price + 10), "125.5",
+                               open_time + step - 1, "0", 100, "0", "0", "0"])
+            
+            body = json.dumps(klines).encode()
+            self.server.connections.add(self.client_address)
+            self.server.request_count += 1
+            self.server.requests.append({k: v[0] for k, v in query.items()})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KlineHandler)
+    server.connections = set()
+    server.request_count = 0
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def test_stub_market_data():
+    """Test pooled async market data client against a local stub server"""
+    print("\n🔍 Testing Market Data Client (local stub)...")
+    import asyncio
+    import os
+    import tempfile
+    import main
+    
+    server = start_stub_kline_server()
+    cache = main.OHLCV_CACHE
+    original = main.MARKET_ROUTER, main.MARKET_DB_PATH, cache.entries.copy(), cache.current_bytes
+    try:
+        main.MARKET_ROUTER = main.ProviderRouter([{
+            "name": "Local Stub",
+            "base_url": f"http://127.0.0.1:{server.server_address[1]}",
+            "pairs_endpoint": "/fapi/v1/exchangeInfo",
+            "klines_endpoint": "/fapi/v1/klines"
+        }])
+        main.MARKET_DB_PATH = os.path.join(tempfile.mkdtemp(), "market_data.db")
+        main.init_market_db()
+        cache.entries.clear()
+        cache.current_bytes = 0
+        
+        key = ("BTC/USDT", "1h", 100)
+        
+        async def run():
+            try:
+                first = await main.fetch_ohlcv(*key)
+                cached = await asyncio.gather(*[main.fetch_ohlcv(*key) for _ in range(10)])
+                # Candle closed: concurrent refetches share one tail request on the same pooled connection
+                df, _, size = cache.entries[key]
+                cache.entries[key] = (df, 0, size)
+                refetched = await asyncio.gather(*[main.fetch_ohlcv(*key) for _ in range(10)])
+                return [first] + list(cached) + list(refetched)
+            finally:
+                await main.close_market_client()
+        
+        start_time = time.time()
+        frames = asyncio.run(run())
+        elapsed = time.time() - start_time
+        
+        assert all(len(df) == 100 for df in frames), [len(df) for df in frames]
+        assert frames[-1]["close"].iloc[-1] > 0
+        assert server.request_count == 2, f"{server.request_count} upstream requests for 21 fetches"
+        assert len(server.connections) == 1, f"{len(server.connections)} connections opened"
+        assert "startTime" not in server.requests[0] and "startTime" in server.requests[1], server.requests
+        print(f"✅ SUCCESS - {len(frames)} fetches, {server.request_count} requests over {len(server.connections)} connection")
+        print(f"   Response time: {elapsed:.2f}s")
+    finally:
+        server.shutdown()
+        main.MARKET_ROUTER, main.MARKET_DB_PATH, cache.entries, cache.current_bytes = original
+
+def test_stub_incremental_tail():
+    """Test that a refetch after the cached candle expires asks the exchange only for the missing tail"""
+    print("\n🔍 Testing Incremental Tail Fetch (local stub)...")
+    import asyncio
+    import os
+    import tempfile
+    import main
+    
+    server = start_stub_kline_server()
+    cache = main.OHLCV_CACHE
+    original = main.MARKET_ROUTER, main.MARKET_DB_PATH, cache.entries.copy(), cache.current_bytes
+    try:
+        main.MARKET_ROUTER = main.ProviderRouter([{
+            "name": "Local Stub",
+            "base_url": f"http://127.0.0.1:{server.server_address[1]}",
+            "pairs_endpoint": "/fapi/v1/exchangeInfo",
+            "klines_endpoint": "/fapi/v1/klines"
+        }])
+        main.MARKET_DB_PATH = os.path.join(tempfile.mkdtemp(), "market_data.db")
+        main.init_market_db()
+        cache.entries.clear()
+        cache.current_bytes = 0
+        key = ("ETH/USDT", "1h", 100)
+        
+        async def run():
+            try:
+                first = await main.fetch_ohlcv(*key)
+                # Expire the cached frame as if the candle had closed
+                df, _, size = cache.entries[key]
+                cache.entries[key] = (df, 0, size)
+                second = await main.fetch_ohlcv(*key)
+                return first, second
+            finally:
+                await main.close_market_client()
+        
+        first, second = asyncio.run(run())
+        
+        assert first.attrs["source"] == "exchange" and second.attrs["source"] == "exchange", (first.attrs, second.attrs)
+        assert len(server.requests) == 2, server.requests
+        assert "startTime" not in server.requests[0]
+        assert int(server.requests[1]["startTime"]) == int(first["timestamp"].iloc[-1].timestamp() * 1000), server.requests[1]
+        assert len(second) == 100
+        print(f"✅ SUCCESS - refetch requested {server.requests[1]['limit']} candle(s) from startTime")
+    finally:
+        server.shutdown()
+        main.MARKET_ROUTER, main.MARKET_DB_PATH, cache.entries, cache.current_bytes = original
+
+def test_stub_batch_mock_source():
+    """Test that batch analysis reports each result's candle source and keeps mock-data pairs out of the ranking"""
+    print("\n🔍 Testing Batch Analysis Sources (local stub)...")
+    import os
+    import tempfile
+    from fastapi.testclient import TestClient
+    import main
+    
+    class RecordingWriter:
+        def __init__(self):
+            self.rows = []
+        
+        async def submit(self, rows):
+            self.rows.extend(rows)
+    
+    server = start_stub_kline_server()
+    cache = main.OHLCV_CACHE
+    original = (main.MARKET_ROUTER, main.MARKET_DB_PATH, main.HISTORY_WRITER, cache.entries.copy(), cache.current_bytes)
+    try:
+        main.MARKET_ROUTER = main.ProviderRouter([{
+            "name": "Local Stub",
+            "base_url": f"http://127.0.0.1:{server.server_address[1]}",
+            "pairs_endpoint": "/fapi/v1/exchangeInfo",
+            "klines_endpoint": "/fapi/v1/klines"
+        }])
+        main.MARKET_DB_PATH = os.path.join(tempfile.mkdtemp(), "market_data.db")
+        main.init_market_db()
+        main.HISTORY_WRITER = RecordingWriter()
+        main.app.dependency_overrides[main.check_subscription] = lambda: {"id": 1}
+        
+        # DELISTED/USDT is rejected upstream and has no stored candles, so it would be scored on mock data
+        response = TestClient(main.app).post("/api/trading/analyze/batch", json={
+            "pairs": ["BTC/USDT", "DELISTED/USDT"], "timeframes": ["1h"], "stream": True
+        })
+        assert response.status_code == 200, response.text
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        results = {line["pair"]: line for line in lines if line["type"] == "result"}
+        summary = lines[-1]
+        
+        assert results["BTC/USDT"]["source"] == "exchange", results["BTC/USDT"]
+        assert results["DELISTED/USDT"]["source"] == "mock" and "error" in results["DELISTED/USDT"], results["DELISTED/USDT"]
+        assert [r["pair"] for r in summary["ranked"]] == ["BTC/USDT"], summary["ranked"]
+        assert [r["pair"] for r in summary["errors"]] == ["DELISTED/USDT"], summary["errors"]
+        assert [row[1] for row in main.HISTORY_WRITER.rows] == ["BTC/USDT"], main.HISTORY_WRITER.rows
+        print("✅ SUCCESS - exchange pair ranked and saved, mock-data pair reported as an error")
+    finally:
+        server.shutdown()
+        main.app.dependency_overrides.pop(main.check_subscription, None)
+        main.MARKET_ROUTER, main.MARKET_DB_PATH, main.HISTORY_WRITER, cache.entries, cache.current_bytes = original
+
+def test_stub_history_backfill():
+    """Test that backfill pages sit on a fixed grid (shifted ranges reuse them) and a failed page raises"""
+    print("\n🔍 Testing History Backfill (local stub)...")
+    import asyncio
+    import os
+    import tempfile
+    from fastapi import HTTPException
+    import main
+    
+    server = start_stub_kline_server()
+    original = main.MARKET_ROUTER, main.MARKET_DB_PATH
+    try:
+        main.MARKET_ROUTER = main.ProviderRouter([{
+            "name": "Local Stub",
+            "base_url": f"http://127.0.0.1:{server.server_address[1]}",
+            "pairs_endpoint": "/fapi/v1/exchangeInfo",
+            "klines_endpoint": "/fapi/v1/klines"
+        }])
+        main.MARKET_DB_PATH = os.path.join(tempfile.mkdtemp(), "market_data.db")
+        main.init_market_db()
+        step = main.INTERVAL_MS["1h"]
+        page = main.MAX_KLINES_PER_REQUEST * step
+        day = 24 * step
+        now = int(time.time() * 1000) // step * step
+        
+        def date_string(ms):
+            return str(datetime.utcfromtimestamp(ms / 1000))
+        
+        async def load(start_ms, end_ms):
+            try:
+                return await main.load_history_frame("BTC/USDT", "1h", date_string(start_ms), date_string(end_ms))
+            finally:
+                await main.close_market_client()
+        
+        first = asyncio.run(load(now - 400 * day, now - 300 * day))
+        first_starts = {int(r["startTime"]) for r in server.requests}
+        # Overlapping range that starts at a different offset
+        second = asyncio.run(load(now - 380 * day + 7 * step, now - 280 * day))
+        second_starts = {int(r["startTime"]) for r in server.requests} - first_starts
+        
+        assert all(start % page == 0 for start in first_starts | second_starts), sorted(first_starts | second_starts)
+        assert len(server.requests) == len(first_starts | second_starts), "a completed window was downloaded again"
+        for df, start_ms, end_ms in ((first, now - 400 * day, now - 300 * day),
+                                     (second, now - 380 * day + 7 * step, now - 280 * day)):
+            open_times = df["timestamp"].values.astype("datetime64[ms]").astype("int64")
+            assert open_times[0] == start_ms and open_times[-1] == end_ms, (open_times[0], open_times[-1])
+            assert len(df) == (end_ms - start_ms) // step + 1, len(df)
+        
+        # With the exchange gone, a range needing a new page fails instead of returning a gap
+        server.shutdown()
+        server.server_close()
+        try:
+            asyncio.run(load(now - 300 * day, now - 200 * day))
+            raise AssertionError("backfill with an unreachable exchange returned data")
+        except HTTPException as e:
+            assert e.status_code == 502 and "Backfill failed" in e.detail, (e.status_code, e.detail)
+        print(f"✅ SUCCESS - {len(server.requests)} grid-aligned pages for two overlapping ranges, failed page raised")
+    finally:
+        server.shutdown()
+        main.MARKET_ROUTER, main.MARKET_DB_PATH = original
+
+def test_stub_kline_stream():
+    """Test live kline ingestion against a local WebSocket server replaying recorded candles"""
+    print("\n🔍 Testing Live Kline Stream (local stub)...")
+    import asyncio
+    import os
+    import tempfile
+    import websockets
+    import main
+    
+    server = start_stub_kline_server()
+    original = main.MARKET_ROUTER, main.MARKET_DB_PATH
+    try:
+        main.MARKET_ROUTER = main.ProviderRouter([{
+            "name": "Local Stub",
+            "base_url": f"http://127.0.0.1:{server.server_address[1]}",
+            "pairs_endpoint": "/fapi/v1/exchangeInfo",
+            "klines_endpoint": "/fapi/v1/klines"
+        }])
+        main.MARKET_DB_PATH = os.path.join(tempfile.mkdtemp(), "market_data.db")
+        main.init_market_db()
+        
+        # Recorded updates of the open 1m candle, ending with its close
+        current_open = int(time.time() * 1000) // 60_000 * 60_000
+        recorded = [("45010.5", False), ("45022.0", False), ("45018.25", True)]
+        
+        async def replay(ws):
+            for close, closed in recorded:
+                await ws.send(json.dumps({"stream": "btcusdt@kline_1m", "data": {"e": "kline", "s": "BTCUSDT", "k": {
+                    "t": current_open, "i": "1m", "o": "45000", "h": "45030", "l": "44990",
+                    "c": close, "v": "12.5", "x": closed
+                }}}))
+            await ws.wait_closed()
+        
+        async def run():
+            async with websockets.serve(replay, "127.0.0.1", 0) as ws_server:
+                port = list(ws_server.sockets)[0].getsockname()[1]
+                config = {**main.STREAM_CONFIG, "url": f"ws://127.0.0.1:{port}/stream",
+                          "pairs": ["BTC/USDT"], "timeframes": ["1m"], "capacity": 200}
+                task = asyncio.create_task(main.run_kline_stream(config))
+                try:
+                    for _ in range(50):
+                        await asyncio.sleep(0.1)
+                        df = main.get_live_ohlcv("BTC/USDT", "1m", 100)
+                        if df is not None and df["close"].iloc[-1] == 45018.25:
+                            break
+                    requests_before = server.request_count
+                    df = await main.fetch_ohlcv("BTC/USDT", "1m", 100)
+                    return df, server.request_count - requests_before
+                finally:
+                    task.cancel()
+                    await main.close_market_client()
+        
+        start_time = time.time()
+        df, upstream_requests = asyncio.run(run())
+        elapsed = time.time() - start_time
+        
+        assert df.attrs["source"] == "stream", df.attrs
+        assert len(df) == 100, len(df)
+        assert df["close"].iloc[-1] == 45018.25, f"last close {df['close'].iloc[-1]}"
+        assert upstream_requests == 0, f"{upstream_requests} upstream requests"
+        print(f"✅ SUCCESS - Live close: ${df['close'].iloc[-1]:,.2f} served from ring buffer")
+        print(f"   Response time: {elapsed:.2f}s")
+    finally:
+        server.shutdown()
+        main.MARKET_ROUTER, main.MARKET_DB_PATH = original
+        main.LIVE_BUFFERS.pop(("BTCUSDT", "1m"), None)
+        main.LIVE_INDICATORS.pop(("BTCUSDT", "1m"), None)
+
+def test_history_writer_group_commit():
+    """Test that the write-behind history writer commits a lone row within max_delay, without flush()"""
+    print("\n🔍 Testing History Writer (temporary database)...")
+    import asyncio
+    import os
+    import sqlite3
+    import tempfile
+    import main
+    
+    original_db_path = main.DB_PATH
+    workdir = tempfile.mkdtemp()
+    main.DB_PATH = os.path.join(workdir, "trading_dss.db")
+    writer = main.HistoryWriter(**{**main.HISTORY_WRITER_CONFIG, "max_delay": 0.2,
+                                   "spill_path": os.path.join(workdir, "failed.jsonl")})
+    try:
+        main.init_db()
+        row = main.analysis_history_row(1, "BTC/USDT", "1h", {"signal": "LONG", "confidence_score": 70})
+        for submitted in range(1, 4):
+            asyncio.run(writer.submit([row]))
+            time.sleep(writer.max_delay + 0.3)
+            with sqlite3.connect(main.DB_PATH) as conn:
+                committed = conn.execute("SELECT COUNT(*) FROM analysis_history").fetchone()[0]
+            assert committed == submitted, f"{committed} of {submitted} rows committed after max_delay"
+        assert writer.get_stats()["queue_depth"] == 0, writer.get_stats()
+        print(f"✅ SUCCESS - each row committed within {writer.max_delay}s, no flush() needed")
+    finally:
+        writer.stop()
+        main._db_pools.pop(main.DB_PATH).close()
+        main.DB_PATH = original_db_path
+
+def test_incremental_indicator_parity():
+    """Test that IndicatorState, fed appends and revisions of the open candle, matches batch IndicatorFrame"""
+    print("\n🔍 Testing Incremental Indicators (synthetic candles)...")
+    import numpy as np
+    import main
+    
+    limit = main.LIVE_ANALYSIS_LIMIT
+    df = main.generate_mock_data(limit + 200, seed=7)
+    open_times = df["timestamp"].values.astype("datetime64[ms]").astype(np.int64)
+    values = df[["open", "high", "low", "close", "volume"]].to_numpy()
+    rng = np.random.default_rng(7)
+    
+    state = main.IndicatorState()
+    checked = 0
+    for i in range(len(df)):
+        o, h, l, c, v = values[i]
+        # Two in-progress updates of the open candle, then its final values
+        for fraction in (0.3, 0.7):
+            partial = o + (c - o) * fraction + rng.normal(0, abs(c - o) + 1)
+            state.update(int(open_times[i]), o, max(h, partial), min(l, partial), partial, v * fraction)
+        state.update(int(open_times[i]), o, h, l, c, v)
+        if i + 1 < limit or (i + 1) % 50:
+            continue
+        
+        batch = main.IndicatorFrame.from_frame(df.iloc[i + 1 - limit:i + 1])
+        snapshot = state.snapshot()
+        history = np.array(state.history)
+        for j, name in enumerate(main.LiveIndicatorView.INDICATOR_SERIES):
+            expected = getattr(batch, name)
+            assert np.isclose(snapshot[name], expected[-1], rtol=1e-6, atol=1e-9), \
+                f"candle {i} {name}: incremental {snapshot[name]} != batch {expected[-1]}"
+            assert np.allclose(history[:, j], expected[-len(history) - 1:-1], rtol=1e-6, atol=1e-9), \
+                f"candle {i} {name}: history differs from batch"
+        assert np.isclose(snapshot["atr_mean"], batch.atr_mean, rtol=1e-6), \
+            f"candle {i} atr_mean: incremental {snapshot['atr_mean']} != batch {batch.atr_mean}"
+        checked += 1
+    assert checked == 5, f"only {checked} checkpoints compared"
+    print(f"✅ SUCCESS - incremental indicators match batch at {checked} checkpoints over {len(df)} candles")
+
+def test_live_indicator_rule_parity():
+    """Test that a registered rule reading OHLC history scores the same on live indicators as on IndicatorFrame"""
+    print("\n🔍 Testing Live Indicator Rule Parity (synthetic candles)...")
+    import numpy as np
+    import main
+    
+    rules, scorer, params = main.SCORING_RULES.copy(), main.SCORER, main.DEFAULT_STRATEGY_PARAMS.copy()
+    key = ("BTCUSDT", "1h")
+    buffers, states = main.LIVE_BUFFERS.get(key), main.LIVE_INDICATORS.get(key)
+    try:
+        @main.scoring_rule("breakout", ("high", "close"), 10, "Close Above 3-Bar High - BULLISH",
+                           "Close Below Close 3 Bars Ago - BEARISH", lookback=3)
+        def breakout_rule(s, params):
+            prior_high = np.fmax.reduce([main.shift_down(s["high"], n) for n in (1, 2, 3)])
+            long_mask = s["close"] > prior_high
+            return long_mask, ~long_mask & (s["close"] < main.shift_down(s["close"], 3))
+        
+        df = main.generate_mock_data(main.LIVE_ANALYSIS_LIMIT + 60)
+        buffer = main.CandleRingBuffer(main.LIVE_ANALYSIS_LIMIT, main.INTERVAL_MS["1h"])
+        buffer.load(df.iloc[:main.LIVE_ANALYSIS_LIMIT])
+        main.LIVE_BUFFERS[key] = buffer
+        main.LIVE_INDICATORS.pop(key, None)
+        main.sync_live_indicators(key, buffer)
+        
+        open_times = df["timestamp"].values.astype("datetime64[ms]").astype(np.int64)
+        values = df[["open", "high", "low", "close", "volume"]].to_numpy()
+        fired = 0
+        for i in range(main.LIVE_ANALYSIS_LIMIT, len(df) + 1):
+            if i > main.LIVE_ANALYSIS_LIMIT:
+                buffer.update(int(open_times[i - 1]), *values[i - 1])
+                main.sync_live_indicators(key, buffer)
+            window = df.iloc[i - main.LIVE_ANALYSIS_LIMIT:i].reset_index(drop=True)
+            live = main.get_live_indicators("BTC/USDT", "1h")
+            assert live is not None, f"live indicators unavailable at candle {i}"
+            batch = main.IndicatorFrame.from_frame(window)
+            results = [main.analyze_trading_signal(window, main.detect_market_condition(window, ind), ind)
+                       for ind in (live, batch)]
+            for field in ("signal", "long_score", "short_score", "signals"):
+                assert results[0][field] == results[1][field], f"candle {i} {field}: live {results[0][field]} != batch {results[1][field]}"
+            fired += any("3-Bar" in signal or "3 Bars" in signal for signal in results[1]["signals"])
+        assert fired, "breakout rule never fired; the comparison exercised nothing"
+        
+        # A rule looking further back than the live history falls back to IndicatorFrame
+        main.scoring_rule("deep", ("close",), 0, "", "", lookback=main.LIVE_SERIES_HISTORY + 1)(
+            lambda s, params: (s["close"] < 0, s["close"] < 0))
+        assert main.get_live_indicators("BTC/USDT", "1h") is None, "live view served a rule it lacks history for"
+        print(f"✅ SUCCESS - live and batch agree on {len(df) - main.LIVE_ANALYSIS_LIMIT + 1} candles (breakout fired {fired}x)")
+    finally:
+        main.SCORING_RULES.clear()
+        main.SCORING_RULES.update(rules)
+        main.SCORER = scorer
+        main.DEFAULT_STRATEGY_PARAMS.clear()
+        main.DEFAULT_STRATEGY_PARAMS.update(params)
+        for registry, saved in ((main.LIVE_BUFFERS, buffers), (main.LIVE_INDICATORS, states)):
+            if saved is None:
+                registry.pop(key, None)
+            else:
+                registry[key] = saved
+
+def baseline_backtest(df, initial_capital: float = 10000):
+    """The original per-bar backtest loop: re-analyze the candles up to each bar, then enter or exit"""
+    import main
+    
+    capital = initial_capital
+    position = None
+    trades = []
+    for i in range(main.BACKTEST_WARMUP, len(df)):
+        hist_df = df.iloc[:i + 1]
+        signal = main.analyze_trading_signal(hist_df, main.detect_market_condition(hist_df))
+        current_price = df["close"].iloc[i]
+        
+        if position is None:
+            if signal["signal"] in ("LONG", "SHORT") and signal["confidence_score"] >= 60:
+                position = {"type": signal["signal"], "entry_price": current_price, "entry_index": i,
+                            "stop_loss": signal["stop_loss"], "take_profit": signal["take_profit"]}
+            continue
+        
+        if position["type"] == "LONG":
+            if current_price >= position["take_profit"]:
+                exit_reason = "Take Profit"
+            elif current_price <= position["stop_loss"]:
+                exit_reason = "Stop Loss"
+            elif signal["signal"] == "SHORT":
+                exit_reason = "Signal Reversal"
+            else:
+                continue
+            pnl = (current_price - position["entry_price"]) / position["entry_price"]
+        else:
+            if current_price <= position["take_profit"]:
+                exit_reason = "Take Profit"
+            elif current_price >= position["stop_loss"]:
+                exit_reason = "Stop Loss"
+            elif signal["signal"] == "LONG":
+                exit_reason = "Signal Reversal"
+            else:
+                continue
+            pnl = (position["entry_price"] - current_price) / position["entry_price"]
+        
+        profit = capital * pnl * 0.95  # 5% for fees
+        capital += profit
+        trades.append((position["entry_index"], i, position["type"], exit_reason))
+        position = None
+    return trades, capital
+
+def test_vectorized_backtest_parity():
+    """Test that compute_signal_series + simulate_trades trade exactly like the per-bar backtest loop"""
+    print("\n🔍 Testing Vectorized Backtest (synthetic candles)...")
+    import numpy as np
+    import main
+    
+    total = 0
+    for seed in (1, 2, 3):
+        df = main.generate_mock_data(400, seed=seed)
+        expected_trades, expected_capital = baseline_backtest(df)
+        
+        ind = main.IndicatorFrame.from_frame(df)
+        scores = main.compute_signal_series(ind)
+        trades, _, capital = main.simulate_trades(
+            ind.close, ind.atr, scores["signal"], scores["confidence"], main.BACKTEST_WARMUP, 10000
+        )
+        actual_trades = [(t["entry_index"], t["exit_index"], t["type"], t["exit_reason"]) for t in trades]
+        assert actual_trades == expected_trades, f"seed {seed}: vectorized {actual_trades} != loop {expected_trades}"
+        assert np.isclose(capital, expected_capital, rtol=1e-9), f"seed {seed}: {capital} != {expected_capital}"
+        total += len(trades)
+    assert total, "no trades on any series; the comparison exercised nothing"
+    print(f"✅ SUCCESS - {total} trades and final capital match the per-bar loop on 3 series")
+
+def test_backend_api():
+    """Test our own backend API"""
+    print("\n🔍 Testing Backend API (Trading Pairs)...")
+    try:
+        url = "http://localhost:8000/api/trading/pairs"
+        
+        start_time = time.time()
+        response = requests.get(url, timeout=10)
+        elapsed = time.time() - start_time
+        
+        if response.status_code == 200:
+            data = response.json()
+            pairs = data.get('pairs', [])
+            print(f"✅ SUCCESS - {len(pairs)} pairs available")
+            print(f"   Response time: {elapsed:.2f}s")
+            print(f"   Sample pairs: {', '.join(pairs[:5])}")
+            return True
+        else:
+            print(f"❌ FAILED - Status: {response.status_code}")
+            print(f"   Make sure backend is running: python main.py")
+            return False
+    except requests.exceptions.ConnectionError:
+        print(f"❌ ERROR - Backend not running")
+        print(f"   Start backend: python main.py")
+        return False
+    except Exception as e:
+        print(f"❌ ERROR - {str(e)}")
+        return False
+
+def passed(check):
+    """Run a check for the summary; local checks assert (so pytest fails) instead of returning False"""
+    try:
+        return check() is not False
+    except AssertionError:
+        return False
+
+def main():
+    print("=" * 60)
+    print("🚀 Crypto API Testing Script")
+    print("=" * 60)
+    print(f"📅 Test Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    
+    results = {}
+    
+    # Test all APIs
+    results['Binance Futures'] = test_binance_futures()
+    time.sleep(1)  # Avoid rate limiting
+    
+    results['Binance Spot'] = test_binance_spot()
+    time.sleep(1)
+    
+    results['Bybit'] = test_bybit()
+    time.sleep(1)
+    
+    results['OKX'] = test_okx()
+    time.sleep(1)
+    
+    results['CoinGecko'] = test_coingecko()
+    time.sleep(1)
+    
+    results['Market Data Client'] = passed(test_stub_market_data)
+    results['Incremental Tail Fetch'] = passed(test_stub_incremental_tail)
+    results['Batch Analysis Sources'] = passed(test_stub_batch_mock_source)
+    results['History Backfill'] = passed(test_stub_history_backfill)
+    results['History Writer'] = passed(test_history_writer_group_commit)
+    results['Incremental Indicators'] = passed(test_incremental_indicator_parity)
+    results['Live Indicator Parity'] = passed(test_live_indicator_rule_parity)
+    results['Vectorized Backtest'] = passed(test_vectorized_backtest_parity)
+    results['Live Kline Stream'] = passed(test_stub_kline_stream)
+    
+    results['Backend'] = test_backend_api()
+    
+    # Summary
+    print("\n" + "=" * 60)
+    print("📊 SUMMARY")
+    print("=" * 60)
+    
+    working = sum(1 for v in results.values() if v)
+    total = len(results)
+    
+    for api, status in results.items():
+        status_icon = "✅" if status else "❌"
+        print(f"{status_icon} {api}: {'Working' if status else 'Failed'}")
+    
+    print("\n" + "=" * 60)
+    print(f"✅ Working: {working}/{total} APIs")
+    print(f"❌ Failed: {total - working}/{total} APIs")
+    print("=" * 60)
+    
+    if results.get('Binance Futures') or results.get('Binance Spot'):
+        print("\n✅ Your system should work! At least one API is accessible.")
+    else:
+        print("\n⚠️  Warning: Primary APIs are down!")
+        print("   System will use mock data for demo purposes.")
+    
+    if not results.get('Backend'):
+        print("\n❌ Backend is not running!")
+        print("   Start it with: python main.py")
+    
+    print("\n🎯 Recommended: Use Binance Futures API (fapi) - Most reliable!")
+    print("=" * 60)
+
+if __name__ == "__main__":
     main()
\ No newline at end of file